@@ -1,12 +1,13 @@
 import streamlit as st
-from modules.analyzer import render_audio_analyzer
-from modules.documents import render_doc_analyzer
-from modules.simulator import render_court_simulator
-from db import get_cases, get_case, delete_case
+from db import list_cases, search_cases, get_case, delete_case, list_transcripts
+from spool import current_session_id, get_spool
 
 # --- НАСТРОЙКИ СТРАНИЦЫ ---
 st.set_page_config(page_title="Legal OS Pro", page_icon="⚖️", layout="wide")
 
+# Сессия активна: её временные файлы и тексты не вытесняются как простаивающие
+get_spool().touch(current_session_id())
+
 st.markdown("""
 <style>
     h1 { color: #1E3A8A; font-family: 'Helvetica Neue', sans-serif; }
@@ -40,26 +41,116 @@ st.sidebar.divider()
 
 mode = st.sidebar.radio(
     "Навигация",
-    ["Анализатор Дела", "Анализ Документов", "Судебный Тренажер"]
+    ["Анализатор Дела", "Анализ Документов", "Судебный Тренажер", "Производительность"]
 )
 
 # --- ИСТОРИЯ ДЕЛ В САЙДБАРЕ ---
 st.sidebar.divider()
 st.sidebar.markdown("### История дел")
 
-cases = get_cases(limit=20)
-if cases:
-    for case in cases:
-        with st.sidebar.expander(f"{case['title']} ({case['created_at']})"):
-            st.markdown(f"**Модуль:** {case['module']}")
-            if st.button("Открыть", key=f"open_{case['id']}"):
-                st.session_state['viewed_case'] = case
-                st.rerun()
-            if st.button("Удалить", key=f"del_{case['id']}"):
-                delete_case(case['id'])
-                st.rerun()
+HISTORY_PAGE_SIZE = 20
+HISTORY_MODULES = ["Все", "Анализатор", "Документы", "Тренажер"]
+
+if 'history_cursors' not in st.session_state:
+    st.session_state.history_cursors = [None]
+if 'export_ids' not in st.session_state:
+    st.session_state.export_ids = set()
+
+
+def _reset_history_page():
+    st.session_state.history_cursors = [None]
+
+
+def _toggle_export(case_id):
+    if st.session_state[f"pick_{case_id}"]:
+        st.session_state.export_ids.add(case_id)
+    else:
+        st.session_state.export_ids.discard(case_id)
+
+
+def _render_case_entry(case, caption=None):
+    with st.sidebar.expander(f"{case['title']} ({case['created_at']})"):
+        st.markdown(f"**Модуль:** {case['module']}")
+        if caption:
+            st.markdown(caption)
+        st.checkbox(
+            "Добавить в архив", key=f"pick_{case['id']}",
+            value=case['id'] in st.session_state.export_ids,
+            on_change=_toggle_export, args=(case['id'],)
+        )
+        if st.button("Открыть", key=f"open_{case['id']}"):
+            st.session_state['viewed_case'] = get_case(case['id'])
+            st.rerun()
+        if st.button("Удалить", key=f"del_{case['id']}"):
+            delete_case(case['id'])
+            st.session_state.export_ids.discard(case['id'])
+            st.rerun()
+
+
+history_query = st.sidebar.text_input("Поиск по делам", key="history_query").strip()
+history_module = st.sidebar.selectbox(
+    "Модуль", HISTORY_MODULES, key="history_module", on_change=_reset_history_page
+)
+history_period = tuple(st.sidebar.date_input(
+    "Период", value=(), key="history_period", on_change=_reset_history_page
+))
+if history_query:
+    found = search_cases(history_query, limit=HISTORY_PAGE_SIZE)
+    for case in found:
+        _render_case_entry(case, caption=case['snippet'])
+    if not found:
+        st.sidebar.caption("Ничего не найдено.")
 else:
-    st.sidebar.caption("Пока нет сохранённых дел.")
+    cases = list_cases(
+        limit=HISTORY_PAGE_SIZE,
+        before_id=st.session_state.history_cursors[-1],
+        module=None if history_module == "Все" else history_module,
+        date_from=history_period[0] if history_period else None,
+        date_to=history_period[-1] if history_period else None
+    )
+    if cases:
+        for case in cases:
+            _render_case_entry(case)
+
+        col_prev, col_next = st.sidebar.columns(2)
+        if len(st.session_state.history_cursors) > 1 and col_prev.button("← Новее", key="history_prev"):
+            st.session_state.history_cursors.pop()
+            st.rerun()
+        if len(cases) == HISTORY_PAGE_SIZE and col_next.button("Старее →", key="history_next"):
+            st.session_state.history_cursors.append(cases[-1]['id'])
+            st.rerun()
+    else:
+        st.sidebar.caption("Пока нет сохранённых дел.")
+
+if st.session_state.export_ids:
+    from utils import export_cases_zip
+
+    selected = sorted(st.session_state.export_ids)
+    st.sidebar.download_button(
+        f"Скачать архив выбранных ({len(selected)})",
+        lambda: export_cases_zip(selected), "Legal_OS_cases.zip",
+        mime="application/zip", on_click="ignore", use_container_width=True
+    )
+    if st.sidebar.button("Сбросить выбор", key="export_clear"):
+        st.session_state.export_ids = set()
+        for name in [k for k in st.session_state if str(k).startswith("pick_")]:
+            del st.session_state[name]
+        st.rerun()
+
+with st.sidebar.expander("Расшифровки записей"):
+    transcripts = list_transcripts(limit=10)
+    for tr in transcripts:
+        preview = tr['content'][:60].replace("\n", " ")
+        if st.button(f"{tr['created_at']} • {preview}…", key=f"tr_{tr['id']}"):
+            st.session_state['viewed_case'] = {
+                'title': "Расшифровка записи",
+                'module': tr['module'],
+                'created_at': tr['created_at'],
+                'content': tr['content'],
+            }
+            st.rerun()
+    if not transcripts:
+        st.caption("Расшифровок пока нет.")
 
 st.sidebar.divider()
 st.sidebar.warning(
@@ -75,14 +166,24 @@ if 'viewed_case' in st.session_state and st.session_state.viewed_case:
     st.markdown(f"## {case['title']}")
     st.caption(f"Модуль: {case['module']} | Дата: {case['created_at']}")
     st.markdown(case['content'])
+    from utils import docx_download_button
+    docx_download_button("Скачать (.docx)", case['content'], case['title'], "Case.docx")
     if st.button("Закрыть"):
         del st.session_state['viewed_case']
         st.rerun()
 else:
     # --- ОСНОВНОЙ КОНТЕНТ ---
+    # Модули импортируются только для выбранного режима: зависимости остальных
+    # страниц (Gemini, парсеры документов) не замедляют первый показ
     if mode == "Анализатор Дела":
+        from modules.analyzer import render_audio_analyzer
         render_audio_analyzer()
     elif mode == "Анализ Документов":
+        from modules.documents import render_doc_analyzer
         render_doc_analyzer()
     elif mode == "Судебный Тренажер":
+        from modules.simulator import render_court_simulator
         render_court_simulator()
+    elif mode == "Производительность":
+        from modules.dashboard import render_performance_dashboard
+        render_performance_dashboard()
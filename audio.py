@@ -0,0 +1,247 @@
+import io
+import os
+import tempfile
+import wave
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Компактный формат для распознавания речи: моно, 16 кГц, 16 бит
+TARGET_RATE = 16000
+# Обработка блоками, чтобы не держать исходную запись целиком
+BLOCK_FRAMES = 1 << 16
+
+# Энергетический детектор речи
+FRAME_MS = 30
+SILENCE_DBFS = -45.0
+NOISE_MARGIN_DB = 8.0
+PAD_MS = 300
+
+# Длинные записи режутся на части по самому тихому месту перед границей
+MAX_SEGMENT_SECONDS = 15 * 60
+SPLIT_SEARCH_SECONDS = 20
+WAV_HEADER_BYTES = 44
+
+
+@dataclass
+class PreprocessResult:
+    """Результат подготовки записи: пути к временным файлам и экономия байтов."""
+    paths: list = field(default_factory=list)
+    original_bytes: int = 0
+    output_bytes: int = 0
+    original_seconds: float = 0.0
+    output_seconds: float = 0.0
+
+    @property
+    def bytes_saved(self):
+        return max(0, self.original_bytes - self.output_bytes)
+
+
+def _to_float(raw, sampwidth, channels):
+    """Декодирует PCM-кадры в float32 [-1, 1] и сводит каналы в моно."""
+    if sampwidth == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sampwidth == 2:
+        data = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif sampwidth == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        data = ints.astype(np.float32) / 8388608
+    elif sampwidth == 4:
+        data = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Неподдерживаемая разрядность WAV: {sampwidth * 8} бит")
+    if channels > 1:
+        data = data.reshape(-1, channels).mean(axis=1)
+    return data
+
+
+class _Resampler:
+    """Потоковый пересчёт частоты линейной интерполяцией с усредняющим фильтром."""
+
+    def __init__(self, src_rate, dst_rate):
+        self.step = src_rate / dst_rate
+        self.width = int(self.step) if self.step >= 2 else 1
+        self.pos = 0.0
+        self.offset = 0
+        self.raw_tail = np.zeros(0, dtype=np.float32)
+        self.prev = None
+
+    def feed(self, block):
+        if self.step == 1:
+            return block
+        if self.width > 1:
+            # Грубая защита от наложения спектров при понижении частоты
+            padded = np.concatenate([self.raw_tail, block])
+            kernel = np.ones(self.width, dtype=np.float32) / self.width
+            smoothed = np.convolve(padded, kernel, mode="same")[len(self.raw_tail):]
+            self.raw_tail = padded[-(self.width - 1):]
+        else:
+            smoothed = block
+        if self.prev is None:
+            x, base = smoothed, self.offset
+        else:
+            x, base = np.concatenate([self.prev, smoothed]), self.offset - 1
+        last = self.offset + len(block) - 1
+        self.prev = smoothed[-1:]
+        self.offset += len(block)
+        if self.pos > last:
+            return np.zeros(0, dtype=np.float32)
+        count = int((last - self.pos) // self.step) + 1
+        times = self.pos + self.step * np.arange(count)
+        self.pos += self.step * count
+        return np.interp(times - base, np.arange(len(x)), x).astype(np.float32)
+
+
+def _read_mono(source):
+    """Читает WAV блоками и возвращает моно-сигнал int16, его частоту и исходную длительность.
+
+    Частота понижается до TARGET_RATE; записи с меньшей частотой не повышаются.
+    """
+    with wave.open(source, "rb") as wav:
+        channels, sampwidth, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        if not rate:
+            raise ValueError("В WAV не указана частота дискретизации")
+        duration = wav.getnframes() / rate
+        out_rate = min(rate, TARGET_RATE)
+        resampler = _Resampler(rate, out_rate)
+        parts = []
+        while True:
+            raw = wav.readframes(BLOCK_FRAMES)
+            if not raw:
+                break
+            mono = resampler.feed(_to_float(raw, sampwidth, channels))
+            parts.append((np.clip(mono, -1, 1) * 32767).astype(np.int16))
+    samples = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int16)
+    return samples, out_rate, duration
+
+
+def _frame_dbfs(samples, rate):
+    frame = max(1, rate * FRAME_MS // 1000)
+    n = len(samples) // frame
+    if n == 0:
+        return np.zeros(0), frame
+    frames = samples[:n * frame].astype(np.float32).reshape(n, frame) / 32768
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6)), frame
+
+
+def trim_silence(samples, rate=TARGET_RATE):
+    """Обрезает тишину в начале и в конце записи по энергии кадров.
+
+    Пустой результат — только для записи, где ни один кадр не громче SILENCE_DBFS.
+    """
+    db, frame = _frame_dbfs(samples, rate)
+    if len(db) == 0:
+        return samples
+    if db.max() <= SILENCE_DBFS:
+        return samples[:0]
+    floor = np.percentile(db, 10)
+    # Запись без пауз (ровный тон, речь без перерывов): обрезать нечего
+    if db.max() - floor < NOISE_MARGIN_DB:
+        return samples
+    # Порог от уровня шума, но не выше абсолютного: в шумной записи без тишины
+    # 10-й перцентиль — это уже речь
+    threshold = max(SILENCE_DBFS, min(floor, SILENCE_DBFS) + NOISE_MARGIN_DB)
+    voiced = np.flatnonzero(db > threshold)
+    if len(voiced) == 0:
+        return samples
+    pad = rate * PAD_MS // 1000
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def split_segments(samples, rate=TARGET_RATE, max_seconds=MAX_SEGMENT_SECONDS):
+    """Режет длинную запись на части не длиннее max_seconds по паузам."""
+    limit = int(max_seconds * rate)
+    if len(samples) <= limit:
+        return [samples]
+    db, frame = _frame_dbfs(samples, rate)
+    search = int(SPLIT_SEARCH_SECONDS * rate) // frame
+    segments, start = [], 0
+    while len(samples) - start > limit:
+        hi = (start + limit) // frame
+        lo = max(start // frame + 1, hi - search)
+        cut = (lo + int(np.argmin(db[lo:hi]))) * frame if hi > lo else start + limit
+        segments.append(samples[start:cut])
+        start = cut
+    segments.append(samples[start:])
+    return segments
+
+
+def _write_temp_wav(samples, rate, tmp_dir, prefix):
+    with tempfile.NamedTemporaryFile(
+        prefix=prefix, suffix=".wav", dir=tmp_dir, delete=False
+    ) as f:
+        with wave.open(f, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(samples.tobytes())
+        return f.name
+
+
+def save_temp_file(data, suffix, tmp_dir=None, prefix="audio_"):
+    """Сохраняет байты в уникальный временный файл и возвращает путь."""
+    with tempfile.NamedTemporaryFile(prefix=prefix, suffix=suffix, dir=tmp_dir, delete=False) as f:
+        f.write(data)
+        return f.name
+
+
+def prepared_size(data, name="audio.wav", max_segment_seconds=MAX_SEGMENT_SECONDS):
+    """Верхняя оценка объёма файлов preprocess_audio по заголовку WAV — без декодирования.
+
+    WAV с низкой частотой или 8-битный после подготовки больше исходного; прочие
+    форматы сохраняются как есть.
+    """
+    ext = os.path.splitext(name.lower())[1] or ".wav"
+    if ext != ".wav":
+        return len(data)
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            channels, sampwidth, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.getnframes()
+    except (wave.Error, EOFError):
+        return len(data)
+    if not rate or not channels or not sampwidth:
+        return len(data)
+    # Число кадров в заголовке бывает неверным: больше, чем байтов в файле, не бывает
+    frames = min(frames, len(data) // (channels * sampwidth))
+    out_rate = min(rate, TARGET_RATE)
+    samples = frames * out_rate // rate + 1
+    # Части режутся не дальше SPLIT_SEARCH_SECONDS до границы; у каждой свой заголовок
+    segment = max(1, int((max_segment_seconds - SPLIT_SEARCH_SECONDS) * out_rate))
+    return samples * 2 + (samples // segment + 1) * WAV_HEADER_BYTES
+
+
+def preprocess_audio(data, name="audio.wav", tmp_dir=None, prefix="audio_",
+                     max_segment_seconds=MAX_SEGMENT_SECONDS):
+    """Готовит запись к загрузке: WAV сводится в моно 16 кГц, обрезается тишина,
+    длинные записи режутся на части. Прочие форматы сохраняются как есть.
+
+    Все файлы пишутся в уникальные временные файлы; удалять их — забота вызывающего.
+    Полностью беззвучная запись даёт пустой список путей.
+    """
+    result = PreprocessResult(original_bytes=len(data))
+    ext = os.path.splitext(name.lower())[1] or ".wav"
+    if ext == ".wav":
+        try:
+            samples, rate, result.original_seconds = _read_mono(io.BytesIO(data))
+        except (wave.Error, EOFError, ValueError):
+            samples = None
+        if samples is not None:
+            samples = trim_silence(samples, rate)
+            if len(samples) == 0:
+                return result
+            for segment in split_segments(samples, rate, max_seconds=max_segment_seconds):
+                path = _write_temp_wav(segment, rate, tmp_dir, prefix)
+                result.paths.append(path)
+                result.output_bytes += os.path.getsize(path)
+            result.output_seconds = len(samples) / rate
+            return result
+    path = save_temp_file(data, ext, tmp_dir, prefix)
+    result.paths.append(path)
+    result.output_bytes = len(data)
+    return result
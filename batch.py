@@ -0,0 +1,255 @@
+"""Пакетный анализ рисков договоров из каталога без интерфейса Streamlit.
+
+Файлы обрабатываются параллельно, результат по каждому файлу сохраняется в таблице
+batch_items: прерванный прогон продолжается с того же места при повторном запуске
+с теми же параметрами (или с тем же --run). Готовые отчёты попадают в историю дел.
+
+    python batch.py contracts/ --workers 4
+    python batch.py contracts/ --instruction "Защищаем интересы арендатора"
+    python batch.py contracts/ --fake --fake-latency 0.2 --db /tmp/batch.db
+    python batch.py --stats --run 3f2a9c1b0d4e
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+import db
+from cache import content_hash
+from chunking import estimate_tokens, split_for_budget
+from extraction import SUPPORTED_EXTENSIONS, ExtractionError, chunks_to_text, extract_many
+from jobs import job_key
+from llm_cache import CachedModel, ResponseCache
+from packing import pack_documents
+from ratelimit import GEMINI_RPM, GEMINI_TPM, PRIORITY_BACKGROUND, LimitedModel, configure_limiter
+from risk_analysis import CHUNK_TOKEN_BUDGET, analyze_chunked, build_analysis_prompt
+from telemetry import MODULE_TITLES, InstrumentedModel, percentile
+
+DEFAULT_MODEL = "models/gemini-2.5-flash"
+DEFAULT_INSTRUCTION = "Общий анализ рисков."
+MODULE = MODULE_TITLES["documents"]
+
+# Сколько файлов обрабатывается одновременно и сколько запросов к модели
+# может быть в работе сразу (блоки больших файлов тоже идут параллельно)
+BATCH_WORKERS = 4
+MAX_REQUESTS_IN_FLIGHT = 8
+
+# Квоты общей очереди с --fake: фейк отвечает без настоящих лимитов Gemini, и с
+# GEMINI_RPM/GEMINI_TPM прогон ждал бы в очереди, а не работал
+FAKE_RPM = 10 ** 9
+FAKE_TPM = 10 ** 12
+
+
+def find_files(root):
+    """Поддерживаемые файлы каталога (рекурсивно, без скрытых) — пути относительно root."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in filenames:
+            if not name.startswith(".") and name.lower().endswith(SUPPORTED_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return sorted(found)
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return content_hash(f.read())
+
+
+def make_model(model_name, api_key, use_cache):
+    """Модель для прогона: общая очередь с квотами и повторами, телеметрия и кэш ответов."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    model = InstrumentedModel(
+        LimitedModel(genai.GenerativeModel(model_name), PRIORITY_BACKGROUND), MODULE, model_name
+    )
+    if use_cache:
+        model = CachedModel(model, ResponseCache(), "documents", model_name)
+    return model
+
+
+def analyze_file(model, path, instr, budget, chunked, dedup=True):
+    """Извлекает текст файла и возвращает (отчёт, оценка входных токенов, сэкономлено токенов)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    name = os.path.basename(path)
+    chunks = extract_many([(name, data)])[0]
+    if isinstance(chunks, ExtractionError):
+        raise chunks
+    documents = [(name, chunks)]
+    packed = pack_documents(documents) if dedup else None
+    if chunked is None:
+        source = packed.documents if packed and packed.shorter else documents
+        chunked = sum(estimate_tokens(c.text) for _, doc in source for c in doc) > budget
+    if packed and chunked:
+        # Ссылки на §N из других блоков разрешаются внутри блока — это тоже входные токены
+        packed.count_chunked(budget, documents)
+    if packed and not packed.shorter:
+        packed = None
+    if packed:
+        documents, instr = packed.documents, packed.instruction(instr)
+        tokens, saved = packed.stats.tokens_after, packed.stats.saved_tokens
+    elif chunked:
+        # Те же части split_for_budget, по которым считается упакованный вариант
+        tokens, saved = sum(p.tokens for p in split_for_budget(documents, budget)), 0
+    else:
+        tokens, saved = sum(estimate_tokens(c.text) for c in chunks), 0
+    if chunked:
+        sources = packed.sources if packed is not None else None
+        return analyze_chunked(model, instr, documents, budget=budget, sources=sources), tokens, saved
+    prompt = build_analysis_prompt(instr, [(n, chunks_to_text(doc)) for n, doc in documents])
+    return model.generate_content(prompt).text, tokens, saved
+
+
+def process(model, run, root, rel, digest, instr, budget, chunked, dedup=True):
+    """Анализ одного файла с записью результата; возвращает строку batch_items."""
+    started = time.monotonic()
+    try:
+        report, tokens, saved = analyze_file(
+            model, os.path.join(root, rel), instr, budget, chunked, dedup
+        )
+    except Exception as e:
+        seconds = time.monotonic() - started
+        db.save_batch_item(run, rel, digest, "failed", seconds=seconds,
+                           error=f"{type(e).__name__}: {e}")
+        return {"path": rel, "status": "failed", "seconds": seconds,
+                "error": f"{type(e).__name__}: {e}"}
+    seconds = time.monotonic() - started
+    # Дело и отметка о готовности пишутся вместе: после сбоя файл не попадёт в историю дважды
+    with db.transaction():
+        case_id = db.save_case(f"Пакетный анализ: {rel}", MODULE, report)
+        db.save_batch_item(run, rel, digest, "done", case_id=case_id, seconds=seconds,
+                           input_tokens=tokens)
+    return {"path": rel, "status": "done", "seconds": seconds, "case_id": case_id,
+            "input_tokens": tokens, "saved_tokens": saved}
+
+
+def print_stats(items, wall=None):
+    done = [i for i in items if i["status"] == "done"]
+    failed = [i for i in items if i["status"] == "failed"]
+    line = f"Готово: {len(done)}, ошибок: {len(failed)}"
+    if wall:
+        line += f" за {wall:.1f} с — {len(done) / wall * 60:.1f} файлов/мин"
+    print(line)
+    latencies = [i["seconds"] for i in done]
+    if latencies:
+        print(f"Время на файл: p50 {percentile(latencies, 0.5):.1f} с, "
+              f"p95 {percentile(latencies, 0.95):.1f} с, макс {max(latencies):.1f} с")
+    tokens = sum(i.get("input_tokens") or 0 for i in done)
+    saved = sum(i.get("saved_tokens") or 0 for i in done)
+    if tokens:
+        line = f"Входных токенов (оценка): {tokens}"
+        if saved:
+            line += f", сэкономлено на повторах: {saved}"
+        print(line)
+    for i in failed:
+        print(f"  ошибка: {i['path']}: {i['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", nargs="?", help="каталог с договорами")
+    parser.add_argument("--instruction", default=DEFAULT_INSTRUCTION,
+                        help="чьи интересы защищаем и на что смотреть")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="сколько файлов обрабатывать одновременно")
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS_IN_FLIGHT,
+                        help="сколько запросов к модели может идти одновременно")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help=f"квота запросов в минуту (по умолчанию {GEMINI_RPM}, с --fake — без квоты)")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help=f"квота токенов в минуту (по умолчанию {GEMINI_TPM}, с --fake — без квоты)")
+    parser.add_argument("--chunked", choices=["auto", "on", "off"], default="auto",
+                        help="поблочный анализ: auto — для файлов больше --budget токенов")
+    parser.add_argument("--budget", type=int, default=CHUNK_TOKEN_BUDGET, help="токенов на блок")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--run", help="ID прогона (по умолчанию — хэш каталога и параметров)")
+    parser.add_argument("--db", help="путь к базе вместо legal_os.db")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш ответов")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="не сжимать повторяющиеся фрагменты внутри файла")
+    parser.add_argument("--stats", action="store_true", help="показать сводку прогона --run и выйти")
+    parser.add_argument("--fake", action="store_true", help="локальная модель-фейк вместо Gemini")
+    parser.add_argument("--fake-latency", type=float, default=0.2)
+    parser.add_argument("--fake-failure-rate", type=float, default=0.0)
+    parser.add_argument("--fake-rpm", type=int, default=0, help="квота запросов фейка в минуту")
+    args = parser.parse_args()
+
+    if args.db:
+        db.DB_PATH = os.path.abspath(args.db)
+    if args.stats:
+        if not args.run:
+            parser.error("для --stats нужен --run")
+        print_stats(db.list_batch_items(args.run))
+        return 0
+    if not args.root or not os.path.isdir(args.root):
+        parser.error("укажите существующий каталог с договорами")
+
+    root = os.path.abspath(args.root)
+    chunked = {"auto": None, "on": True, "off": False}[args.chunked]
+    run = args.run or job_key(
+        "batch", root, args.instruction, args.chunked, args.budget, args.model, not args.no_dedup
+    )[:12]
+
+    load_dotenv()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if args.fake:
+        import fake_genai
+        fake_genai.install(fake_genai.FakeConfig(
+            latency=args.fake_latency, failure_rate=args.fake_failure_rate,
+            rpm_quota=args.fake_rpm
+        ))
+        api_key = "fake-key"
+    elif not api_key:
+        parser.error("API-ключ не найден. Создайте файл .env с GOOGLE_API_KEY=ваш_ключ")
+    # С --fake квоты действуют, только если заданы явно
+    default_rpm, default_tpm = (FAKE_RPM, FAKE_TPM) if args.fake else (GEMINI_RPM, GEMINI_TPM)
+    configure_limiter(
+        rpm=args.rpm if args.rpm is not None else default_rpm,
+        tpm=args.tpm if args.tpm is not None else default_tpm,
+        max_concurrent=args.max_requests
+    )
+    # Ответы фейка не должны попадать в общий кэш ответов
+    model = make_model(args.model, api_key, not (args.no_cache or args.fake))
+
+    files = find_files(root)
+    finished = {i["path"]: i["file_hash"] for i in db.list_batch_items(run) if i["status"] == "done"}
+    todo = []
+    for rel in files:
+        digest = file_hash(os.path.join(root, rel))
+        if finished.get(rel) != digest:
+            todo.append((rel, digest))
+    print(f"Прогон {run}: файлов {len(files)}, уже готово {len(files) - len(todo)}, "
+          f"к обработке {len(todo)}")
+
+    results = []
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    try:
+        futures = [
+            pool.submit(process, model, run, root, rel, digest, args.instruction,
+                        args.budget, chunked, not args.no_dedup)
+            for rel, digest in todo
+        ]
+        for n, future in enumerate(as_completed(futures), 1):
+            item = future.result()
+            results.append(item)
+            mark = "ок" if item["status"] == "done" else "ошибка"
+            print(f"[{n}/{len(todo)}] {mark:6} {item['path']} — {item['seconds']:.1f} с", flush=True)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print(f"\nПрервано. Чтобы продолжить прогон {run}, запустите ту же команду ещё раз.")
+        print_stats(results, time.monotonic() - started)
+        return 130
+    pool.shutdown()
+
+    print_stats(results, time.monotonic() - started)
+    return 1 if any(i["status"] == "failed" for i in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Сравнение пропускной способности db.py с соединением на каждый вызов.
+
+Запуск: python benchmarks/bench_db.py --threads 8 --ops 300
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+REPORT = "Отчёт по делу. " * 200
+
+
+class PerCallBackend:
+    """Прежняя схема: connect / execute / commit / close на каждую операцию."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cases (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                module TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def save_case(self, title, module, content):
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "INSERT INTO cases (title, module, content, created_at) VALUES (?, ?, ?, ?)",
+            (title, module, content, datetime.now().strftime("%Y-%m-%d %H:%M"))
+        )
+        conn.commit()
+        conn.close()
+
+    def get_cases(self, limit=50):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM cases ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        conn.close()
+        return [dict(r) for r in rows]
+
+
+class PooledBackend:
+    """Новый слой db.py: соединение на поток, WAL, busy_timeout."""
+
+    def __init__(self, path):
+        db.DB_PATH = path
+        db.init_db()
+
+    def save_case(self, title, module, content):
+        db.save_case(title, module, content)
+
+    def get_cases(self, limit=50):
+        return db.get_cases(limit=limit)
+
+
+def run(backend, threads, ops, write_ratio):
+    errors = []
+    barrier = threading.Barrier(threads)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(ops):
+            try:
+                if (i * 97 + n) % 100 < write_ratio * 100:
+                    backend.save_case(f"Дело {n}-{i}", "Документы", REPORT)
+                else:
+                    backend.get_cases(limit=20)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+        if isinstance(backend, PooledBackend):
+            db.close_connection()
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return threads * ops / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=300, help="операций на поток")
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, cls in (("per-call", PerCallBackend), ("pooled+WAL", PooledBackend)):
+            backend = cls(os.path.join(tmp, f"{name.replace('+', '_')}.db"))
+            throughput, errors = run(backend, args.threads, args.ops, args.write_ratio)
+            print(f"{name:12} {throughput:10.0f} оп/с  ошибок блокировки: {errors}")
+
+
+if __name__ == "__main__":
+    main()
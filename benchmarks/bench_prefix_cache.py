@@ -0,0 +1,88 @@
+"""Кэш контекста в тренажёре: задержка хода и токены на входе с кэшем и без.
+
+Фейк Gemini читает вход без кэша со скоростью --prefill токенов в секунду, а
+префикс из кэша — мгновенно, как сервер, у которого он уже обработан. Одно и то
+же заседание прогоняется дважды: неизменное начало промптов текстом в каждом
+ходе и в кэше контекста. Для кэша проверяется, что он создан один раз, каждый
+ход и разбор пошли через него и в конце он удалён.
+
+Запуск: python benchmarks/bench_prefix_cache.py --turns 8 --prefill 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), HERE]
+
+import fake_genai  # noqa: E402
+from bench_suite import Environment, run_hearing  # noqa: E402
+from extraction import iter_chunks  # noqa: E402
+from telemetry import percentile  # noqa: E402
+
+PARAGRAPH = (
+    "{n}. Истец ТОО «Арман» требует взыскать с ответчика ТОО «Береке» сумму основного долга "
+    "{amount} тенге по договору поставки № {n}-П, неустойку за {days} дней просрочки и судебные "
+    "расходы. Предмет спора — оплата товара, поставленного по накладной № {n}/{days}. Ответчик "
+    "ссылается на ненадлежащее качество товара и пропуск срока претензии."
+)
+
+
+def case_documents(paragraphs):
+    """Иск, договор и переписка — разные тексты с общими терминами спора."""
+    docs = []
+    for d, name in enumerate(["Исковое_заявление.txt", "Договор_поставки.txt", "Переписка.txt"]):
+        text = "\n\n".join(
+            PARAGRAPH.format(n=d * 1000 + i, amount=150000 + 3700 * i + d, days=5 + (i * 7 + d) % 90)
+            for i in range(paragraphs)
+        )
+        docs.append((name, list(iter_chunks(name, text.encode("utf-8")))))
+    return docs
+
+
+def report(title, turns):
+    seconds = [t["seconds"] for t in turns]
+    sent = sum(t["input_tokens"] - t["cached_tokens"] for t in turns)
+    cached = sum(t["cached_tokens"] for t in turns)
+    print(f"{title}:")
+    print(f"  ход: p50 {percentile(seconds, 0.5) * 1000:6.0f} мс, "
+          f"p95 {percentile(seconds, 0.95) * 1000:6.0f} мс")
+    print(f"  токенов на входе за {len(turns)} ходов: отправлено {sent}, из кэша {cached}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--paragraphs", type=int, default=300, help="абзацев в каждом из трёх файлов")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--prefill", type=float, default=20000,
+                        help="скорость чтения входа без кэша, токенов/с")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = Environment(tmp, fake_genai.FakeConfig(
+            latency=args.latency, output_tokens=300, tokens_per_second=4000,
+            prefill_tokens_per_second=args.prefill
+        ))
+        docs = case_documents(args.paragraphs)
+        backend = env.backend
+
+        backend.reset_counters()
+        report("Префикс текстом", run_hearing(env, docs, args.turns, cache_prefix=False))
+
+        backend.reset_counters()
+        report("Префикс в кэше контекста", run_hearing(env, docs, args.turns, cache_prefix=True))
+        counters = backend.counters()
+        # Открытие, каждый ход и разбор
+        expected = args.turns + 2
+        print(f"  кэшей создано {counters['caches_created']}, удалено {counters['caches_deleted']}, "
+              f"запросов через кэш {counters['cache_hits']} из {expected}")
+        ok = (counters["caches_created"] == 1 and counters["caches_deleted"] == 1
+              and counters["cache_hits"] == expected and not backend.caches)
+        print("Кэш переиспользуется: да" if ok else "Кэш переиспользуется: НЕТ")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Очередь к Gemini под квотой: ошибки 429, повторы и задержка по приоритетам.
+
+Фейк Gemini отклоняет запросы сверх --quota за окно --window секунд. Фоновые
+запросы (блоки анализа документов) идут пачкой из нескольких потоков, реплики
+тренажёра — по одной, как от пользователя. Сравниваются прямые вызовы, общая
+очередь без приоритетов и с приоритетами; в конце — серия сбоев и размыкатель.
+
+Запуск: python benchmarks/bench_ratelimit.py --background 120 --interactive 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_genai  # noqa: E402
+from ratelimit import (  # noqa: E402
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, CircuitBreaker,
+    CircuitOpenError, LimitedModel, Limiter
+)
+from telemetry import percentile  # noqa: E402
+
+PROMPT = "Фрагмент договора: стороны, сроки, неустойка. " * 20
+
+
+def run_mix(model_for, args):
+    """Фоновая пачка и последовательные реплики; возвращает задержки и число ошибок."""
+    latencies = {"background": [], "interactive": []}
+    errors = []
+    lock = threading.Lock()
+
+    def call(kind, n):
+        started = time.monotonic()
+        try:
+            model_for(kind).generate_content(f"{PROMPT} {kind} {n}")
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+            return
+        with lock:
+            latencies[kind].append(time.monotonic() - started)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for n in range(args.background):
+            pool.submit(call, "background", n)
+        time.sleep(args.window / 4)
+        for n in range(args.interactive):
+            call("interactive", n)
+    return latencies, errors, time.monotonic() - started
+
+
+def report(title, latencies, errors, wall, backend, limiter=None):
+    print(f"{title}:")
+    for kind, values in latencies.items():
+        if values:
+            print(f"  {kind:12} готово {len(values):3}  p50 {percentile(values, 0.5) * 1000:7.0f} мс"
+                  f"  p95 {percentile(values, 0.95) * 1000:7.0f} мс  макс {max(values) * 1000:7.0f} мс")
+    counters = backend.counters()
+    line = f"  ошибок квоты у Gemini {counters['quota_errors']}, не выполнено {len(errors)}"
+    if limiter is not None:
+        line += f", повторов {limiter.retries}"
+    print(f"{line}, всего {wall:.1f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--background", type=int, default=120)
+    parser.add_argument("--interactive", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--quota", type=int, default=20, help="запросов за окно квоты")
+    parser.add_argument("--window", type=float, default=1.0, help="окно квоты, с")
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    backend = fake_genai.install(fake_genai.FakeConfig(
+        latency=args.latency, output_tokens=100, tokens_per_second=5000,
+        rpm_quota=args.quota, quota_window=args.window
+    ))
+    import google.generativeai as genai
+    raw = genai.GenerativeModel("models/fake")
+    # Квота фейка в пересчёте на минуту; очередь держится чуть ниже неё
+    rpm = int(args.quota * 60 / args.window * 0.9)
+
+    def limiter():
+        time.sleep(args.window)  # окно квоты фейка освобождается от прошлого сценария
+        backend.reset_counters()
+        return Limiter(rpm=rpm, tpm=10 ** 9, max_concurrent=args.threads, base_delay=0.05,
+                       max_delay=args.window, burst_seconds=args.window / 10)
+
+    backend.reset_counters()
+    report("Без очереди", *run_mix(lambda kind: raw, args), backend)
+
+    shared = limiter()
+    flat = LimitedModel(raw, PRIORITY_NORMAL, shared)
+    report("Очередь без приоритетов", *run_mix(lambda kind: flat, args), backend, shared)
+
+    shared = limiter()
+    models = {
+        "background": LimitedModel(raw, PRIORITY_BACKGROUND, shared),
+        "interactive": LimitedModel(raw, PRIORITY_INTERACTIVE, shared),
+    }
+    report("Очередь с приоритетами", *run_mix(models.get, args), backend, shared)
+
+    backend.config.failure_rate = 1.0
+    shared = Limiter(rpm=rpm, attempts=2, base_delay=0.01,
+                     breaker=CircuitBreaker(threshold=5, reset_seconds=60))
+    model = LimitedModel(raw, PRIORITY_NORMAL, shared)
+    backend.reset_counters()
+    rejected = 0
+    for n in range(20):
+        try:
+            model.generate_content(f"{PROMPT} {n}")
+        except CircuitOpenError:
+            rejected += 1
+        except Exception:
+            pass
+    print(f"Gemini недоступен: 20 запросов, до Gemini дошло {backend.counters()['calls']}, "
+          f"отклонено размыкателем {rejected}")
+
+
+if __name__ == "__main__":
+    main()
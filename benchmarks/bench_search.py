@@ -0,0 +1,73 @@
+"""Скорость полнотекстового поиска db.search_cases на синтетическом корпусе.
+
+Запуск: python benchmarks/bench_search.py --cases 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+VOCABULARY = (
+    "договор займа истец ответчик суд решение иск взыскание неустойка аренда "
+    "помещение расписка свидетель доверенность претензия срок исковой давности "
+    "пеня штраф убытки компенсация моральный вред трудовой спор увольнение "
+    "алименты раздел имущества наследство завещание нотариус апелляция кассация "
+    "қарыз шарты талапкер жауапкер сот шешімі мүлік мұра келісім"
+).split()
+MODULES = ["Анализатор", "Документы", "Тренажер"]
+# Частые термины встречаются в большей части корпуса — худший случай для индекса;
+# номер дела — типичный избирательный запрос
+QUERIES = ["договор займа", "неустойка", "исковой давности", "раздел имущества",
+           "қарыз шарты", "апелляция", "моральный вред компенсация", "завещание нотариус",
+           "№ 4242", "№ 77777 займа"]
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def build_corpus(n, batch=5000, seed=1):
+    rng = random.Random(seed)
+    for start in range(0, n, batch):
+        db.save_cases([
+            (f"Дело № {start + i} {_text(rng, 3)}", rng.choice(MODULES), _text(rng, 300))
+            for i in range(min(batch, n - start))
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20, help="повторов каждого запроса")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "search.db")
+        db.init_db()
+
+        started = time.perf_counter()
+        build_corpus(args.cases)
+        print(f"Корпус: {args.cases} дел за {time.perf_counter() - started:.1f} с")
+
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                results = db.search_cases(query, limit=20)
+                timings.append((time.perf_counter() - t) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{query:28} найдено {len(results):2}  "
+                  f"p50 {statistics.median(timings):7.2f} мс  p95 {p95:7.2f} мс")
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Время холодного старта: импорт модулей страниц и первая отрисовка app.py.
+
+Каждый замер идёт в отдельном процессе, чтобы импорты не кэшировались между ними.
+Для сравнения с другой версией укажите путь к её копии (например, git worktree):
+
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --repo /tmp/legal_os_old
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = ["modules.analyzer", "modules.documents", "modules.simulator", "modules.dashboard"]
+MODES = ["Анализатор Дела", "Анализ Документов", "Судебный Тренажер", "Производительность"]
+# Тяжёлые зависимости, которые не должны грузиться без нужды
+HEAVY = ["google.generativeai", "docx", "PyPDF2", "numpy"]
+
+PROBE = r"""
+import importlib, json, os, sys, tempfile, time
+repo, kind, target, heavy = sys.argv[1], sys.argv[2], sys.argv[3], json.loads(sys.argv[4])
+sys.path.insert(0, repo)
+os.chdir(repo)
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+import streamlit
+from streamlit.testing.v1 import AppTest
+import db
+db.DB_PATH = os.path.join(tempfile.mkdtemp(), "startup.db")
+result = {}
+if kind == "import":
+    started = time.perf_counter()
+    importlib.import_module(target)
+    result["seconds"] = time.perf_counter() - started
+else:
+    at = AppTest.from_file(os.path.join(repo, "app.py"), default_timeout=120)
+    started = time.perf_counter()
+    at.run()
+    result["first_render"] = time.perf_counter() - started
+    radio = at.sidebar.radio[0]
+    if target != radio.value:
+        started = time.perf_counter()
+        radio.set_value(target).run()
+        result["open_mode"] = time.perf_counter() - started
+    result["errors"] = [str(e.value) for e in at.exception]
+result["heavy"] = [m for m in heavy if m in sys.modules]
+print(json.dumps(result))
+"""
+
+
+def probe(repo, kind, target):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, repo, kind, target, json.dumps(HEAVY)],
+        capture_output=True, text=True, cwd=repo
+    )
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr else "ошибка замера")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def median_of(runs, key):
+    values = [r[key] for r in runs if key in r]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repo", default=ROOT, help="каталог проверяемой версии приложения")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    repo = os.path.abspath(args.repo)
+
+    print("Импорт модуля страницы (после streamlit):")
+    for page in PAGES:
+        if not os.path.exists(os.path.join(repo, *page.split(".")) + ".py"):
+            continue
+        runs = [probe(repo, "import", page) for _ in range(args.repeat)]
+        print(f"  {page:20} {median_of(runs, 'seconds') * 1000:8.0f} мс  "
+              f"загружены: {', '.join(runs[-1]['heavy']) or '—'}")
+
+    print("Первая отрисовка app.py и открытие режима:")
+    for mode in MODES:
+        try:
+            runs = [probe(repo, "render", mode) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"  {mode:20} не удалось: {e}")
+            continue
+        opened = median_of(runs, "open_mode")
+        errors = runs[-1]["errors"]
+        print(f"  {mode:20} первая отрисовка {median_of(runs, 'first_render') * 1000:7.0f} мс  "
+              f"открытие {'—' if opened is None else f'{opened * 1000:.0f} мс':>8}  "
+              f"загружены: {', '.join(runs[-1]['heavy']) or '—'}"
+              + (f"  ошибка: {errors[0]}" if errors else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+"""Замеры основных путей приложения без сети и без интерфейса Streamlit.
+
+Gemini подменяется локальным фейком (fake_genai.py) с настраиваемой задержкой,
+размером ответа и долей ошибок. Результаты пишутся в JSON; режим --compare
+сравнивает два прогона и отмечает замедления.
+
+Запуск:
+    python benchmarks/bench_suite.py --out bench_before.json
+    python benchmarks/bench_suite.py --only e2e --latency 0.2 --out bench_after.json
+    python benchmarks/bench_suite.py --compare bench_before.json bench_after.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fake_genai  # noqa: E402
+
+DEFAULT_THRESHOLD = 0.15
+# Изменения меньше этого (в секундах) не считаются значимыми при любом проценте
+MIN_SIGNIFICANT_DELTA = 0.002
+# Квоты общей очереди к Gemini в замерах: фейк отвечает за миллисекунды, и с
+# настоящими RPM/TPM замеры мерили бы ожидание в очереди, а не код
+UNLIMITED_RPM = 10 ** 9
+UNLIMITED_TPM = 10 ** 12
+
+CLAUSE = (
+    "Clause {n}. The Borrower shall repay the loan of {amount} tenge no later than "
+    "{day:02d}.{month:02d}.2024. In case of delay a penalty of 0.5 percent per day applies."
+)
+REPORT_LINE = "Риск {n}: пункт {n} договора не содержит срока исполнения обязательства. "
+
+
+class Upload(io.BytesIO):
+    """Аналог UploadedFile из Streamlit: байты и имя."""
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def _clause(n):
+    return CLAUSE.format(n=n, amount=100000 + n * 37, day=n % 28 + 1, month=n % 12 + 1)
+
+
+def make_pdf(pages, lines_per_page=45):
+    """Минимальный PDF с текстовым слоем (шрифт Helvetica, латиница)."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for p in range(pages):
+        lines = [_clause(p * lines_per_page + i)[:95] for i in range(lines_per_page)]
+        body = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        content_id, page_id = 4 + 2 * p, 5 + 2 * p
+        data = body.encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = out.tell()
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (num, objects[num]))
+    xref = out.tell()
+    size = max(objects) + 1
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+    for num in range(1, size):
+        out.write(b"%010d 00000 n \n" % offsets[num])
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+    return out.getvalue()
+
+
+def make_docx(paragraphs, table_rows=0):
+    """DOCX с абзацами и, по желанию, таблицей."""
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading("Договор займа", 0)
+    for n in range(paragraphs):
+        doc.add_paragraph(_clause(n))
+    if table_rows:
+        table = doc.add_table(rows=table_rows, cols=3)
+        for i, row in enumerate(table.rows):
+            row.cells[0].text = f"{i + 1}"
+            row.cells[1].text = f"Платёж {i + 1}"
+            row.cells[2].text = f"{(i + 1) * 12500} тенге"
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def make_wav(seconds, rate=44100, speech_share=0.7, seed=0):
+    """Стерео-запись: «речь» (тон с шумом) в середине, тишина по краям."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    t = np.arange(n) / rate
+    signal = 0.3 * np.sin(2 * math.pi * 220 * t) + 0.05 * rng.standard_normal(n)
+    quiet = int(n * (1 - speech_share) / 2)
+    signal[:quiet] = 0.001 * rng.standard_normal(quiet)
+    signal[n - quiet:] = 0.001 * rng.standard_normal(quiet)
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    stereo = np.repeat(pcm[:, None], 2, axis=1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(stereo.tobytes())
+    return buffer.getvalue()
+
+
+def _report(kb):
+    text, n = [], 0
+    while sum(len(s) for s in text) < kb * 1024:
+        n += 1
+        text.append(REPORT_LINE.format(n=n))
+    return "".join(text)
+
+
+class Environment:
+    """Временная база, фейковый Gemini и загруженные модули приложения."""
+
+    def __init__(self, tmp, config, limited=False):
+        os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+        self.tmp = tmp
+        self.backend = fake_genai.install(config)
+
+        from ratelimit import configure_limiter
+        if not limited:
+            configure_limiter(rpm=UNLIMITED_RPM, tpm=UNLIMITED_TPM)
+
+        import db
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        self.db = db
+
+        import utils
+        import jobs
+        from modules import analyzer, documents, simulator
+        self.utils, self.jobs = utils, jobs
+        self.analyzer, self.documents, self.simulator = analyzer, documents, simulator
+
+    def job_context(self, kind):
+        """Контекст задачи на новой записи в таблице jobs, как у JobRunner."""
+        job_id, _ = self.db.claim_job(kind, f"bench-{time.perf_counter_ns()}")
+        return self.jobs.JobContext(job_id)
+
+
+# Каждый замер получает Environment и возвращает (функция прогона, описание входа).
+# Быстрые замеры указывают в описании loops — сколько раз выполнить функцию за прогон.
+
+def bench_extract_pdf_small(env):
+    data = make_pdf(20)
+    return lambda: env.utils.extract_text_from_file(Upload("contract.pdf", data)), {
+        "pages": 20, "bytes": len(data)}
+
+
+def bench_extract_pdf_large(env):
+    data = make_pdf(300)
+    return lambda: env.utils.extract_text_from_file(Upload("bundle.pdf", data)), {
+        "pages": 300, "bytes": len(data)}
+
+
+def bench_extract_docx(env):
+    data = make_docx(2000, table_rows=200)
+    return lambda: env.utils.extract_text_from_file(Upload("contract.docx", data)), {
+        "paragraphs": 2000, "table_rows": 200, "bytes": len(data)}
+
+
+def bench_create_docx(env):
+    report = _report(50)
+    return lambda: env.utils.create_docx(report, "Анализ"), {"chars": len(report)}
+
+
+def bench_db_crud(env):
+    db = env.db
+    report = _report(8)
+
+    def run():
+        ids = [db.save_case(f"Дело № {i}", "Документы", report) for i in range(200)]
+        before = None
+        for _ in range(10):
+            page = db.list_cases(limit=20, before_id=before)
+            before = page[-1]["id"] if page else None
+        for case_id in ids[::4]:
+            db.get_case(case_id)
+        for query in ("пункт договора", "срока исполнения", "№ 42"):
+            db.search_cases(query, limit=20)
+        for case_id in ids:
+            db.delete_case(case_id)
+
+    return run, {"cases": 200}
+
+
+def _documents(pages=120):
+    from extraction import iter_chunks
+
+    data = make_pdf(pages)
+    return [(f"contract_{i}.pdf", list(iter_chunks(f"contract_{i}.pdf", data))) for i in range(3)]
+
+
+def bench_prompts_documents(env):
+    import risk_analysis as mod
+    from chunking import split_for_budget
+    from extraction import chunks_to_text
+
+    docs = _documents()
+
+    def run():
+        mod.build_analysis_prompt("Общий анализ рисков.", [
+            (name, chunks_to_text(chunks)) for name, chunks in docs])
+        pieces = split_for_budget(docs, mod.CHUNK_TOKEN_BUDGET)
+        findings = [(p, mod.build_chunk_prompt("Общий анализ рисков.", p)[:500]) for p in pieces]
+        mod.build_merge_prompt("Общий анализ рисков.", findings)
+
+    return run, {"documents": len(docs), "loops": 20}
+
+
+def bench_split_short_parts(env):
+    from chunking import split_for_budget
+    from extraction import Chunk
+
+    # Таблица из коротких ячеек: оценки по ячейкам укладываются в бюджет, а склеенный
+    # с разделителями текст — нет; раньше это давало бесконечную рекурсию
+    budget = 200
+    text = " ".join("Нет.;" for _ in range(20000))
+    docs = [("table.docx", [Chunk("table.docx", "paragraph", 1, 0, text)])]
+
+    def run():
+        pieces = split_for_budget(docs, budget)
+        oversized = [p.tokens for p in pieces if p.tokens > budget]
+        if oversized or "".join(p.text for p in pieces).count("Нет.") != 20000:
+            raise AssertionError(f"части вне бюджета {budget}: {oversized[:5]}")
+
+    return run, {"cells": 20000, "budget": budget}
+
+
+def bench_pack_documents(env):
+    from packing import pack_documents
+
+    # Три копии одного договора — как версии, загруженные вместе
+    docs = _documents()
+    stats = pack_documents(docs).stats
+    return lambda: pack_documents(docs), {
+        "documents": len(docs), "tokens_before": stats.tokens_before,
+        "tokens_after": stats.tokens_after}
+
+
+def bench_prompts_analyzer(env):
+    records = [{
+        "file": f"Запись {i}", "transcript": _report(4), "summary": _report(1),
+        "dates": ["01.02.2024", "15.03.2024"], "amounts": ["1 500 000 тенге"],
+        "names": ["Иванов И.И. — истец", "ТОО «Арман» — ответчик"],
+    } for i in range(30)]
+    return lambda: env.analyzer.build_merge_prompt(records), {"records": len(records), "loops": 200}
+
+
+def bench_prompts_simulator(env):
+    from retrieval import BM25Index
+
+    docs = _documents()
+    sim = env.simulator
+
+    def run():
+        index = BM25Index.from_documents(docs)
+        prefix_keys = set()
+        materials = index.context(
+            sim.OPENING_QUERY, sim.OPENING_MATERIALS_TOKENS,
+            k=sim.MATERIALS_TOP_K, lead=index.leading_passages(), seen=prefix_keys
+        )
+        sim.build_hearing_prefix("Роли ИИ: 1. СУДЬЯ.", "Истец", "Ответчик", materials)
+        for turn in range(10):
+            answer = f"Ответчик нарушил пункт {turn} договора, неустойка {turn * 1000} тенге"
+            materials = index.context(answer, sim.TURN_MATERIALS_TOKENS, k=sim.MATERIALS_TOP_K,
+                                      seen=set(prefix_keys))
+            sim.build_turn_parts(materials, answer)
+        sim.build_debrief_prompt("Истец", _report(4))
+
+    return run, {"documents": len(docs), "turns": 10}
+
+
+def bench_e2e_documents(env):
+    docs = _documents(pages=200)
+    model = env.utils.get_model()
+
+    def run():
+        env.documents.run_analysis_job(
+            env.job_context("documents"), model, "Общий анализ рисков.", docs,
+            chunked=True, budget=env.documents.CHUNK_TOKEN_BUDGET
+        )
+
+    return run, {"documents": len(docs), "chunked": True}
+
+
+def bench_e2e_analyzer(env):
+    from audio import preprocess_audio
+    from uploads import UploadRegistry
+
+    recordings = [make_wav(20, seed=i) for i in range(3)]
+    model = env.utils.get_model()
+    utils = env.utils
+
+    def run():
+        paths, labels = [], {}
+        for i, data in enumerate(recordings):
+            prepared = preprocess_audio(data, "voice.wav", tmp_dir=env.tmp, prefix="evid_")
+            for path in prepared.paths:
+                labels[path] = f"Запись {i + 1}"
+                paths.append(path)
+        registry = UploadRegistry(
+            utils.upload_audio_to_gemini, batch_upload_fn=utils.upload_files_to_gemini)
+        try:
+            env.analyzer.run_brief_job(
+                env.job_context("analyzer"), model, registry, paths, labels, {}, True)
+        finally:
+            utils.cleanup_temp_files(paths)
+
+    return run, {"recordings": len(recordings), "seconds_each": 20}
+
+
+def run_hearing(env, docs, turns=8, cache_prefix=True):
+    """Заседание как в тренажёре: открытие, ходы и разбор; неизменное начало
+    промптов — в кэше контекста (cache_prefix=False — текстом в каждом промпте).
+
+    Возвращает замеры ходов: секунды, токены на входе и из кэша.
+    """
+    from context_cache import CACHE_MIN_TOKENS, PrefixCache
+    from conversation import ConversationMemory
+    from retrieval import BM25Index
+    from telemetry import track
+
+    sim, utils = env.simulator, env.utils
+    roles, absent = "Роли ИИ: 1. СУДЬЯ. 2. АДВОКАТ ОТВЕТЧИКА.", "Ответчик"
+    model = utils.get_model(module="simulator")
+    index = BM25Index.from_documents(docs)
+    memory = ConversationMemory(keep_last=sim.MEMORY_KEEP_LAST)
+    prefix_keys = set()
+    materials = index.context(
+        sim.OPENING_QUERY, sim.OPENING_MATERIALS_TOKENS,
+        k=sim.MATERIALS_TOP_K, lead=index.leading_passages(), seen=prefix_keys
+    )
+    hearing = PrefixCache(
+        utils._genai(), utils.MODEL_NAME, sim.build_hearing_prefix(roles, "Истец", absent, materials),
+        min_tokens=CACHE_MIN_TOKENS if cache_prefix else float("inf")
+    )
+    hearing.open()
+    cached_model = utils.get_model(module="simulator", prefix_cache=hearing)
+    opening = "".join(utils.stream_response(cached_model, hearing.contents(sim.build_opening_prompt())))
+    messages = [{"role": "assistant", "content": opening}]
+    stats = []
+    for turn in range(turns):
+        answer = f"Ответчик нарушил пункт {turn} договора, неустойка {turn * 1000} тенге"
+        with track("turn", "Тренажер") as call:
+            hearing.refresh()
+            materials = index.context(
+                f"{messages[-1]['content']}\n{answer}", sim.TURN_MATERIALS_TOKENS,
+                k=sim.MATERIALS_TOP_K, seen=set(prefix_keys)
+            )
+            head, tail = sim.build_turn_parts(materials, answer)
+            budget = sim.TURN_TOKEN_CEILING - len(head + tail) // 3
+            hist = memory.history(messages, model, budget)
+            reply = "".join(utils.stream_response(
+                cached_model, hearing.contents(f"{head}История: {hist}{tail}")))
+        stats.append({"seconds": call.total_seconds, "input_tokens": call.input_tokens,
+                      "cached_tokens": call.cached_tokens})
+        messages.append({"role": "user", "content": answer})
+        messages.append({"role": "assistant", "content": reply})
+    hist = memory.history(messages, model, sim.DEBRIEF_TOKEN_CEILING)
+    sim.run_debrief_job(
+        env.job_context("debrief"), utils.get_model(module="debrief", use_cache=False,
+                                                    prefix_cache=hearing),
+        hearing.contents(sim.build_debrief_prompt("Истец", hist)))
+    hearing.close()
+    return stats
+
+
+def bench_e2e_simulator(env):
+    docs = _documents()
+    return lambda: run_hearing(env, docs), {"turns": 8}
+
+
+BENCHMARKS = {
+    "extract_pdf_small": bench_extract_pdf_small,
+    "extract_pdf_large": bench_extract_pdf_large,
+    "extract_docx": bench_extract_docx,
+    "create_docx": bench_create_docx,
+    "db_crud": bench_db_crud,
+    "prompts_documents": bench_prompts_documents,
+    "split_short_parts": bench_split_short_parts,
+    "pack_documents": bench_pack_documents,
+    "prompts_analyzer": bench_prompts_analyzer,
+    "prompts_simulator": bench_prompts_simulator,
+    "e2e_documents": bench_e2e_documents,
+    "e2e_analyzer": bench_e2e_analyzer,
+    "e2e_simulator": bench_e2e_simulator,
+}
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure(env, name, factory, repeat, warmup):
+    run, info = factory(env)
+    loops = info.get("loops", 1)
+    for _ in range(warmup):
+        run()
+    env.backend.reset_counters()
+    times, errors = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            for _ in range(loops):
+                run()
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            continue
+        times.append((time.perf_counter() - started) / loops)
+    result = {"input": info, "runs": len(times), "errors": errors}
+    if times:
+        result.update({
+            "min": min(times),
+            "median": statistics.median(times),
+            "p95": _percentile(times, 0.95),
+            "mean": statistics.fmean(times),
+        })
+    counters = env.backend.counters()
+    if counters["calls"] or counters["uploads"]:
+        result["model"] = {k: v / max(1, repeat * loops) for k, v in counters.items()}
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_suite(args):
+    config = fake_genai.FakeConfig(
+        latency=args.latency, tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens, failure_rate=args.failure_rate, seed=args.seed
+    )
+    selected = [n for n in BENCHMARKS if not args.only or any(s in n for s in args.only)]
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "limited": args.limited,
+            "fake_model": vars(config),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        env = Environment(tmp, config, limited=args.limited)
+        for name in selected:
+            result = measure(env, name, BENCHMARKS[name], args.repeat, args.warmup)
+            report["results"][name] = result
+            if "median" in result:
+                print(f"{name:20} медиана {result['median'] * 1000:9.2f} мс  "
+                      f"p95 {result['p95'] * 1000:9.2f} мс  ошибок: {len(result['errors'])}")
+            else:
+                print(f"{name:20} все прогоны упали: {result['errors'][0]}")
+        env.db.close_connection()
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.out}")
+
+
+def compare(old_path, new_path, threshold):
+    """Сравнивает медианы двух прогонов; возвращает число замедлений."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)["results"]
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+    slower = 0
+    print(f"{'замер':20} {'было, мс':>10} {'стало, мс':>10} {'изм.':>8}")
+    for name in sorted(set(old) | set(new)):
+        a, b = old.get(name, {}).get("median"), new.get(name, {}).get("median")
+        if a is None or b is None:
+            was = "—" if a is None else f"{a * 1000:.1f}"
+            now = "—" if b is None else f"{b * 1000:.1f}"
+            print(f"{name:20} {was:>10} {now:>10}  нет в одном из прогонов")
+            continue
+        change = b / a - 1 if a else 0.0
+        mark = ""
+        significant = abs(b - a) >= MIN_SIGNIFICANT_DELTA
+        if significant and change > threshold:
+            mark = "  ЗАМЕДЛЕНИЕ"
+            slower += 1
+        elif significant and change < -threshold:
+            mark = "  ускорение"
+        print(f"{name:20} {a * 1000:10.1f} {b * 1000:10.1f} {change:+8.0%}{mark}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", help="куда записать результаты (JSON)")
+    parser.add_argument("--only", nargs="*", help="запускать замеры, в имени которых есть подстрока")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка фейковой модели, с")
+    parser.add_argument("--tokens-per-second", type=float, default=4000)
+    parser.add_argument("--output-tokens", type=int, default=300)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limited", action="store_true",
+                        help="оставить квоты GEMINI_RPM/GEMINI_TPM общей очереди к Gemini")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="сравнить два файла результатов")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="относительное изменение медианы, считающееся значимым")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    run_suite(args)
+
+
+if __name__ == "__main__":
+    main()
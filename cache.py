@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "cache.db")
+# Потолок таблицы SQLiteCache на диске; сверх него вытесняются давно не читавшиеся записи
+DISK_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def content_hash(data):
+    """Возвращает SHA-256 от байтов или строки."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _size_of(value):
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(str(value).encode("utf-8"))
+
+
+class LRUCache:
+    """Кэш в памяти процесса с вытеснением по бюджету байтов."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value):
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.used_bytes -= old[1]
+            self._data[key] = (value, size)
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.used_bytes -= evicted
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Кэш строк в SQLite, общий для сессий и процессов, с вытеснением давно не
+    использованных записей сверх бюджета байтов."""
+
+    def __init__(self, table, path=CACHE_DB_PATH, max_bytes=DISK_CACHE_BYTES):
+        self.table = table
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                accessed_at REAL NOT NULL DEFAULT 0
+            )
+        """)
+        # Таблицы прежних версий — без размера и времени обращения
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "size" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            conn.execute(f"UPDATE {table} SET size = length(CAST(value AS BLOB))")
+        if "accessed_at" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+            conn.execute(f"UPDATE {table} SET accessed_at = created_at")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed ON {table} (accessed_at)"
+        )
+        conn.commit()
+
+    def _connect(self):
+        """Соединение текущего потока (одно на поток, как в db.py)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key)
+        )
+        conn.commit()
+        return row[0]
+
+    def set(self, key, value):
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, size, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, now, size, now)
+        )
+        self._evict(conn)
+        conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", stale)
+
+
+class TieredCache:
+    """Двухуровневый кэш: LRU в памяти поверх SQLite, со статистикой попаданий."""
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        value = self.disk.get(key)
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+            return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def stats(self):
+        """Счётчики попаданий по уровням и общая доля попаданий."""
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / total if total else 0.0,
+            "memory_bytes": self.memory.used_bytes,
+        }
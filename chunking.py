@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass
+
+# Грубая оценка: для русского/казахского текста у Gemini выходит ~3 символа на токен
+CHARS_PER_TOKEN = 3
+
+# Начало раздела: «Статья 5», «Раздел II», «3.», «3.1.» в начале строки
+_SECTION_RE = re.compile(
+    r"\n(?=\s*(?:Статья|Раздел|Глава|Пункт|Бап|Тарау|\d+(?:\.\d+)*\.?\s))",
+    re.IGNORECASE
+)
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+
+def estimate_tokens(text):
+    """Оценивает число токенов без обращения к API."""
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def truncate_to_budget(text, budget):
+    """Обрезает текст до бюджета токенов, оставляя начало и конец."""
+    limit = max(0, budget) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    half = max(0, limit // 2 - 10)
+    return text[:half] + "\n[...]\n" + text[-half:]
+
+
+@dataclass(frozen=True)
+class Piece:
+    """Часть набора документов, укладывающаяся в бюджет токенов."""
+    source: str
+    label: str
+    text: str
+    tokens: int
+
+
+def _split_oversized(text, budget):
+    """Режет слишком длинный блок по разделам, затем по предложениям, затем по символам."""
+    for pattern in (_SECTION_RE, _SENTENCE_RE):
+        parts = [p for p in pattern.split(text) if p.strip()]
+        if len(parts) > 1:
+            out = []
+            for part in _pack(parts, budget, sep="\n"):
+                if estimate_tokens(part) > budget:
+                    out.extend(_split_oversized(part, budget))
+                else:
+                    out.append(part)
+            return out
+    step = budget * CHARS_PER_TOKEN
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def _pack(parts, budget, sep):
+    """Жадно склеивает соседние части, пока они укладываются в бюджет."""
+    # Считаем в символах вместе с разделителями: сумма оценок по частям
+    # может уложиться в бюджет, а склеенный текст — уже нет
+    limit = budget * CHARS_PER_TOKEN
+    packed, current, used = [], [], 0
+    for part in parts:
+        size = len(part) + (len(sep) if current else 0)
+        if current and used + size > limit:
+            packed.append(sep.join(current))
+            current, used = [], 0
+            size = len(part)
+        current.append(part)
+        used += size
+    if current:
+        packed.append(sep.join(current))
+    return packed
+
+
+def _label(kind, first, last):
+    prefix = "стр." if kind == "page" else "фрагм."
+    return f"{prefix} {first}" if first == last else f"{prefix} {first}–{last}"
+
+
+def split_for_budget(documents, budget):
+    """Делит документы на части не больше budget токенов.
+
+    documents — список пар (имя, list[Chunk]). Части не пересекают границы
+    документов; соседние страницы и абзацы одного документа склеиваются,
+    а слишком длинные режутся по разделам и предложениям.
+    """
+    pieces = []
+    for name, chunks in documents:
+        group, used = [], 0
+
+        def flush():
+            if group:
+                text = "\n".join(c.text for c in group)
+                label = _label(group[0].kind, group[0].index, group[-1].index)
+                pieces.append(Piece(name, label, text, estimate_tokens(text)))
+                group.clear()
+
+        for chunk in chunks:
+            tokens = estimate_tokens(chunk.text)
+            if tokens > budget:
+                flush()
+                used = 0
+                label = _label(chunk.kind, chunk.index, chunk.index)
+                for i, part in enumerate(_split_oversized(chunk.text, budget), 1):
+                    pieces.append(Piece(name, f"{label}, ч. {i}", part, estimate_tokens(part)))
+                continue
+            if group and used + tokens > budget:
+                flush()
+                used = 0
+            group.append(chunk)
+            used += tokens
+        flush()
+    return pieces
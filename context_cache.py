@@ -0,0 +1,102 @@
+import logging
+import time
+from datetime import timedelta
+
+from cache import content_hash
+from chunking import estimate_tokens
+from ratelimit import get_limiter
+from telemetry import track
+
+# Gemini не кэширует контекст короче этого (для 2.5 Flash): такой префикс
+# просто ставится в начало каждого промпта
+CACHE_MIN_TOKENS = 1024
+# Кэш живёт на сервере час и продлевается, когда до истечения остаётся меньше
+# CACHE_REFRESH_SECONDS; брошенное заседание освобождает его само
+CACHE_TTL_SECONDS = 3600
+CACHE_REFRESH_SECONDS = 900
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixCache:
+    """Неизменное начало промптов (роли и материалы заседания), один раз
+    зарегистрированное в кэше контекста Gemini.
+
+    Пока кэш активен, модели отправляется только изменяемая часть промпта;
+    иначе (короткий префикс, ошибка создания) префикс ставится перед ней как
+    обычный текст — ответы модели от этого не меняются.
+    """
+
+    def __init__(self, genai, model_name, prefix, module=None, priority=None,
+                 ttl=CACHE_TTL_SECONDS, min_tokens=CACHE_MIN_TOKENS):
+        self.genai = genai
+        self.model_name = model_name
+        self.prefix = prefix
+        self.module = module
+        self.priority = priority
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        # Ключ префикса для кэша ответов: ответы зависят от текста префикса, а не от имени кэша
+        self.key = content_hash(prefix)[:16]
+        self.cache = None
+        self.model = None
+        self.expires = 0.0
+
+    @property
+    def active(self):
+        return self.cache is not None
+
+    def open(self):
+        """Создаёт кэш на сервере; возвращает False, если префикс пойдёт текстом."""
+        tokens = estimate_tokens(self.prefix)
+        if tokens < self.min_tokens:
+            return False
+        try:
+            with track("cache", self.module, self.model_name) as call:
+                self.cache = get_limiter().call(
+                    self.genai.caching.CachedContent.create,
+                    priority=self.priority, tokens=tokens,
+                    model=self.model_name, contents=[self.prefix],
+                    ttl=timedelta(seconds=self.ttl)
+                )
+                call.input_tokens = tokens
+        except Exception:
+            logger.warning("Кэш контекста не создан, префикс пойдёт текстом", exc_info=True)
+            self.cache = None
+            return False
+        self.model = self.genai.GenerativeModel.from_cached_content(self.cache)
+        self.expires = time.monotonic() + self.ttl
+        return True
+
+    def refresh(self):
+        """Продлевает кэш перед очередным ходом; истёкший создаётся заново."""
+        if not self.active:
+            return
+        left = self.expires - time.monotonic()
+        if left >= CACHE_REFRESH_SECONDS:
+            return
+        if left > 0:
+            try:
+                get_limiter().call(self.cache.update, priority=self.priority,
+                                   ttl=timedelta(seconds=self.ttl))
+                self.expires = time.monotonic() + self.ttl
+                return
+            except Exception:
+                logger.warning("Кэш контекста не продлён, создаю заново", exc_info=True)
+        self.cache = self.model = None
+        self.open()
+
+    def contents(self, suffix):
+        """Промпт для модели из get_model(prefix_cache=...): без префикса, если он в кэше."""
+        return suffix if self.active else f"{self.prefix}{suffix}"
+
+    def close(self):
+        """Освобождает кэш на сервере."""
+        if not self.active:
+            return
+        cache, self.cache, self.model = self.cache, None, None
+        try:
+            get_limiter().call(cache.delete, priority=self.priority)
+        except Exception:
+            # Не удалённый кэш истечёт сам через ttl
+            logger.warning("Кэш контекста не удалён", exc_info=True)
@@ -0,0 +1,67 @@
+from chunking import estimate_tokens, truncate_to_budget
+
+ROLE_NAMES = {"assistant": "Суд", "user": "Пользователь"}
+
+SUMMARY_PROMPT = """
+Ты ведёшь протокол судебного заседания.
+Обнови краткое изложение: добавь к прежнему изложению новые реплики.
+Сохрани факты, позиции сторон, заданные вопросы и данные ответы. Не более 15 предложений.
+"""
+
+
+def format_messages(messages):
+    """Превращает реплики в текст вида «Суд: ...»."""
+    return "\n".join(f"{ROLE_NAMES.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+
+
+class ConversationMemory:
+    """Память заседания: последние keep_last реплик дословно, более старые — в сводке.
+
+    Сводка обновляется инкрементально: в модель уходят прежняя сводка и только
+    те реплики, которые выпали из окна с прошлого раза.
+    """
+
+    def __init__(self, keep_last=6):
+        self.keep_last = keep_last
+        self.summary = ""
+        self.folded = 0
+
+    def _fold(self, messages, upto, model):
+        if upto <= self.folded:
+            return
+        new = format_messages(messages[self.folded:upto])
+        res = model.generate_content(
+            f"{SUMMARY_PROMPT}\n"
+            f"Прежнее изложение: {self.summary or 'нет'}\n"
+            f"Новые реплики:\n{new}"
+        )
+        self.summary = res.text.strip()
+        self.folded = upto
+
+    def _render(self, messages):
+        parts = []
+        if self.summary:
+            parts.append(f"Краткое изложение ранее сказанного: {self.summary}")
+        recent = format_messages(messages[self.folded:])
+        if recent:
+            parts.append(recent)
+        return "\n".join(parts)
+
+    def history(self, messages, model, budget):
+        """Возвращает историю не длиннее budget токенов.
+
+        Если окно из keep_last реплик не помещается, в сводку уходят и они,
+        начиная со старых; в крайнем случае текст обрезается.
+        """
+        keep = min(self.keep_last, len(messages))
+        while True:
+            self._fold(messages, len(messages) - keep, model)
+            text = self._render(messages)
+            if estimate_tokens(text) <= budget or keep == 0:
+                break
+            keep -= 1
+        return truncate_to_budget(text, budget)
+
+    def reset(self):
+        self.summary = ""
+        self.folded = 0
@@ -1,68 +1,580 @@
 import sqlite3
 import os
-from datetime import datetime
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "legal_os.db")
 
+# Сколько ждать освобождения блокировки другой записью, прежде чем выдать ошибку
+BUSY_TIMEOUT_MS = 10000
 
-def _get_connection():
-    conn = sqlite3.connect(DB_PATH)
+_local = threading.local()
+# Пути баз, для которых схема уже создана в этом процессе
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def _configure(conn):
     conn.row_factory = sqlite3.Row
+    # WAL: читатели не блокируют писателя и наоборот
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")
+    conn.execute("PRAGMA foreign_keys=ON")
+
+
+def _get_connection():
+    """Возвращает соединение текущего потока (одно на поток и путь к базе)."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        # Автокоммит: транзакции открываются явно в transaction()
+        conn = sqlite3.connect(
+            DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None
+        )
+        _configure(conn)
+        conns[DB_PATH] = conn
+        _ensure_schema(DB_PATH)
     return conn
 
 
-def init_db():
-    """Создаёт таблицу cases, если она не существует."""
+def _ensure_schema(path):
+    """Создаёт схему при первом соединении с базой, а не при импорте модуля."""
+    if path in _schema_ready:
+        return
+    with _schema_lock:
+        if path not in _schema_ready:
+            init_db()
+
+
+def close_connection():
+    """Закрывает соединения текущего потока."""
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+
+
+@contextmanager
+def transaction():
+    """Транзакция записи на соединении потока; вложенные вызовы объединяются в одну."""
     conn = _get_connection()
+    depth = getattr(_local, "depth", 0)
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+    _local.depth = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth = depth
+        if depth == 0:
+            conn.execute("ROLLBACK")
+        raise
+    _local.depth = depth
+    if depth == 0:
+        conn.execute("COMMIT")
+
+
+def init_db():
+    """Создаёт таблицы и индексы, если их нет.
+
+    Вызывается сама при первом соединении с базой; явный вызов нужен только
+    для того, чтобы создать схему заранее.
+    """
+    with transaction() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cases (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                module TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_module_id ON cases (module, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_created_at ON cases (created_at)")
+        _init_fts(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                audio_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                module TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                UNIQUE (audio_hash, prompt_version)
+            )
+        """)
+        # Расшифровки улик анализатора раньше сохранялись под версией промпта transcribe_audio
+        conn.execute(
+            "UPDATE OR IGNORE transcripts SET prompt_version = 'evidence-1' "
+            "WHERE prompt_version = '1' AND module = 'Анализатор'"
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                owner TEXT NOT NULL DEFAULT '',
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT NOT NULL DEFAULT '',
+                partial TEXT NOT NULL DEFAULT '',
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_input_hash ON jobs (input_hash, id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS telemetry (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                module TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                model TEXT NOT NULL DEFAULT '',
+                upload_seconds REAL NOT NULL DEFAULT 0,
+                wait_seconds REAL NOT NULL DEFAULT 0,
+                generate_seconds REAL NOT NULL DEFAULT 0,
+                first_token_seconds REAL,
+                total_seconds REAL NOT NULL,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                bytes_uploaded INTEGER NOT NULL DEFAULT 0,
+                error TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        _add_column(conn, "telemetry", "cached_tokens", "INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_telemetry_created_at ON telemetry (created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS batch_items (
+                run TEXT NOT NULL,
+                path TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                case_id INTEGER,
+                seconds REAL,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                error TEXT NOT NULL DEFAULT '',
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (run, path)
+            )
+        """)
+    _schema_ready.add(DB_PATH)
+
+
+def _add_column(conn, table, column, declaration):
+    """Добавляет столбец в таблицу, созданную прежней версией схемы."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+# unicode61 не считает ё и е одной буквой: в индекс и в запрос текст попадает с ё → е
+_FOLD_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fold_yo(text):
+    return text.replace("ё", "е").replace("Ё", "Е")
+
+
+def _init_fts(conn):
+    """Индекс FTS5 по title и content, синхронизируемый триггерами.
+
+    Индекс прежних версий (без замены ё на е, с лишними префиксными индексами)
+    пересоздаётся.
+    """
+    trigger = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'cases_fts_ai'"
+    ).fetchone()
+    if trigger is not None and "replace(" in trigger[0]:
+        return
+    for name in ("cases_fts_ai", "cases_fts_ad", "cases_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS cases_fts")
+    # unicode61 понимает кириллицу, включая казахские буквы (ә, ғ, қ, ң, ө, ұ, ү, һ, і);
+    # префиксный индекс ускоряет поиск по началу слова, которым заменяем стемминг
+    # (_search_terms ищет по началу не короче SEARCH_MIN_STEM букв)
     conn.execute("""
-        CREATE TABLE IF NOT EXISTS cases (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            module TEXT NOT NULL,
-            content TEXT NOT NULL,
-            created_at TEXT NOT NULL
+        CREATE VIRTUAL TABLE cases_fts USING fts5(
+            title, content,
+            content='cases', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='4'
         )
     """)
-    conn.commit()
-    conn.close()
+    new = {col: _FOLD_SQL.format(f"new.{col}") for col in ("title", "content")}
+    old = {col: _FOLD_SQL.format(f"old.{col}") for col in ("title", "content")}
+    conn.execute(f"""
+        CREATE TRIGGER cases_fts_ai AFTER INSERT ON cases BEGIN
+            INSERT INTO cases_fts (rowid, title, content)
+            VALUES (new.id, {new['title']}, {new['content']});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER cases_fts_ad AFTER DELETE ON cases BEGIN
+            INSERT INTO cases_fts (cases_fts, rowid, title, content)
+            VALUES ('delete', old.id, {old['title']}, {old['content']});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER cases_fts_au AFTER UPDATE ON cases BEGIN
+            INSERT INTO cases_fts (cases_fts, rowid, title, content)
+            VALUES ('delete', old.id, {old['title']}, {old['content']});
+            INSERT INTO cases_fts (rowid, title, content)
+            VALUES (new.id, {new['title']}, {new['content']});
+        END
+    """)
+    # 'rebuild' прочитал бы cases без замены ё, поэтому индекс заполняется явно
+    conn.execute(f"""
+        INSERT INTO cases_fts (rowid, title, content)
+        SELECT id, {_FOLD_SQL.format('title')}, {_FOLD_SQL.format('content')} FROM cases
+    """)
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M")
 
 
 def save_case(title, module, content):
-    """Сохраняет дело в базу."""
-    conn = _get_connection()
-    conn.execute(
-        "INSERT INTO cases (title, module, content, created_at) VALUES (?, ?, ?, ?)",
-        (title, module, content, datetime.now().strftime("%Y-%m-%d %H:%M"))
-    )
-    conn.commit()
-    conn.close()
+    """Сохраняет дело в базу и возвращает его ID."""
+    with transaction() as conn:
+        cur = conn.execute(
+            "INSERT INTO cases (title, module, content, created_at) VALUES (?, ?, ?, ?)",
+            (title, module, content, _now())
+        )
+    return cur.lastrowid
+
+
+def save_cases(cases):
+    """Сохраняет несколько дел одной транзакцией; cases — кортежи (title, module, content)."""
+    created_at = _now()
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT INTO cases (title, module, content, created_at) VALUES (?, ?, ?, ?)",
+            [(title, module, content, created_at) for title, module, content in cases]
+        )
 
 
 def get_cases(limit=50):
     """Возвращает список дел (новые сверху)."""
-    conn = _get_connection()
-    rows = conn.execute(
+    rows = _get_connection().execute(
         "SELECT * FROM cases ORDER BY id DESC LIMIT ?", (limit,)
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
+def _day(value):
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def list_cases(limit=20, before_id=None, module=None, date_from=None, date_to=None):
+    """Возвращает метаданные дел без содержимого (новые сверху).
+
+    Постраничный вывод по ключу: для следующей страницы передайте before_id —
+    ID последнего дела предыдущей. date_from и date_to (date или 'YYYY-MM-DD')
+    включительны.
+    """
+    where, params = [], []
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+    if module:
+        where.append("module = ?")
+        params.append(module)
+    if date_from:
+        where.append("created_at >= ?")
+        params.append(_day(date_from))
+    if date_to:
+        end = date_to if isinstance(date_to, date) else date.fromisoformat(str(date_to))
+        where.append("created_at < ?")
+        params.append((end + timedelta(days=1)).isoformat())
+    sql = "SELECT id, title, module, created_at FROM cases"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    rows = _get_connection().execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+
+# Слова длиннее SEARCH_MIN_STEM ищутся по началу без двух последних букв —
+# грубая замена стемминга для падежных окончаний
+SEARCH_MIN_STEM = 4
+# Длина фрагмента текста с совпадением в результатах поиска
+SNIPPET_CHARS = 160
+_SEARCH_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _search_terms(query):
+    """Слова запроса: короткие ищутся целиком, длинные — по началу."""
+    terms = []
+    for word in _SEARCH_WORD_RE.findall(_fold_yo(query.lower())):
+        if len(word) > SEARCH_MIN_STEM and word.isalpha():
+            terms.append((word[:max(SEARCH_MIN_STEM, len(word) - 2)], True))
+        else:
+            terms.append((word, False))
+    return terms
+
+
+def _fts_query(terms):
+    """Собирает из слов запроса безопасное выражение FTS5 (все слова обязательны)."""
+    return " ".join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+
+
+def _snippet(content, terms):
+    """Фрагмент текста вокруг первого совпадения с выделенными словами запроса.
+
+    Считается в Python по отобранным делам: snippet() из FTS5 заново читает
+    списки вхождений частых слов и на большой истории стоит дороже самого поиска.
+    """
+    # Слова запроса уже без ё, а в тексте дела ё могла остаться
+    words = [re.escape(t).replace("е", "[её]") + (r"\w*" if prefix else r"\b") for t, prefix in terms]
+    pattern = re.compile(r"\b(?:" + "|".join(words) + ")", re.IGNORECASE)
+    found = pattern.search(content)
+    hit = found.start() if found else 0
+    start = content.rfind(" ", 0, max(0, hit - SNIPPET_CHARS // 3)) + 1
+    end = content.find(" ", start + SNIPPET_CHARS)
+    end = len(content) if end == -1 else end
+    text = pattern.sub(lambda m: f"**{m.group(0)}**", content[start:end])
+    return ("…" if start > 0 else "") + text + ("…" if end < len(content) else "")
+
+
+def search_cases(query, limit=20):
+    """Полнотекстовый поиск по делам: метаданные и фрагмент с совпадением, лучшие сверху."""
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    conn = _get_connection()
+    # Ранжируются все совпадения: совпадение в заголовке весит в 10 раз больше
+    ids = [r[0] for r in conn.execute("""
+        SELECT rowid FROM cases_fts WHERE cases_fts MATCH ?
+        ORDER BY bm25(cases_fts, 10.0, 1.0) LIMIT ?
+    """, (_fts_query(terms), limit)).fetchall()]
+    if not ids:
+        return []
+    rows = conn.execute(
+        f"SELECT id, title, module, created_at, content FROM cases "
+        f"WHERE id IN ({','.join('?' * len(ids))})", ids
+    ).fetchall()
+    order = {case_id: i for i, case_id in enumerate(ids)}
+    results = []
+    for r in sorted(rows, key=lambda r: order[r["id"]]):
+        case = dict(r)
+        case["snippet"] = _snippet(case.pop("content"), terms)
+        results.append(case)
+    return results
+
+
 def get_case(case_id):
     """Возвращает одно дело по ID."""
-    conn = _get_connection()
-    row = conn.execute("SELECT * FROM cases WHERE id = ?", (case_id,)).fetchone()
-    conn.close()
+    row = _get_connection().execute("SELECT * FROM cases WHERE id = ?", (case_id,)).fetchone()
     return dict(row) if row else None
 
 
-def delete_case(case_id):
-    """Удаляет дело по ID."""
-    conn = _get_connection()
-    conn.execute("DELETE FROM cases WHERE id = ?", (case_id,))
-    conn.commit()
-    conn.close()
+def iter_cases(case_ids, batch=500):
+    """Отдаёт дела с содержимым по одному (новые первыми), не загружая все сразу."""
+    ids = sorted(set(case_ids), reverse=True)
+    for start in range(0, len(ids), batch):
+        part = ids[start:start + batch]
+        cursor = _get_connection().execute(
+            f"SELECT * FROM cases WHERE id IN ({', '.join('?' * len(part))}) ORDER BY id DESC",
+            part
+        )
+        for row in cursor:
+            yield dict(row)
+
+
+def get_transcript(audio_hash, prompt_version):
+    """Возвращает сохранённую расшифровку записи или None."""
+    row = _get_connection().execute(
+        "SELECT content FROM transcripts WHERE audio_hash = ? AND prompt_version = ?",
+        (audio_hash, str(prompt_version))
+    ).fetchone()
+    return row["content"] if row else None
+
+
+def save_transcript(audio_hash, prompt_version, module, content):
+    """Сохраняет расшифровку записи (повторное сохранение заменяет текст)."""
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO transcripts (audio_hash, prompt_version, module, content, created_at) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (audio_hash, prompt_version) DO UPDATE SET content = excluded.content",
+            (audio_hash, str(prompt_version), module, content, _now())
+        )
+
+
+def list_transcripts(limit=20):
+    """Возвращает последние расшифровки (новые сверху)."""
+    rows = _get_connection().execute(
+        "SELECT id, module, content, created_at FROM transcripts ORDER BY id DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def claim_job(kind, input_hash, owner=""):
+    """Возвращает (id, created): задачу с тем же входом, которая ещё в очереди
+    или выполняется, или новую задачу в статусе queued.
+
+    Готовые задачи не переиспользуются: повторный запрос — новая задача, а
+    повтор ответа решает кэш ответов со своим сроком жизни.
+    """
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE input_hash = ? AND status IN ('queued', 'running') "
+            "ORDER BY id DESC LIMIT 1",
+            (input_hash,)
+        ).fetchone()
+        if row:
+            return row["id"], False
+        now = _now()
+        cur = conn.execute(
+            "INSERT INTO jobs (kind, input_hash, status, owner, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?)",
+            (kind, input_hash, owner, now, now)
+        )
+        return cur.lastrowid, True
+
+
+def update_job(job_id, **fields):
+    """Обновляет поля задачи (status, progress, message, partial, result, error)."""
+    allowed = {"status", "progress", "message", "partial", "result", "error"}
+    unknown = set(fields) - allowed
+    if unknown:
+        raise ValueError(f"Неизвестные поля задачи: {', '.join(sorted(unknown))}")
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with transaction() as conn:
+        conn.execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+            (*fields.values(), _now(), job_id)
+        )
+
+
+def get_job(job_id):
+    """Возвращает задачу по ID."""
+    row = _get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def prune_jobs(keep_days):
+    """Удаляет завершённые задачи (с их частичным и итоговым текстом) старше keep_days дней."""
+    with transaction() as conn:
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (_since(keep_days),)
+        )
+
+
+def list_active_jobs():
+    """Возвращает задачи в статусах queued и running."""
+    rows = _get_connection().execute(
+        "SELECT id, kind, owner, status FROM jobs WHERE status IN ('queued', 'running')"
+    ).fetchall()
+    return [dict(r) for r in rows]
 
 
-# Инициализация при импорте
-init_db()
+TELEMETRY_FIELDS = (
+    "module", "operation", "model", "upload_seconds", "wait_seconds", "generate_seconds",
+    "first_token_seconds", "total_seconds", "input_tokens", "output_tokens", "cached_tokens",
+    "bytes_uploaded", "error",
+)
+
+
+def save_telemetry(record):
+    """Сохраняет замер одного обращения к Gemini; record — словарь с полями TELEMETRY_FIELDS."""
+    columns = [f for f in TELEMETRY_FIELDS if f in record]
+    with transaction() as conn:
+        conn.execute(
+            f"INSERT INTO telemetry (created_at, {', '.join(columns)}) "
+            f"VALUES (?{', ?' * len(columns)})",
+            (_now(), *(record[f] for f in columns))
+        )
+
+
+def _since(days):
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M")
+
+
+def list_telemetry(days=7, module=None, limit=5000):
+    """Возвращает замеры за последние days дней (новые сверху)."""
+    where, params = ["created_at >= ?"], [_since(days)]
+    if module:
+        where.append("module = ?")
+        params.append(module)
+    rows = _get_connection().execute(
+        f"SELECT * FROM telemetry WHERE {' AND '.join(where)} ORDER BY id DESC LIMIT ?",
+        (*params, limit)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def telemetry_by_module(days=7):
+    """Сводка по модулям: число вызовов, ошибки, токены и байты за последние days дней."""
+    rows = _get_connection().execute("""
+        SELECT module,
+               COUNT(*) AS calls,
+               SUM(error != '') AS errors,
+               SUM(input_tokens) AS input_tokens,
+               SUM(output_tokens) AS output_tokens,
+               SUM(cached_tokens) AS cached_tokens,
+               SUM(bytes_uploaded) AS bytes_uploaded,
+               SUM(total_seconds) AS total_seconds
+        FROM telemetry
+        WHERE created_at >= ?
+        GROUP BY module
+        ORDER BY input_tokens + output_tokens DESC
+    """, (_since(days),)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def slowest_calls(days=7, limit=10):
+    """Самые долгие вызовы за последние days дней."""
+    rows = _get_connection().execute(
+        "SELECT * FROM telemetry WHERE created_at >= ? ORDER BY total_seconds DESC LIMIT ?",
+        (_since(days), limit)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def prune_telemetry(keep_days):
+    """Удаляет замеры старше keep_days дней."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM telemetry WHERE created_at < ?", (_since(keep_days),))
+
+
+def save_batch_item(run, path, file_hash, status, case_id=None, seconds=None,
+                    input_tokens=0, error=""):
+    """Записывает состояние файла пакетного прогона (done или failed)."""
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO batch_items (run, path, file_hash, status, case_id, seconds, "
+            "input_tokens, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (run, path) DO UPDATE SET file_hash = excluded.file_hash, "
+            "status = excluded.status, case_id = excluded.case_id, seconds = excluded.seconds, "
+            "input_tokens = excluded.input_tokens, error = excluded.error, "
+            "updated_at = excluded.updated_at",
+            (run, path, file_hash, status, case_id, seconds, input_tokens, error, _now())
+        )
+
+
+def list_batch_items(run):
+    """Возвращает файлы пакетного прогона с их состоянием."""
+    rows = _get_connection().execute(
+        "SELECT * FROM batch_items WHERE run = ? ORDER BY path", (run,)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def delete_case(case_id):
+    """Удаляет дело по ID."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM cases WHERE id = ?", (case_id,))
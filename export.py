@@ -0,0 +1,127 @@
+import io
+import re
+import zipfile
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# Меняется при изменении разметки DOCX, чтобы не отдавать файлы из старого кэша
+EXPORT_VERSION = 2
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_BULLET_RE = re.compile(r"^(\s*)[-*+•]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)\d+[.)]\s+(.*)$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+_INLINE_RE = re.compile(r"(\*\*.+?\*\*|__.+?__|\*[^*\s][^*]*\*|`[^`]+`)")
+_UNSAFE_NAME_RE = re.compile(r"[^\w\- ]+", re.UNICODE)
+
+
+def _add_inline(paragraph, text):
+    """Добавляет текст с **жирным**, *курсивом* и `кодом` отдельными фрагментами."""
+    for part in _INLINE_RE.split(text):
+        if not part:
+            continue
+        if part.startswith(("**", "__")) and len(part) > 4:
+            paragraph.add_run(part[2:-2]).bold = True
+        elif part.startswith("`") and len(part) > 2:
+            paragraph.add_run(part[1:-1]).font.name = "Courier New"
+        elif part.startswith("*") and len(part) > 2:
+            paragraph.add_run(part[1:-1]).italic = True
+        else:
+            paragraph.add_run(part)
+
+
+def _list_style(indent, numbered):
+    level = min(3, 1 + len(indent.expandtabs(4)) // 2)
+    base = "List Number" if numbered else "List Bullet"
+    return base if level == 1 else f"{base} {level}"
+
+
+def _add_table(doc, rows):
+    cells = [[c.strip() for c in row.strip().strip("|").split("|")] for row in rows]
+    width = max(len(r) for r in cells)
+    table = doc.add_table(rows=len(cells), cols=width)
+    table.style = "Table Grid"
+    for r, row in enumerate(cells):
+        for c, value in enumerate(row):
+            paragraph = table.cell(r, c).paragraphs[0]
+            _add_inline(paragraph, value)
+            if r == 0:
+                for run in paragraph.runs:
+                    run.bold = True
+
+
+def markdown_to_docx(content, title="Документ"):
+    """Превращает markdown-ответ модели в DOCX и возвращает байты файла.
+
+    Заголовки, маркированные и нумерованные списки, таблицы, **жирный** и *курсив*
+    переносятся в стили Word; текст разбирается за один проход по строкам.
+    """
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading(title, 0)
+    paragraph = None
+    table_rows = []
+    for line in content.splitlines():
+        if table_rows and not line.lstrip().startswith("|"):
+            _add_table(doc, table_rows)
+            table_rows = []
+        if not line.strip():
+            paragraph = None
+            continue
+        if line.lstrip().startswith("|"):
+            if not _TABLE_SEPARATOR_RE.match(line):
+                table_rows.append(line)
+            paragraph = None
+            continue
+        if _RULE_RE.match(line):
+            paragraph = None
+            continue
+        match = _HEADING_RE.match(line)
+        if match:
+            _add_inline(doc.add_heading(level=len(match.group(1))), match.group(2))
+            paragraph = None
+            continue
+        match = _BULLET_RE.match(line) or _NUMBERED_RE.match(line)
+        if match:
+            numbered = match.re is _NUMBERED_RE
+            _add_inline(
+                doc.add_paragraph(style=_list_style(match.group(1), numbered)), match.group(2)
+            )
+            paragraph = None
+            continue
+        # Соседние строки обычного текста — один абзац с переносами строк
+        if paragraph is None:
+            paragraph = doc.add_paragraph()
+        else:
+            paragraph.add_run().add_break()
+        _add_inline(paragraph, line.strip())
+    if table_rows:
+        _add_table(doc, table_rows)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def case_filename(case):
+    """Имя файла дела в архиве: ID, дата и заголовок без недопустимых символов."""
+    title = _UNSAFE_NAME_RE.sub("", case["title"]).strip()[:60] or "Дело"
+    day = str(case.get("created_at", ""))[:10]
+    return f"{case['id']:05d}_{day}_{title}.docx"
+
+
+def write_cases_zip(cases, fileobj):
+    """Пишет дела в zip-архив по одному: в памяти держится только текущий документ.
+
+    cases — итерируемое словарей с полями id, title, module, created_at, content.
+    Возвращает число записанных дел.
+    """
+    count = 0
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for case in cases:
+            data = markdown_to_docx(case["content"], case["title"])
+            with archive.open(case_filename(case), "w") as entry:
+                entry.write(data)
+            count += 1
+    return count
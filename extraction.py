@@ -0,0 +1,261 @@
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+
+# Ограничения на один документ
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+MAX_DOCUMENT_CHARS = 5_000_000
+
+# Параллельная обработка: PDF длиннее порога режется на диапазоны страниц
+EXTRACT_WORKERS = max(1, min(4, (os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = 50
+PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+class ExtractionError(Exception):
+    """Не удалось извлечь текст из документа."""
+
+
+class UnsupportedFormatError(ExtractionError):
+    """Формат файла не поддерживается."""
+
+
+class EmptyDocumentError(ExtractionError):
+    """В документе нет извлекаемого текста."""
+
+
+class DocumentTooLargeError(ExtractionError):
+    """Документ превышает ограничение по размеру."""
+
+
+class CorruptDocumentError(ExtractionError):
+    """Файл повреждён или не читается."""
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Фрагмент документа: страница PDF, абзац или таблица DOCX, абзац TXT.
+
+    index — номер страницы (с 1) для PDF и порядковый номер блока для остальных,
+    offset — позиция начала фрагмента в склеенном тексте документа.
+    """
+    source: str
+    kind: str
+    index: int
+    offset: int
+    text: str
+
+
+def _extension(name):
+    ext = os.path.splitext(name.lower())[1]
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise UnsupportedFormatError(f"Формат {ext or name} не поддерживается")
+    return ext
+
+
+# Парсеры импортируются при первом разборе файла: страницам без документов
+# (анализатор аудио, статистика) они не нужны
+def _pdf_reader(data):
+    import PyPDF2
+    return PyPDF2.PdfReader(io.BytesIO(data))
+
+
+def _pdf_pages(data):
+    for i, page in enumerate(_pdf_reader(data).pages, 1):
+        text = page.extract_text()
+        if text:
+            yield "page", i, text
+
+
+def _docx_blocks(data):
+    from docx import Document
+    from docx.oxml.ns import qn
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = Document(io.BytesIO(data))
+    n = 0
+    for child in doc.element.body.iterchildren():
+        if child.tag == qn("w:p"):
+            text = Paragraph(child, doc).text
+            kind = "paragraph"
+        elif child.tag == qn("w:tbl"):
+            rows = []
+            for row in Table(child, doc).rows:
+                cells = []
+                for cell in row.cells:
+                    # Объединённые ячейки python-docx отдаёт повторно
+                    value = cell.text.strip()
+                    if not cells or cells[-1] != value:
+                        cells.append(value)
+                rows.append(" | ".join(cells))
+            text = "\n".join(rows)
+            kind = "table"
+        else:
+            continue
+        n += 1
+        if text.strip():
+            yield kind, n, text
+
+
+def _txt_paragraphs(data):
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("cp1251")
+    paragraphs = text.split("\n\n")
+    for n, para in enumerate(paragraphs, 1):
+        if para.strip():
+            # Абзац хранит свою пустую строку: фрагменты склеиваются через "\n",
+            # и границы абзацев для нарезки и сжатия повторов остаются прежними
+            yield "paragraph", n, para + "\n" if n < len(paragraphs) else para
+
+
+def _raw_blocks(name, data):
+    ext = _extension(name)
+    if len(data) > MAX_DOCUMENT_BYTES:
+        raise DocumentTooLargeError(
+            f"Файл {name} больше {MAX_DOCUMENT_BYTES // (1024 * 1024)} МБ"
+        )
+    if ext == ".pdf":
+        return _pdf_pages(data)
+    if ext == ".docx":
+        return _docx_blocks(data)
+    return _txt_paragraphs(data)
+
+
+def _assemble(name, blocks, max_chars=MAX_DOCUMENT_CHARS):
+    """Превращает сырые блоки в Chunk с позициями, следя за лимитом и пустотой."""
+    offset = 0
+    has_text = False
+    try:
+        for kind, index, text in blocks:
+            if offset + len(text) > max_chars:
+                raise DocumentTooLargeError(f"В файле {name} больше {max_chars} символов текста")
+            yield Chunk(name, kind, index, offset, text)
+            offset += len(text) + 1
+            has_text = has_text or bool(text.strip())
+    except ExtractionError:
+        raise
+    except Exception as e:
+        raise CorruptDocumentError(f"Ошибка при чтении файла {name}: {e}") from e
+    if not has_text:
+        raise EmptyDocumentError(f"Файл {name} пуст или не удалось извлечь текст")
+
+
+def iter_chunks(name, data, max_chars=MAX_DOCUMENT_CHARS):
+    """Потоково отдаёт фрагменты документа по мере разбора."""
+    try:
+        blocks = _raw_blocks(name, data)
+    except ExtractionError:
+        raise
+    except Exception as e:
+        raise CorruptDocumentError(f"Ошибка при чтении файла {name}: {e}") from e
+    return _assemble(name, blocks, max_chars)
+
+
+def chunks_to_text(chunks):
+    """Склеивает фрагменты в один текст (позиции Chunk.offset указывают в него)."""
+    return "\n".join(c.text for c in chunks)
+
+
+def _extract_file(name, data):
+    return list(iter_chunks(name, data))
+
+
+def _extract_pdf_range(data, first):
+    """Страницы PDF-диапазона с номерами страниц исходного документа."""
+    return [(kind, first + index, text) for kind, index, text in _pdf_pages(data)]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, а не fork: сервер Streamlit многопоточный, и копия его
+            # процесса могла бы унаследовать чужие захваченные блокировки
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def _split_pdf(data, pages_per_part=PDF_PAGES_PER_TASK):
+    """Режет длинный PDF на отдельные PDF по pages_per_part страниц.
+
+    Возвращает пары (число страниц до части, байты части), чтобы каждый процесс
+    получал и разбирал только свои страницы; для короткого или нечитаемого PDF — [].
+    """
+    from PyPDF2 import PdfWriter
+
+    try:
+        pages = _pdf_reader(data).pages
+        if len(pages) <= pages_per_part:
+            return []
+        parts = []
+        for start in range(0, len(pages), pages_per_part):
+            writer = PdfWriter()
+            for page in pages[start:start + pages_per_part]:
+                writer.add_page(page)
+            out = io.BytesIO()
+            writer.write(out)
+            parts.append((start, out.getvalue()))
+        return parts
+    except Exception:
+        return []
+
+
+def extract_many(files, max_workers=EXTRACT_WORKERS):
+    """Извлекает фрагменты из нескольких файлов.
+
+    files — список пар (имя, байты). Возвращает список той же длины, где
+    каждый элемент — список Chunk или экземпляр ExtractionError.
+    Крупные наборы и длинные PDF раздаются пулу процессов.
+    """
+    total = sum(len(data) for _, data in files)
+    if max_workers <= 1 or total < PARALLEL_MIN_BYTES:
+        results = []
+        for name, data in files:
+            try:
+                results.append(_extract_file(name, data))
+            except ExtractionError as e:
+                results.append(e)
+        return results
+
+    pool = _get_pool()
+    plans = []
+    for name, data in files:
+        try:
+            ext = _extension(name)
+        except ExtractionError as e:
+            plans.append(("error", e))
+            continue
+        parts = _split_pdf(data) if ext == ".pdf" and len(data) <= MAX_DOCUMENT_BYTES else []
+        if parts:
+            futures = [pool.submit(_extract_pdf_range, part, first) for first, part in parts]
+            plans.append(("pages", futures))
+        else:
+            plans.append(("file", pool.submit(_extract_file, name, data)))
+
+    results = []
+    for (name, _), (kind, payload) in zip(files, plans):
+        try:
+            if kind == "error":
+                raise payload
+            if kind == "file":
+                results.append(payload.result())
+            else:
+                blocks = (block for future in payload for block in future.result())
+                results.append(list(_assemble(name, blocks)))
+        except ExtractionError as e:
+            results.append(e)
+        except Exception as e:
+            results.append(CorruptDocumentError(f"Ошибка при чтении файла {name}: {e}"))
+    return results
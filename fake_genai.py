@@ -0,0 +1,395 @@
+"""Локальная замена google.generativeai для замеров и проверок без сети.
+
+Поддерживает то, чем пользуется приложение: configure, GenerativeModel.generate_content
+(обычный и потоковый режим, usage_metadata), upload_file, get_file, delete_file и кэш
+контекста (caching.CachedContent, GenerativeModel.from_cached_content). Задержка, скорость
+генерации и чтения промпта, размер ответа, доля ошибок и квоты задаются в FakeConfig.
+
+    import fake_genai
+    backend = fake_genai.install(fake_genai.FakeConfig(latency=0.2))
+    import utils  # теперь utils.genai — фейк
+"""
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+try:
+    from google.api_core.exceptions import NotFound, ResourceExhausted as QuotaError
+except ImportError:  # pragma: no cover - api_core ставится вместе с google-generativeai
+    class QuotaError(Exception):
+        pass
+
+    class NotFound(Exception):
+        pass
+
+CHARS_PER_TOKEN = 3
+FILE_TOKENS_PER_KB = 8
+
+FILLER = (
+    "Согласно статье 272 ГК РК обязательство должно исполняться надлежащим образом "
+    "в соответствии с условиями договора. Истец вправе требовать взыскания неустойки "
+    "и возмещения убытков. Суду следует уточнить сроки, суммы и основания требований. "
+).split()
+
+
+@dataclass
+class FakeConfig:
+    """Поведение фейковой модели."""
+    latency: float = 0.05            # задержка до первого токена, с
+    tokens_per_second: float = 2000  # скорость генерации ответа
+    output_tokens: int = 400         # размер ответа в токенах
+    chunk_tokens: int = 40           # токенов в одном фрагменте потока
+    failure_rate: float = 0.0        # доля запросов, падающих с ошибкой квоты
+    upload_latency: float = 0.02     # задержка загрузки файла, с
+    processing_polls: int = 0        # сколько опросов get_file файл остаётся PROCESSING
+    rpm_quota: int = 0               # запросов за окно квоты, сверх — ошибка квоты (0 — без лимита)
+    tpm_quota: int = 0               # входных токенов за окно квоты (0 — без лимита)
+    quota_window: float = 60.0       # длина окна квоты, с
+    prefill_tokens_per_second: float = 0.0  # скорость чтения входа без кэша (0 — мгновенно)
+    seed: int = 0
+
+
+class _State:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeFile:
+    """Аналог объекта файла Gemini."""
+
+    def __init__(self, name, path, digest, size, polls):
+        self.name = name
+        self.display_name = os.path.basename(path)
+        self.sha256_hash = digest
+        self.size_bytes = size
+        self.expiration_time = datetime.now(timezone.utc) + timedelta(hours=48)
+        self.state = _State("PROCESSING" if polls else "ACTIVE")
+        self._polls = polls
+
+
+class FakeResponse:
+    """Ответ или фрагмент потока: text и usage_metadata."""
+
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeStream:
+    """Потоковый ответ: фрагменты отдаются с задержкой, как при генерации."""
+
+    def __init__(self, chunks, delay):
+        self._chunks = chunks
+        self._delay = delay
+        self.usage_metadata = chunks[-1].usage_metadata if chunks else None
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            time.sleep(self._delay)
+            yield chunk
+
+    @property
+    def text(self):
+        return "".join(c.text for c in self)
+
+
+class FakeBackend:
+    """Состояние фейкового API: конфигурация, загруженные файлы и счётчики."""
+
+    def __init__(self, config=None):
+        self.config = config or FakeConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.files = {}
+        self.caches = {}
+        self._window = deque()
+        self.reset_counters()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = 0
+            self.failures = 0
+            self.quota_errors = 0
+            self.uploads = 0
+            self.uploaded_bytes = 0
+            self.prompt_tokens = 0
+            self.output_tokens = 0
+            self.caches_created = 0
+            self.caches_deleted = 0
+            self.cache_hits = 0
+            self.cached_tokens = 0
+
+    def counters(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "quota_errors": self.quota_errors,
+                "uploads": self.uploads,
+                "uploaded_bytes": self.uploaded_bytes,
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens,
+                "caches_created": self.caches_created,
+                "caches_deleted": self.caches_deleted,
+                "cache_hits": self.cache_hits,
+                "cached_tokens": self.cached_tokens,
+            }
+
+    def _fails(self):
+        with self._lock:
+            return self._rng.random() < self.config.failure_rate
+
+    def _over_quota(self, tokens):
+        """Скользящее окно квоты, как у Gemini: запрос сверх RPM/TPM отклоняется."""
+        cfg = self.config
+        if not (cfg.rpm_quota or cfg.tpm_quota):
+            return False
+        with self._lock:
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] >= cfg.quota_window:
+                self._window.popleft()
+            over = (cfg.rpm_quota and len(self._window) >= cfg.rpm_quota) or (
+                cfg.tpm_quota and sum(t for _, t in self._window) + tokens > cfg.tpm_quota)
+            if over:
+                self.quota_errors += 1
+                return True
+            self._window.append((now, tokens))
+            return False
+
+    def count_tokens(self, contents):
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        tokens = 0
+        for part in parts:
+            if isinstance(part, str):
+                tokens += len(part) // CHARS_PER_TOKEN + 1
+            elif isinstance(part, FakeFile):
+                tokens += part.size_bytes // 1024 * FILE_TOKENS_PER_KB + 1
+            else:
+                tokens += len(str(part)) // CHARS_PER_TOKEN + 1
+        return tokens
+
+    def _answer(self, contents, generation_config):
+        """Детерминированный ответ нужной длины; для JSON-режима — JSON-объект."""
+        digest = hashlib.sha256(repr(contents).encode("utf-8")).digest()
+        words = []
+        size = self.config.output_tokens * CHARS_PER_TOKEN
+        offset = digest[0]
+        while sum(len(w) + 1 for w in words) < size:
+            words.append(FILLER[(offset + len(words)) % len(FILLER)])
+        text = " ".join(words)
+        mime = (generation_config or {}).get("response_mime_type") if isinstance(
+            generation_config, dict) else getattr(generation_config, "response_mime_type", None)
+        if mime == "application/json":
+            text = json.dumps({
+                "transcript": text,
+                "summary": text[:300],
+                "dates": ["01.02.2024"],
+                "amounts": ["1 500 000 тенге"],
+                "names": ["Иванов И.И. — истец"],
+            }, ensure_ascii=False)
+        return text
+
+    def generate(self, contents, stream=False, generation_config=None, cached=None):
+        cfg = self.config
+        new_tokens = self.count_tokens(contents)
+        cached_tokens = 0
+        if cached is not None:
+            cache = self._live_cache(cached)
+            cached_tokens = cache.token_count
+            # Ответ зависит от префикса так же, как если бы он пришёл в промпте
+            contents = [*cache.contents, *(contents if isinstance(contents, list) else [contents])]
+        prompt_tokens = new_tokens + cached_tokens
+        with self._lock:
+            self.calls += 1
+        if self._over_quota(prompt_tokens):
+            raise QuotaError("Quota exceeded for requests per minute (fake)")
+        prefill = new_tokens / cfg.prefill_tokens_per_second if cfg.prefill_tokens_per_second else 0
+        time.sleep(cfg.latency + prefill)
+        if self._fails():
+            with self._lock:
+                self.failures += 1
+            raise QuotaError("Resource has been exhausted (fake)")
+
+        text = self._answer(contents, generation_config)
+        output_tokens = len(text) // CHARS_PER_TOKEN + 1
+        usage = types.SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+        if cached is not None:
+            with self._lock:
+                self.cache_hits += 1
+                self.cached_tokens += cached_tokens
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+        if not stream:
+            time.sleep(output_tokens / cfg.tokens_per_second)
+            return FakeResponse(text, usage)
+
+        step = max(1, cfg.chunk_tokens * CHARS_PER_TOKEN)
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        chunks = [FakeResponse(p) for p in pieces]
+        chunks[-1].usage_metadata = usage
+        return FakeStream(chunks, cfg.chunk_tokens / cfg.tokens_per_second)
+
+    def create_cache(self, model, contents=None, system_instruction=None, ttl=None,
+                     expire_time=None, **kwargs):
+        parts = list(contents or [])
+        if system_instruction:
+            parts.insert(0, system_instruction)
+        if self._over_quota(0):
+            raise QuotaError("Quota exceeded for requests per minute (fake cache)")
+        time.sleep(self.config.upload_latency)
+        with self._lock:
+            name = f"cachedContents/fake-{next(self._ids)}"
+            cache = FakeCachedContent(self, name, model, parts, self.count_tokens(parts))
+            cache._set_expiry(ttl, expire_time)
+            self.caches[name] = cache
+            self.caches_created += 1
+        return cache
+
+    def _live_cache(self, cached):
+        name = getattr(cached, "name", cached)
+        with self._lock:
+            cache = self.caches.get(name)
+            if cache is None or cache.expire_time <= datetime.now(timezone.utc):
+                raise NotFound(f"CachedContent not found (fake): {name}")
+            return cache
+
+    def delete_cache(self, name):
+        with self._lock:
+            if self.caches.pop(name, None) is None:
+                raise NotFound(f"CachedContent not found (fake): {name}")
+            self.caches_deleted += 1
+
+    def upload(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if self._over_quota(0):
+            raise QuotaError("Quota exceeded for requests per minute (fake upload)")
+        time.sleep(self.config.upload_latency)
+        if self._fails():
+            with self._lock:
+                self.failures += 1
+            raise QuotaError("Resource has been exhausted (fake upload)")
+        with self._lock:
+            self.uploads += 1
+            self.uploaded_bytes += len(data)
+            name = f"files/fake-{next(self._ids)}"
+            handle = FakeFile(
+                name, path, hashlib.sha256(data).hexdigest(), len(data),
+                self.config.processing_polls
+            )
+            self.files[name] = handle
+        return handle
+
+    def get(self, name):
+        with self._lock:
+            handle = self.files[name]
+            if handle._polls > 0:
+                handle._polls -= 1
+                if handle._polls == 0:
+                    handle.state = _State("ACTIVE")
+            return handle
+
+
+class FakeCachedContent:
+    """Кэш контекста: неизменная часть промпта, хранимая «на сервере» до expire_time."""
+
+    def __init__(self, backend, name, model, contents, token_count):
+        self._backend = backend
+        self.name = name
+        self.model = model
+        self.contents = contents
+        self.token_count = token_count
+        self.usage_metadata = types.SimpleNamespace(total_token_count=token_count)
+        self.expire_time = None
+
+    def _set_expiry(self, ttl=None, expire_time=None):
+        if expire_time is None:
+            ttl = ttl if isinstance(ttl, timedelta) else timedelta(seconds=ttl or 3600)
+            expire_time = datetime.now(timezone.utc) + ttl
+        self.expire_time = expire_time
+
+    def update(self, *, ttl=None, expire_time=None):
+        self._backend._live_cache(self.name)
+        self._set_expiry(ttl, expire_time)
+
+    def delete(self):
+        self._backend.delete_cache(self.name)
+
+
+def _build_module(backend):
+    module = types.ModuleType("google.generativeai")
+    module.__fake__ = True
+    module.backend = backend
+
+    class GenerativeModel:
+        def __init__(self, model_name="models/fake", **kwargs):
+            self.model_name = model_name
+            self.cached_content = None
+
+        @classmethod
+        def from_cached_content(cls, cached_content, **kwargs):
+            cache = backend._live_cache(cached_content)
+            model = cls(cache.model)
+            model.cached_content = cache.name
+            return model
+
+        def generate_content(self, contents, stream=False, generation_config=None, **kwargs):
+            return backend.generate(contents, stream=stream, generation_config=generation_config,
+                                    cached=self.cached_content)
+
+        def count_tokens(self, contents):
+            return types.SimpleNamespace(total_tokens=backend.count_tokens(contents))
+
+    module.GenerativeModel = GenerativeModel
+    module.configure = lambda **kwargs: None
+    module.upload_file = lambda path, **kwargs: backend.upload(path)
+    module.get_file = backend.get
+    module.delete_file = lambda name, **kwargs: backend.files.pop(
+        getattr(name, "name", name), None)
+
+    class CachedContent:
+        create = staticmethod(backend.create_cache)
+
+        @staticmethod
+        def get(name):
+            return backend._live_cache(name)
+
+    module.caching = types.SimpleNamespace(CachedContent=CachedContent)
+    return module
+
+
+def install(config=None):
+    """Подменяет google.generativeai фейком и возвращает FakeBackend.
+
+    Вызывать до импорта модулей приложения.
+    """
+    backend = FakeBackend(config)
+    module = _build_module(backend)
+    google = sys.modules.get("google")
+    if google is None:
+        try:
+            import google  # noqa: F401 — пакет-пространство имён google
+        except ImportError:
+            google = types.ModuleType("google")
+            google.__path__ = []
+            sys.modules["google"] = google
+        google = sys.modules["google"]
+    sys.modules["google.generativeai"] = module
+    google.generativeai = module
+    return backend
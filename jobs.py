@@ -0,0 +1,130 @@
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from cache import content_hash
+from ratelimit import describe_error
+
+JOB_WORKERS = 4
+# Как часто частичный результат пишется в базу при потоковой генерации
+PARTIAL_FLUSH_SECONDS = 0.5
+# Завершённые задачи хранятся сутки — за это время сессия забирает результат;
+# очистка запускается не чаще раза в PRUNE_INTERVAL_SECONDS
+JOB_KEEP_DAYS = 1
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+def job_key(kind, *parts):
+    """Хэш входа задачи: одинаковые запросы получают одну и ту же задачу."""
+    raw = json.dumps([kind, *parts], sort_keys=True, ensure_ascii=False, default=str)
+    return content_hash(raw)
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _alive(owner):
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # Задачи с других машин не трогаем
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobContext:
+    """То, что получает функция задачи: отчёт о ходе работы и частичный результат."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last_flush = 0.0
+
+    def progress(self, fraction, message=""):
+        db.update_job(self.job_id, progress=float(fraction), message=message)
+
+    def partial(self, text, force=False):
+        """Сохраняет частичный результат не чаще раза в PARTIAL_FLUSH_SECONDS."""
+        now = time.monotonic()
+        if force or now - self._last_flush >= PARTIAL_FLUSH_SECONDS:
+            db.update_job(self.job_id, partial=text)
+            self._last_flush = now
+
+    def stream(self, model, contents, **kwargs):
+        """Потоковая генерация с сохранением частичного текста; возвращает итоговый текст."""
+        parts = []
+        for chunk in model.generate_content(contents, stream=True, **kwargs):
+            try:
+                parts.append(chunk.text)
+            except ValueError:
+                continue
+            self.partial("".join(parts))
+        text = "".join(parts)
+        self.partial(text, force=True)
+        return text
+
+
+class JobRunner:
+    """Пул фоновых задач: состояние и результаты хранятся в таблице jobs.
+
+    fn(ctx, *args) выполняется в рабочем потоке и должна вернуть строку;
+    Streamlit из неё вызывать нельзя — модель и прочие ресурсы передаются аргументами.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.owner = _owner()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._running = set()
+        self._last_prune = 0.0
+        self._recover()
+
+    def _recover(self):
+        """Задачи, чей процесс умер, помечаются упавшими, чтобы их можно было перезапустить."""
+        for job in db.list_active_jobs():
+            if job["owner"] == self.owner or not _alive(job["owner"]):
+                db.update_job(job["id"], status="failed", error="Задача прервана перезапуском сервера")
+
+    def submit(self, kind, key, fn, *args):
+        """Ставит задачу в очередь или возвращает ID уже существующей с тем же key."""
+        self._prune()
+        job_id, created = db.claim_job(kind, key, owner=self.owner)
+        if created:
+            with self._lock:
+                self._running.add(job_id)
+            self._pool.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _prune(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._last_prune and now - self._last_prune < PRUNE_INTERVAL_SECONDS:
+                return
+            self._last_prune = now
+        db.prune_jobs(JOB_KEEP_DAYS)
+
+    def _run(self, job_id, fn, args):
+        ctx = JobContext(job_id)
+        try:
+            db.update_job(job_id, status="running")
+            result = fn(ctx, *args)
+            db.update_job(job_id, status="done", progress=1.0, result=result)
+        except Exception as e:
+            db.update_job(job_id, status="failed", error=describe_error(e))
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def pending(self):
+        """Число задач этого процесса, которые ещё выполняются."""
+        with self._lock:
+            return len(self._running)
@@ -0,0 +1,210 @@
+import base64
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from cache import CACHE_DB_PATH
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _normalize_part(part):
+    """Приводит часть промпта к стабильному представлению для ключа кэша."""
+    if isinstance(part, str):
+        return ["text", _SPACES_RE.sub(" ", part).strip()]
+    if isinstance(part, (bytes, bytearray)):
+        return ["bytes", hashlib.sha256(part).hexdigest()]
+    if isinstance(part, dict):
+        data = part.get("data")
+        if isinstance(data, (bytes, bytearray)):
+            return ["blob", part.get("mime_type", ""), hashlib.sha256(data).hexdigest()]
+        return ["dict", json.dumps(part, sort_keys=True, ensure_ascii=False, default=str)]
+    # Файл Gemini: адресуем по хэшу содержимого, а не по имени загрузки
+    digest = getattr(part, "sha256_hash", None)
+    if digest:
+        if isinstance(digest, bytes):
+            digest = base64.b64encode(digest).decode("ascii")
+        return ["file", str(digest)]
+    name = getattr(part, "name", None)
+    if name:
+        return ["file", str(name)]
+    return ["repr", repr(part)]
+
+
+def cache_key(model_name, contents, **kwargs):
+    """Ключ кэша: хэш имени модели, нормализованных частей промпта и параметров."""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    payload = {
+        "model": model_name,
+        "parts": [_normalize_part(p) for p in parts],
+        "kwargs": json.loads(json.dumps(kwargs, sort_keys=True, default=str)),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    """Ответ из кэша с тем же интерфейсом, что у ответа Gemini (text и итерация)."""
+
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+    def __iter__(self):
+        yield self
+
+
+class ResponseCache:
+    """Кэш ответов модели в SQLite с TTL и вытеснением давно не использованных записей."""
+
+    def __init__(self, path=CACHE_DB_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                module TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses (accessed_at)"
+        )
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            conn.close()
+            return None
+        if row[1] + self.ttl < now:
+            conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+            conn.commit()
+            conn.close()
+            return None
+        conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        conn.close()
+        return row[0]
+
+    def set(self, key, model, module, response):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_responses "
+            "(key, model, module, response, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model, module, response, size, now, now)
+        )
+        self._evict(conn, now)
+        conn.commit()
+        conn.close()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM llm_responses ORDER BY accessed_at"
+        ).fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM llm_responses WHERE key = ?", stale)
+
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+
+    def stats(self):
+        """Попадания, промахи и средняя задержка в каждом случае."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "avg_hit_seconds": self.hit_seconds / self.hits if self.hits else 0.0,
+                "avg_miss_seconds": self.miss_seconds / self.misses if self.misses else 0.0,
+            }
+
+
+class CachedModel:
+    """Обёртка над GenerativeModel: одинаковые запросы отдаются из ResponseCache."""
+
+    def __init__(self, model, cache, module, model_name=None):
+        self._model = model
+        self._cache = cache
+        self.module = module
+        self.model_name = model_name or getattr(model, "model_name", "")
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        started = time.monotonic()
+        key = cache_key(self.model_name, contents, **kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.record(True, time.monotonic() - started)
+            return CachedResponse(cached)
+
+        if stream:
+            return self._stream_and_store(key, contents, started, **kwargs)
+        res = self._model.generate_content(contents, **kwargs)
+        self._cache.record(False, time.monotonic() - started)
+        try:
+            text = res.text
+        except ValueError:
+            return res
+        if text:
+            self._cache.set(key, self.model_name, self.module, text)
+        return res
+
+    def _stream_and_store(self, key, contents, started, **kwargs):
+        """Пропускает поток ответа насквозь; в кэш попадает только полностью дочитанный
+        непустой ответ без заблокированных частей."""
+        parts, complete = [], True
+        for chunk in self._model.generate_content(contents, stream=True, **kwargs):
+            try:
+                parts.append(chunk.text)
+            except ValueError:
+                complete = False
+            yield chunk
+        self._cache.record(False, time.monotonic() - started)
+        text = "".join(parts)
+        if complete and text:
+            self._cache.set(key, self.model_name, self.module, text)
@@ -1,10 +1,238 @@
 import streamlit as st
-import google.generativeai as genai
-import time
+import json
 import os
 
-from utils import get_model, upload_audio_to_gemini, create_docx, cleanup_temp_files, configure_genai
-from db import save_case
+from audio import prepared_size, preprocess_audio
+from cache import content_hash
+from jobs import job_key
+from ratelimit import describe_error
+from spool import SpoolQuotaError, current_session_id, get_spool, session_text, set_session_text
+from telemetry import module_scope
+from utils import (
+    get_model, get_upload_registry, docx_download_button, configure_genai, get_job_runner,
+    follow_job, TRANSCRIBE_PROMPT_VERSION
+)
+from db import get_transcript, save_case, save_transcript
+
+
+BRIEF_PROMPT = """
+Роль: Юрист Республики Казахстан.
+Задача: Составь сводный отчет по всем записям.
+Структура:
+1. СУТЬ СИТУАЦИИ.
+2. ФАКТЫ (Даты, Суммы, Имена).
+3. ПРАВОВАЯ ОЦЕНКА (ссылки на ГК/ГПК РК).
+4. ЧТО УТОЧНИТЬ У КЛИЕНТА.
+5. ПЛАН ДЕЙСТВИЙ.
+"""
+
+EXTRACT_PROMPT = """
+Роль: Юрист Республики Казахстан.
+Задача: Расшифруй запись и извлеки из неё факты.
+Ответь строго JSON-объектом с полями:
+"transcript" — полный текст записи,
+"summary" — суть записи в 5–10 предложениях,
+"dates" — список дат и сроков,
+"amounts" — список сумм,
+"names" — список имён, организаций и их ролей.
+"""
+# Расшифровки из EXTRACT_PROMPT хранятся под своей версией, отдельно от расшифровок
+# transcribe_audio: при изменении EXTRACT_PROMPT нужно увеличить версию
+EVIDENCE_PROMPT_VERSION = "evidence-1"
+
+EXTRACT_TEXT_PROMPT = """
+Роль: Юрист Республики Казахстан.
+Задача: Извлеки факты из расшифровки записи ниже.
+Ответь строго JSON-объектом с полями:
+"summary" — суть записи в 5–10 предложениях,
+"dates" — список дат и сроков,
+"amounts" — список сумм,
+"names" — список имён, организаций и их ролей.
+"""
+
+MERGE_PROMPT = """
+Роль: Юрист Республики Казахстан.
+Задача: Составь сводный отчет по делу на основе выжимок из записей ниже.
+Структура:
+1. СУТЬ СИТУАЦИИ.
+2. ФАКТЫ (Даты, Суммы, Имена).
+3. ПРАВОВАЯ ОЦЕНКА (ссылки на ГК/ГПК РК).
+4. ЧТО УТОЧНИТЬ У КЛИЕНТА.
+5. ПЛАН ДЕЙСТВИЙ.
+"""
+
+RECORD_FIELDS = ("transcript", "summary", "dates", "amounts", "names")
+
+
+def _parse_record(text):
+    """Разбирает JSON-ответ модели; если JSON не получился — весь ответ считается расшифровкой."""
+    raw = text.strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`")
+        raw = raw[raw.find("\n") + 1:] if "\n" in raw else raw
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        data = {"transcript": text}
+    if not isinstance(data, dict):
+        data = {"transcript": text}
+    record = {}
+    for field in RECORD_FIELDS:
+        value = data.get(field)
+        if field in ("transcript", "summary"):
+            record[field] = value if isinstance(value, str) else ""
+        else:
+            record[field] = [str(v) for v in value] if isinstance(value, list) else []
+    return record
+
+
+def extract_evidence_record(model, upl, name):
+    """Расшифровывает одну запись и извлекает факты (один вызов модели на файл)."""
+    res = model.generate_content(
+        [EXTRACT_PROMPT, upl],
+        generation_config={"response_mime_type": "application/json"}
+    )
+    record = _parse_record(res.text)
+    record["file"] = name
+    return record
+
+
+def extract_transcript_record(model, transcript, name):
+    """Извлекает факты из уже готовой расшифровки — без загрузки аудио."""
+    res = model.generate_content(
+        f"{EXTRACT_TEXT_PROMPT}\nРасшифровка:\n{transcript}",
+        generation_config={"response_mime_type": "application/json"}
+    )
+    record = _parse_record(res.text)
+    record["transcript"] = transcript
+    record["file"] = name
+    return record
+
+
+def build_merge_prompt(records):
+    """Собирает текстовый промпт сводки из сохранённых выжимок."""
+    parts = [MERGE_PROMPT]
+    for i, r in enumerate(records, 1):
+        parts.append(
+            f"--- Запись {i}: {r.get('file', '')} ---\n"
+            f"Кратко: {r['summary'] or r['transcript']}\n"
+            f"Даты: {'; '.join(r['dates']) or '—'}\n"
+            f"Суммы: {'; '.join(r['amounts']) or '—'}\n"
+            f"Имена: {'; '.join(r['names']) or '—'}"
+        )
+    return "\n".join(parts)
+
+
+def merge_brief(model, records):
+    """Строит сводку из выжимок без повторной отправки аудио."""
+    return model.generate_content(build_merge_prompt(records)).text
+
+
+def run_brief_job(job, model, registry, paths, labels, known_records, incremental, sources=None,
+                  hold=None):
+    """Фоновая задача сводки по делу.
+
+    sources — хэш исходной записи для каждого пути (части одной записи делят хэш);
+    hold — (сессия, токен) из SpoolManager.hold: снимается, когда файлы больше не нужны.
+    Возвращает JSON: сводка, новые выжимки по путям файлов и ошибки загрузки.
+    """
+    try:
+        with module_scope("Анализатор"):
+            return _build_brief(job, model, registry, paths, labels, known_records, incremental,
+                                sources or {})
+    finally:
+        if hold is not None:
+            get_spool().release(*hold)
+
+
+def _recordings(paths, sources):
+    """Пути, сгруппированные по хэшу исходной записи, в порядке добавления."""
+    groups = {}
+    for path in paths:
+        if path in sources:
+            groups.setdefault(sources[path], []).append(path)
+    return groups
+
+
+def _find_transcript(audio_hash):
+    """Готовая расшифровка записи: из transcribe_audio любого модуля, иначе из прошлого
+    разбора улик."""
+    for version in (TRANSCRIBE_PROMPT_VERSION, EVIDENCE_PROMPT_VERSION):
+        transcript = get_transcript(audio_hash, version)
+        if transcript is not None:
+            return transcript
+    return None
+
+
+def _build_brief(job, model, registry, paths, labels, known_records, incremental, sources):
+    pending = [p for p in paths if p not in known_records] if incremental else list(paths)
+    records = {}
+    if incremental:
+        # Записи, ни одна часть которых ещё не разобрана
+        fresh = {
+            audio_hash: parts for audio_hash, parts in _recordings(paths, sources).items()
+            if not any(p in known_records for p in parts)
+        }
+        # Запись, уже расшифрованная в любом модуле, разбирается по тексту — без загрузки аудио
+        for audio_hash, parts in fresh.items():
+            transcript = _find_transcript(audio_hash)
+            if transcript is None:
+                continue
+            label = labels.get(parts[0], os.path.basename(parts[0]))
+            job.progress(0.0, f"Разбираю готовую расшифровку: {label}")
+            records[parts[0]] = extract_transcript_record(model, transcript, label)
+            # Остальные части записи уже вошли в эту расшифровку
+            records.update(dict.fromkeys(parts[1:]))
+        to_upload = [p for p in pending if p not in records]
+        job.progress(0.0, "Загружаю записи...")
+        handles, failed = registry.get_many(to_upload)
+        for i, (path, upl) in enumerate(zip(to_upload, handles)):
+            if upl is None:
+                continue
+            label = labels.get(path, os.path.basename(path))
+            job.progress(i / (len(to_upload) + 1), f"Расшифровываю: {label}")
+            records[path] = extract_evidence_record(model, upl, label)
+        # Расшифровка всей записи сохраняется под хэшем исходного файла и версией EXTRACT_PROMPT
+        for audio_hash, parts in fresh.items():
+            if parts[0] not in to_upload or not all(records.get(p) for p in parts):
+                continue
+            text = "\n".join(records[p]["transcript"] for p in parts).strip()
+            if text:
+                save_transcript(audio_hash, EVIDENCE_PROMPT_VERSION, "Анализатор", text)
+        all_records = {**known_records, **records}
+        case_records = [all_records[p] for p in paths if all_records.get(p)]
+        if not case_records:
+            raise RuntimeError("ни одну запись не удалось обработать")
+        job.progress(len(pending) / (len(pending) + 1), "Составляю сводку...")
+        brief = job.stream(model, build_merge_prompt(case_records))
+    else:
+        job.progress(0.0, "Загружаю записи...")
+        handles, failed = registry.get_many(pending)
+        files_gemini = [h for h in handles if h is not None]
+        if not files_gemini:
+            raise RuntimeError("ни один файл не удалось загрузить")
+        job.progress(0.5, "Составляю сводку...")
+        brief = job.stream(model, [BRIEF_PROMPT] + files_gemini)
+    return json.dumps({
+        "brief": brief,
+        "records": records,
+        "failed": {path: describe_error(err) for path, err in failed.items()},
+    }, ensure_ascii=False)
+
+
+def _case_records():
+    """Выжимки записей дела по путям файлов (хранятся как текст сессии)."""
+    return json.loads(session_text("case_records", "{}"))
+
+
+def _reset_case(spool, session_id):
+    spool.remove_files(session_id, st.session_state.case_files)
+    st.session_state.case_files = []
+    st.session_state.case_labels = {}
+    st.session_state.case_sources = {}
+    st.session_state.case_recordings = 0
+    set_session_text("case_records", None)
+    set_session_text("brief_text", None)
 
 
 def render_audio_analyzer():
@@ -13,8 +241,16 @@ def render_audio_analyzer():
 
     if 'case_files' not in st.session_state:
         st.session_state.case_files = []
-    if 'brief_text' not in st.session_state:
-        st.session_state.brief_text = ""
+    if 'case_labels' not in st.session_state:
+        st.session_state.case_labels = {}
+    if 'case_sources' not in st.session_state:
+        st.session_state.case_sources = {}
+
+    spool, session_id = get_spool(), current_session_id()
+    # Записи простаивавшей сессии могли быть удалены вместе с её временным каталогом
+    if any(not spool.has_file(session_id, p) for p in st.session_state.case_files):
+        _reset_case(spool, session_id)
+        st.warning("Записи дела удалены после долгого простоя. Добавьте их заново.")
 
     col_left, col_right = st.columns([1, 1.2], gap="large")
 
@@ -39,71 +275,113 @@ def render_audio_analyzer():
                     new_source = file_val
 
             st.markdown("---")
+            incremental = st.toggle(
+                "Инкрементальный режим", value=True,
+                help="Каждая запись расшифровывается один раз, сводка собирается из выжимок."
+            )
 
             if st.button("Добавить в дело", use_container_width=True):
                 if new_source:
-                    ext = new_source.name.split('.')[-1] if hasattr(new_source, 'name') else 'wav'
-                    fname = f"evid_{int(time.time())}.{ext}"
-                    with open(fname, "wb") as f:
-                        f.write(new_source.getbuffer())
+                    name = getattr(new_source, 'name', None) or 'voice.wav'
+                    data = bytes(new_source.getbuffer())
+                    try:
+                        spool.reserve(session_id, prepared_size(data, name))
+                    except SpoolQuotaError as e:
+                        st.error(f"Запись не добавлена: {e}")
+                        st.stop()
+                    prepared = preprocess_audio(
+                        data, name, tmp_dir=spool.session_dir(session_id), prefix="evid_"
+                    )
+                    spool.add_files(session_id, prepared.paths)
+                    if not prepared.paths:
+                        st.warning("В записи не найдено речи.")
+                        st.stop()
 
-                    st.session_state.case_files.append(fname)
+                    number = st.session_state.get('case_recordings', 0) + 1
+                    st.session_state.case_recordings = number
+                    # Расшифровки хранятся по хэшу исходной записи — общему для всех модулей
+                    audio_hash = content_hash(data)
+                    for i, path in enumerate(prepared.paths, 1):
+                        label = f"Запись {number}"
+                        if len(prepared.paths) > 1:
+                            label += f" (ч. {i})"
+                        st.session_state.case_labels[path] = label
+                        st.session_state.case_sources[path] = audio_hash
+                        st.session_state.case_files.append(path)
                     st.toast("Файл добавлен к делу!")
+                    if prepared.bytes_saved:
+                        st.caption(
+                            f"Запись сжата: {prepared.original_bytes // 1024} КБ → "
+                            f"{prepared.output_bytes // 1024} КБ"
+                        )
 
-                    with st.spinner("ИИ анализирует материалы..."):
-                        try:
-                            configure_genai()
-                            files_gemini = []
-                            for p in st.session_state.case_files:
-                                upl = upload_audio_to_gemini(p)
-                                files_gemini.append(upl)
-
-                            model = get_model()
-                            prompt = """
-                            Роль: Юрист Республики Казахстан.
-                            Задача: Составь сводный отчет по всем записям.
-                            Структура:
-                            1. СУТЬ СИТУАЦИИ.
-                            2. ФАКТЫ (Даты, Суммы, Имена).
-                            3. ПРАВОВАЯ ОЦЕНКА (ссылки на ГК/ГПК РК).
-                            4. ЧТО УТОЧНИТЬ У КЛИЕНТА.
-                            5. ПЛАН ДЕЙСТВИЙ.
-                            """
-                            res = model.generate_content([prompt] + files_gemini)
-                            st.session_state.brief_text = res.text
-                        except Exception as e:
-                            st.error(f"Ошибка при анализе: {e}")
+                    paths = list(st.session_state.case_files)
+                    known = _case_records() if incremental else {}
+                    key = job_key("analyzer", paths, sorted(known), incremental)
+                    # Пока задача в очереди или загружает записи, каталог сессии не вытесняется
+                    spool.hold(session_id, key)
+                    try:
+                        configure_genai()
+                        st.session_state.brief_job = get_job_runner().submit(
+                            "analyzer", key, run_brief_job,
+                            get_model(module="analyzer"), get_upload_registry(), paths,
+                            dict(st.session_state.case_labels), known, incremental,
+                            dict(st.session_state.case_sources), (session_id, key)
+                        )
+                    except Exception as e:
+                        spool.release(session_id, key)
+                        st.error(f"Ошибка при анализе: {describe_error(e)}")
                 else:
                     st.warning("Сначала выберите файл или запишите голос.")
 
             if st.session_state.case_files:
                 st.write(f"В деле файлов: **{len(st.session_state.case_files)}**")
                 if st.button("Сбросить всё", type="secondary"):
-                    cleanup_temp_files(st.session_state.case_files)
-                    st.session_state.case_files = []
-                    st.session_state.brief_text = ""
+                    _reset_case(spool, session_id)
                     st.rerun()
 
     with col_right:
+        result = follow_job("brief_job")
+        if result is not None:
+            data = json.loads(result)
+            if data["records"]:
+                set_session_text("case_records", json.dumps(
+                    {**_case_records(), **data["records"]}, ensure_ascii=False
+                ))
+            set_session_text("brief_text", data["brief"])
+            for path, err in data["failed"].items():
+                label = st.session_state.case_labels.get(path, os.path.basename(path))
+                st.warning(f"Файл '{label}' не загружен: {err}")
+            stats = get_upload_registry().stats()
+            st.caption(f"Загрузки: из кэша {stats['hits']}, новых {stats['misses']}")
+
         with st.container(border=True):
             st.markdown("### 2. Сводка по делу")
-            if st.session_state.brief_text:
-                st.markdown(st.session_state.brief_text)
+            brief_text = session_text("brief_text")
+            if brief_text:
+                st.markdown(brief_text)
+                case_records = _case_records()
+                if case_records:
+                    with st.expander("Расшифровки записей"):
+                        for path in st.session_state.case_files:
+                            record = case_records.get(path)
+                            if record:
+                                st.markdown(f"**{record['file']}**")
+                                st.write(record["transcript"] or record["summary"])
                 st.markdown("---")
 
                 col_save, col_download = st.columns(2)
                 with col_download:
-                    docx = create_docx(st.session_state.brief_text, "Сводка (РК)")
-                    st.download_button(
-                        "Скачать Сводку (.docx)", docx,
-                        "Brief_KZ.docx", use_container_width=True
+                    docx_download_button(
+                        "Скачать Сводку (.docx)", brief_text,
+                        "Сводка (РК)", "Brief_KZ.docx"
                     )
                 with col_save:
                     if st.button("Сохранить в историю", use_container_width=True, key="save_analyzer"):
                         save_case(
                             title=f"Анализ дела ({len(st.session_state.case_files)} файлов)",
                             module="Анализатор",
-                            content=st.session_state.brief_text
+                            content=brief_text
                         )
                         st.toast("Сохранено в историю!")
             else:
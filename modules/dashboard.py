@@ -0,0 +1,116 @@
+import streamlit as st
+
+from db import list_telemetry, telemetry_by_module, slowest_calls, prune_telemetry
+from ratelimit import get_limiter
+from spool import MB, get_spool
+from telemetry import latency_summary
+
+# Сколько дней хранить замеры
+TELEMETRY_KEEP_DAYS = 30
+PERIODS = {"Сутки": 1, "Неделя": 7, "Месяц": 30}
+SLOWEST_LIMIT = 15
+# Перцентили считаются по последним вызовам за период
+LATENCY_SAMPLE = 5000
+OPERATION_NAMES = {
+    "generate": "Генерация", "upload": "Загрузка", "transcribe": "Транскрибация",
+    "turn": "Ход тренажёра", "cache": "Кэш контекста",
+}
+BREAKER_STATES = {"closed": "Норма", "open": "Запросы отклоняются", "half-open": "Пробный запрос"}
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000)
+
+
+def render_performance_dashboard():
+    st.markdown("## Производительность")
+    st.caption("Задержки, расход токенов и ошибки обращений к Gemini.")
+
+    prune_telemetry(TELEMETRY_KEEP_DAYS)
+    period = st.selectbox("Период", list(PERIODS), index=1)
+    days = PERIODS[period]
+
+    records = list_telemetry(days=days, limit=LATENCY_SAMPLE)
+    if not records:
+        st.info("За выбранный период обращений к модели не было.")
+        return
+
+    by_module = telemetry_by_module(days=days)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Вызовов", sum(m["calls"] for m in by_module))
+    col2.metric("Ошибок", sum(m["errors"] for m in by_module))
+    col3.metric("Токенов на входе", sum(m["input_tokens"] for m in by_module))
+    col4.metric("Токенов на выходе", sum(m["output_tokens"] for m in by_module))
+
+    with st.container(border=True):
+        st.markdown("### Очередь к Gemini")
+        st.caption("С момента запуска сервера: ожидание квоты, повторы и отказы при серии ошибок.")
+        queue = get_limiter().snapshot()
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("В очереди", queue["queued"])
+        col2.metric("Выполняется", queue["active"])
+        col3.metric("Повторов", queue["retries"])
+        col4.metric("Отклонено", queue["rejected"])
+        col5.metric("Состояние", BREAKER_STATES[queue["breaker"]])
+
+    with st.container(border=True):
+        st.markdown("### Временные данные сессий")
+        spool = get_spool()
+        st.caption(
+            f"Записи и тексты открытых сессий. Лимиты: диск {spool.total_bytes // MB} МБ "
+            f"(на сессию {spool.session_bytes // MB} МБ), память {spool.memory_bytes // MB} МБ."
+        )
+        usage = spool.stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Сессий", usage["sessions"])
+        col2.metric("На диске, МБ", f"{usage['disk_bytes'] / MB:.1f}")
+        col3.metric("Тексты в памяти, МБ", f"{usage['memory_bytes'] / MB:.1f}")
+        col4.metric("Удалено простаивающих", usage["evicted"])
+
+    with st.container(border=True):
+        st.markdown("### Задержка, мс")
+        if len(records) == LATENCY_SAMPLE:
+            st.caption(f"По последним {LATENCY_SAMPLE} вызовам.")
+        st.dataframe([{
+            "Операция": OPERATION_NAMES.get(s["operation"], s["operation"]),
+            "Вызовов": s["calls"],
+            "Ошибок": s["errors"],
+            "p50": _ms(s["p50"]),
+            "p95": _ms(s["p95"]),
+            "Первый фрагмент, p50": _ms(s["first_token_p50"]),
+            "Загрузка, p50": _ms(s["upload_p50"]),
+            "Ожидание, p50": _ms(s["wait_p50"]),
+            "Генерация, p50": _ms(s["generate_p50"]),
+        } for s in latency_summary(records)], hide_index=True, use_container_width=True)
+
+    with st.container(border=True):
+        st.markdown("### Расход по модулям")
+        st.bar_chart(
+            [{"Модуль": m["module"], "Вход": m["input_tokens"], "Выход": m["output_tokens"]}
+             for m in by_module],
+            x="Модуль", y=["Вход", "Выход"], stack=True
+        )
+        st.dataframe([{
+            "Модуль": m["module"],
+            "Вызовов": m["calls"],
+            "Ошибок": m["errors"],
+            "Токенов на входе": m["input_tokens"],
+            "Из кэша контекста": m["cached_tokens"],
+            "Токенов на выходе": m["output_tokens"],
+            "Загружено, КБ": m["bytes_uploaded"] // 1024,
+        } for m in by_module], hide_index=True, use_container_width=True)
+
+    with st.container(border=True):
+        st.markdown("### Самые долгие вызовы")
+        st.dataframe([{
+            "Время": r["created_at"],
+            "Модуль": r["module"],
+            "Операция": OPERATION_NAMES.get(r["operation"], r["operation"]),
+            "Всего, мс": _ms(r["total_seconds"]),
+            "Загрузка, мс": _ms(r["upload_seconds"]),
+            "Ожидание, мс": _ms(r["wait_seconds"]),
+            "Генерация, мс": _ms(r["generate_seconds"]),
+            "Токенов": r["input_tokens"] + r["output_tokens"],
+            "Ошибка": r["error"],
+        } for r in slowest_calls(days=days, limit=SLOWEST_LIMIT)],
+            hide_index=True, use_container_width=True)
@@ -1,7 +1,37 @@
+import time
+
 import streamlit as st
 
-from utils import get_model, extract_text_from_file, create_docx, transcribe_audio
+from cache import content_hash
+from chunking import estimate_tokens
+from extraction import ExtractionError, chunks_to_text
+from jobs import job_key
+from ratelimit import describe_error
+from utils import (
+    get_model, extract_chunks_cached, docx_download_button, transcribe_audio, get_extraction_cache,
+    get_response_cache, get_job_runner, follow_job
+)
 from db import save_case
+from packing import pack_documents
+from risk_analysis import CHUNK_TOKEN_BUDGET, analyze_chunked, build_analysis_prompt
+from spool import session_text, set_session_text
+
+
+def run_analysis_job(job, model, instr, documents, chunked, budget, sources=None):
+    """Фоновая задача анализа: documents — пары (имя, list[Chunk]), sources — фрагменты §N упаковки."""
+    if chunked:
+        return analyze_chunked(
+            model, instr, documents, budget=budget,
+            on_progress=lambda done, total: job.progress(
+                done / total, f"Проанализировано блоков: {done} из {total}"
+            ),
+            merge_fn=lambda prompt: job.stream(model, prompt),
+            sources=sources
+        )
+    job.progress(0.0, "Составляю отчёт...")
+    return job.stream(model, build_analysis_prompt(
+        instr, [(name, chunks_to_text(chunks)) for name, chunks in documents]
+    ))
 
 
 def render_doc_analyzer():
@@ -23,61 +53,110 @@ def render_doc_analyzer():
                 accept_multiple_files=True
             )
 
-    if 'doc_res' not in st.session_state:
-        st.session_state.doc_res = None
+    if 'doc_packing' not in st.session_state:
+        st.session_state.doc_packing = None
 
     if files:
         # Валидация файлов
         valid_files = []
-        for f in files:
-            text = extract_text_from_file(f)
-            if text and "Файл пуст" not in text and "Ошибка" not in text:
-                valid_files.append((f, text))
+        for f, result in zip(files, extract_chunks_cached(files)):
+            if isinstance(result, ExtractionError):
+                st.warning(f"Файл '{f.name}' пропущен: {result}")
             else:
-                st.warning(f"Файл '{f.name}' пуст или не читается — пропущен.")
+                valid_files.append((f, result))
+        stats = get_extraction_cache().stats()
+        total_tokens = sum(estimate_tokens(c.text) for _, chunks in valid_files for c in chunks)
+        st.caption(
+            f"Кэш текста: попаданий {stats['hit_rate']:.0%} • "
+            f"объём документов: ~{total_tokens} токенов"
+        )
+
+        with st.expander("Настройки анализа"):
+            chunked = st.toggle(
+                "Поблочный анализ", value=total_tokens > CHUNK_TOKEN_BUDGET,
+                help="Большие наборы документов анализируются по частям параллельно."
+            )
+            budget = st.number_input(
+                "Токенов на блок", min_value=2000, max_value=200000,
+                value=CHUNK_TOKEN_BUDGET, step=2000
+            )
+            dedup = st.toggle(
+                "Сжимать повторы", value=True,
+                help="Одинаковые и почти одинаковые фрагменты (версии одного договора, "
+                     "типовые условия) отправляются модели один раз."
+            )
+            use_cache = not st.checkbox(
+                "Не использовать кэш ответов", value=False,
+                help="Заново запросить модель, даже если такой же анализ уже выполнялся."
+            )
+            llm_stats = get_response_cache().stats()
+            st.caption(
+                f"Кэш ответов: попаданий {llm_stats['hits']}, промахов {llm_stats['misses']}"
+            )
 
         if valid_files and st.button("Начать Анализ", use_container_width=True):
-            with st.spinner("Читаю документы и сверяю с законами РК..."):
+            with st.spinner("Готовлю анализ..."):
                 try:
                     instr = "Общий анализ рисков."
                     if ctx:
-                        instr = transcribe_audio(ctx)
-
-                    full_text = ""
-                    for f, text in valid_files:
-                        full_text += f"\n--- {f.name} ---\n{text}\n"
-
-                    model = get_model()
-                    res = model.generate_content(
-                        f"Инструкция: {instr}\n"
-                        f"Документы:\n{full_text}\n\n"
-                        f"Сделай анализ по законам РК:\n"
-                        f"1. Сильные стороны документа\n"
-                        f"2. Риски и слабые места\n"
-                        f"3. Вывод и рекомендации"
+                        instr = transcribe_audio(ctx, module="Документы")
+
+                    documents = [(f.name, chunks) for f, chunks in valid_files]
+                    st.session_state.doc_packing = None
+                    sources = None
+                    if dedup:
+                        packed = pack_documents(documents)
+                        if chunked:
+                            packed.count_chunked(int(budget), documents)
+                        if packed.shorter:
+                            documents, sources = packed.documents, packed.sources
+                            instr = packed.instruction(instr)
+                            st.session_state.doc_packing = packed.stats
+
+                    model = get_model(module="documents", use_cache=use_cache)
+                    key = job_key(
+                        "documents", instr, [content_hash(f.getvalue()) for f, _ in valid_files],
+                        chunked, int(budget), dedup,
+                        # Без кэша ответов каждый запуск — новая задача
+                        use_cache or time.time()
                     )
-                    st.session_state.doc_res = res.text
+                    st.session_state.doc_job = get_job_runner().submit(
+                        "documents", key, run_analysis_job, model, instr,
+                        documents, chunked, int(budget), sources
+                    )
+                    set_session_text("doc_res", None)
                 except Exception as e:
-                    st.error(f"Ошибка при анализе: {e}")
+                    st.error(f"Ошибка при анализе: {describe_error(e)}")
+
+    result = follow_job("doc_job")
+    if result is not None:
+        set_session_text("doc_res", result)
 
-    if st.session_state.doc_res:
+    doc_res = session_text("doc_res")
+    if doc_res:
         with st.container(border=True):
             st.markdown("### Результат")
-            st.markdown(st.session_state.doc_res)
+            packing = st.session_state.doc_packing
+            if packing and packing.saved_tokens > 0:
+                st.caption(
+                    f"Повторы в документах: точных копий {packing.exact}, с правками "
+                    f"{packing.near}; промпт короче на ~{packing.saved_tokens} токенов "
+                    f"({packing.saved_share:.0%})"
+                )
+            st.markdown(doc_res)
             st.markdown("---")
 
             col_save, col_download = st.columns(2)
             with col_download:
-                docx = create_docx(st.session_state.doc_res, "Анализ")
-                st.download_button(
-                    "Скачать Отчет (.docx)", docx,
-                    "Doc_Analysis.docx", use_container_width=True
+                docx_download_button(
+                    "Скачать Отчет (.docx)", doc_res,
+                    "Анализ", "Doc_Analysis.docx"
                 )
             with col_save:
                 if st.button("Сохранить в историю", use_container_width=True, key="save_docs"):
                     save_case(
                         title="Анализ документов",
                         module="Документы",
-                        content=st.session_state.doc_res
+                        content=doc_res
                     )
                     st.toast("Сохранено в историю!")
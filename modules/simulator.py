@@ -1,8 +1,97 @@
 import streamlit as st
 
-from utils import get_model, extract_text_from_file, transcribe_audio, create_docx
+from chunking import estimate_tokens, truncate_to_budget
+from conversation import ConversationMemory
+from extraction import ExtractionError
+from retrieval import BM25Index
+from jobs import job_key
+from packing import PackStats
+from spool import session_text, set_session_text
+from ratelimit import PRIORITY_INTERACTIVE, describe_error, priority_scope
+from telemetry import MODULE_TITLES, track
+from utils import (
+    MODEL_NAME, get_model, extract_chunks_cached, transcribe_audio, docx_download_button,
+    render_stream, get_job_runner, follow_job, open_prefix_cache
+)
 from db import save_case
 
+# Память заседания: сколько реплик держать дословно и жёсткий потолок изменяемой
+# части промпта (неизменное начало заседания лежит в кэше контекста)
+MEMORY_KEEP_LAST = 6
+TURN_TOKEN_CEILING = 8000
+DEBRIEF_TOKEN_CEILING = 16000
+ANSWER_MAX_TOKENS = 2000
+# Фрагменты материалов дела, подбираемые под каждый ход
+OPENING_MATERIALS_TOKENS = 6000
+TURN_MATERIALS_TOKENS = 2500
+MATERIALS_TOP_K = 6
+OPENING_QUERY = "исковое заявление требования истец ответчик предмет спора сумма договор"
+
+
+def _cancel_turn():
+    """Отменяет текущий ход: запись сбрасывается, пользователь отвечает заново."""
+    st.session_state.turn_count += 1
+
+
+def _close_hearing_cache():
+    """Освобождает кэш контекста закончившегося заседания."""
+    hearing = st.session_state.pop("sim_cache", None)
+    if hearing is not None:
+        hearing.close()
+
+
+def build_hearing_prefix(ai_roles, user_role, absent, materials):
+    """Неизменное начало всех промптов заседания: роли, стороны и основные материалы.
+
+    Регистрируется в кэше контекста один раз на заседание, поэтому ничего
+    из конкретного хода сюда попадать не должно.
+    """
+    return f"""
+    {ai_roles}
+    Пользователь: {user_role}. ВНИМАНИЕ: {absent} отсутствует, говори ТОЛЬКО с пользователем.
+    Правило: ИГНОРИРУЙ отсутствующего {absent}. Говори только с Пользователем.
+    Контекст: ГПК РК. Материалы дела (фрагменты): {materials}
+    """
+
+
+def build_opening_prompt():
+    """Изменяемая часть промпта открытия заседания."""
+    return """
+    Начни заседание. Представься как СУДЬЯ и задай первый вопрос.
+    """
+
+
+def build_turn_parts(materials, answer):
+    """Части промпта хода (до истории и после неё): между ними вставляется история."""
+    head = f"""
+    Ещё фрагменты материалов к этому ходу: {materials or "—"}
+    """
+    tail = f"""
+    Ответ: "{answer}"
+    Задача: Кто говорит сейчас (Судья или Оппонент)? Оцени ответ. Задай СЛЕДУЮЩИЙ вопрос.
+    """
+    return head, tail
+
+
+def build_debrief_prompt(user_role, hist):
+    """Промпт итогового разбора заседания."""
+    return (
+        f"Разбор судебной симуляции по законам РК.\n"
+        f"Роль пользователя: {user_role}.\n"
+        f"История: {hist}\n\n"
+        f"Составь отчет:\n"
+        f"1. Контекст дела\n"
+        f"2. Сильные стороны выступления\n"
+        f"3. Слабые стороны и ошибки\n"
+        f"4. Итоговая оценка"
+    )
+
+
+def run_debrief_job(job, model, prompt):
+    """Фоновая задача разбора заседания."""
+    job.progress(0.0, "Составляю разбор...")
+    return job.stream(model, prompt)
+
 
 def render_court_simulator():
     st.markdown("## Судебный Тренажер")
@@ -14,11 +103,12 @@ def render_court_simulator():
         st.session_state.sim_active = False
     if "turn_count" not in st.session_state:
         st.session_state.turn_count = 0
-    if "sim_analysis" not in st.session_state:
-        st.session_state.sim_analysis = None
+    if "sim_memory" not in st.session_state:
+        st.session_state.sim_memory = ConversationMemory(keep_last=MEMORY_KEEP_LAST)
 
     # НАСТРОЙКИ
-    if not st.session_state.sim_active and not st.session_state.sim_analysis:
+    sim_analysis = session_text("sim_analysis")
+    if not st.session_state.sim_active and not sim_analysis:
         with st.container(border=True):
             col1, col2 = st.columns(2)
             with col1:
@@ -36,16 +126,24 @@ def render_court_simulator():
             if st.button("Открыть заседание", use_container_width=True, type="primary"):
                 if sim_files:
                     # Валидация файлов
-                    ctx = ""
-                    for f in sim_files:
-                        text = extract_text_from_file(f)
-                        if text and "Файл пуст" not in text:
-                            ctx += text + "\n"
+                    documents = []
+                    for f, result in zip(sim_files, extract_chunks_cached(sim_files)):
+                        if isinstance(result, ExtractionError):
+                            st.warning(f"Файл '{f.name}' пропущен: {result}")
+                        else:
+                            documents.append((f.name, result))
 
-                    if not ctx.strip():
+                    if not documents:
                         st.error("Не удалось прочитать загруженные файлы.")
                         return
 
+                    index = BM25Index.from_documents(documents)
+                    packing, prefix_keys = PackStats(), set()
+                    ctx = index.context(
+                        OPENING_QUERY, OPENING_MATERIALS_TOKENS, k=MATERIALS_TOP_K,
+                        lead=index.leading_passages(), stats=packing, seen=prefix_keys
+                    )
+
                     if user_role == "Истец":
                         ai_roles = "Роли ИИ: 1. СУДЬЯ. 2. АДВОКАТ ОТВЕТЧИКА."
                         absent = "Ответчик"
@@ -54,22 +152,27 @@ def render_court_simulator():
                         absent = "Истец"
 
                     try:
-                        model = get_model()
-                        prompt = f"""
-                        {ai_roles}
-                        Пользователь: {user_role}. ВНИМАНИЕ: {absent} отсутствует, говори ТОЛЬКО с пользователем.
-                        Контекст: ГПК РК. Материалы: {ctx[:30000]}
-                        Начни заседание. Представься как СУДЬЯ и задай первый вопрос.
-                        """
-                        res = model.generate_content(prompt)
-                        st.session_state.messages = [{"role": "assistant", "content": res.text}]
+                        _close_hearing_cache()
+                        hearing = open_prefix_cache(
+                            build_hearing_prefix(ai_roles, user_role, absent, ctx), "simulator"
+                        )
+                        st.session_state.sim_cache = hearing
+                        model = get_model(module="simulator", prefix_cache=hearing)
+                        with st.chat_message("assistant", avatar="⚖️"):
+                            opening = render_stream(model, hearing.contents(build_opening_prompt()))
+                        st.session_state.messages = [{"role": "assistant", "content": opening}]
+                        st.session_state.sim_memory.reset()
                         st.session_state.sim_active = True
                         st.session_state.user_role = user_role
                         st.session_state.ai_roles = ai_roles
                         st.session_state.absent = absent
+                        st.session_state.sim_index = index
+                        st.session_state.sim_packing = packing
+                        st.session_state.sim_prefix_keys = prefix_keys
+                        st.session_state.sim_turns = []
                         st.rerun()
                     except Exception as e:
-                        st.error(f"Ошибка при запуске симуляции: {e}")
+                        st.error(f"Ошибка при запуске симуляции: {describe_error(e)}")
                 else:
                     st.error("Без документов суд не начнется!")
 
@@ -80,6 +183,35 @@ def render_court_simulator():
             with st.chat_message(msg["role"], avatar=avatar):
                 st.markdown(msg["content"])
 
+        packing = st.session_state.get("sim_packing")
+        if packing and packing.saved_tokens > 0:
+            st.caption(
+                f"Повторы в материалах дела: пропущено копий {packing.exact}, заменено правками "
+                f"{packing.near}; сэкономлено ~{packing.saved_tokens} токенов за заседание"
+            )
+        turns = st.session_state.get("sim_turns")
+        if turns:
+            last = turns[-1]
+            line = f"Последний ход: {last['seconds']:.1f} с, на входе {last['input_tokens']} токенов"
+            if last["cached_tokens"]:
+                line += f", из них {last['cached_tokens']} из кэша контекста"
+            cached = sum(t["cached_tokens"] for t in turns)
+            total = sum(t["input_tokens"] for t in turns)
+            if cached and total:
+                line += f" • за заседание из кэша {cached / total:.0%} входа"
+            st.caption(line)
+
+        # Заседание закрывается только готовым разбором: при ошибке его можно запросить снова
+        if "sim_job" in st.session_state:
+            result = follow_job("sim_job")
+            if result is not None:
+                set_session_text("sim_analysis", result)
+                _close_hearing_cache()
+                st.session_state.sim_active = False
+                st.rerun()
+            if "sim_job" in st.session_state:
+                return
+
         st.write("")
         with st.container(border=True):
             st.markdown("**Ваш ответ суду:**")
@@ -89,78 +221,98 @@ def render_court_simulator():
             if user_audio:
                 with st.spinner("Суд слушает..."):
                     try:
-                        user_text = transcribe_audio(user_audio)
+                        # Расшифровка реплики — часть хода, ждать в общей очереди ей нельзя
+                        with priority_scope(PRIORITY_INTERACTIVE):
+                            user_text = transcribe_audio(user_audio, module="Тренажер")
                         if not user_text:
                             st.error("Не удалось распознать речь.")
                             return
 
+                        hearing = st.session_state.sim_cache
+                        # Сводка истории идёт обычной моделью: ей не нужны материалы из кэша
+                        model = get_model(module="simulator")
+                        answer = truncate_to_budget(user_text, ANSWER_MAX_TOKENS)
+                        last_question = st.session_state.messages[-1]["content"]
+                        with track("turn", MODULE_TITLES["simulator"], MODEL_NAME) as turn:
+                            hearing.refresh()
+                            # Фрагменты из начала заседания уже есть в кэше — берём другие
+                            materials = st.session_state.sim_index.context(
+                                f"{last_question}\n{answer}", TURN_MATERIALS_TOKENS,
+                                k=MATERIALS_TOP_K, stats=st.session_state.sim_packing,
+                                seen=set(st.session_state.sim_prefix_keys)
+                            )
+                            head, tail = build_turn_parts(materials, answer)
+                            # Ответ пользователя идёт только в «Ответ», в историю — всё, что было до него
+                            budget = TURN_TOKEN_CEILING - estimate_tokens(head + tail)
+                            hist = st.session_state.sim_memory.history(
+                                st.session_state.messages, model, budget
+                            )
+                            st.button("Остановить ответ", key=f"stop_{key}", on_click=_cancel_turn)
+                            with st.chat_message("assistant", avatar="⚖️"):
+                                reply = render_stream(
+                                    get_model(module="simulator", prefix_cache=hearing),
+                                    hearing.contents(f"{head}История: {hist}{tail}")
+                                )
+                        st.session_state.sim_turns.append({
+                            "seconds": turn.total_seconds,
+                            "input_tokens": turn.input_tokens,
+                            "cached_tokens": turn.cached_tokens,
+                        })
                         st.session_state.messages.append({"role": "user", "content": user_text})
-
-                        model = get_model()
-                        hist = "\n".join([f"{m['role']}: {m['content']}" for m in st.session_state.messages])
-
-                        prompt = f"""
-                        {st.session_state.ai_roles}
-                        Правило: ИГНОРИРУЙ отсутствующего {st.session_state.absent}. Говори только с Пользователем.
-                        История: {hist}
-                        Ответ: "{user_text}"
-                        Задача: Кто говорит сейчас (Судья или Оппонент)? Оцени ответ. Задай СЛЕДУЮЩИЙ вопрос.
-                        """
-                        res = model.generate_content(prompt)
-                        st.session_state.messages.append({"role": "assistant", "content": res.text})
+                        st.session_state.messages.append({"role": "assistant", "content": reply})
                         st.session_state.turn_count += 1
                         st.rerun()
                     except Exception as e:
-                        st.error(f"Ошибка: {e}")
+                        st.error(f"Ошибка: {describe_error(e)}")
 
         col_end, _ = st.columns([1, 2])
         with col_end:
             if st.button("Закончить прения", use_container_width=True):
                 with st.spinner("Подготовка разбора..."):
                     try:
-                        model = get_model()
-                        hist = "\n".join([f"{m['role']}: {m['content']}" for m in st.session_state.messages])
-                        res = model.generate_content(
-                            f"Разбор судебной симуляции по законам РК.\n"
-                            f"Роль пользователя: {st.session_state.user_role}.\n"
-                            f"История: {hist}\n\n"
-                            f"Составь отчет:\n"
-                            f"1. Контекст дела\n"
-                            f"2. Сильные стороны выступления\n"
-                            f"3. Слабые стороны и ошибки\n"
-                            f"4. Итоговая оценка"
+                        hearing = st.session_state.sim_cache
+                        hearing.refresh()
+                        hist = st.session_state.sim_memory.history(
+                            st.session_state.messages, get_model(module="debrief"),
+                            DEBRIEF_TOKEN_CEILING
+                        )
+                        prompt = hearing.contents(
+                            build_debrief_prompt(st.session_state.user_role, hist)
+                        )
+                        st.session_state.sim_job = get_job_runner().submit(
+                            "debrief", job_key("debrief", hearing.key, prompt), run_debrief_job,
+                            get_model(module="debrief", prefix_cache=hearing), prompt
                         )
-                        st.session_state.sim_analysis = res.text
-                        st.session_state.sim_active = False
                         st.rerun()
                     except Exception as e:
-                        st.error(f"Ошибка при анализе: {e}")
+                        st.error(f"Ошибка при анализе: {describe_error(e)}")
 
     # РАЗБОР
-    if st.session_state.sim_analysis:
+    if sim_analysis:
         with st.container(border=True):
             st.markdown("## Результаты симуляции")
-            st.markdown(st.session_state.sim_analysis)
+            st.markdown(sim_analysis)
             st.markdown("---")
 
             col_save, col_download, col_restart = st.columns(3)
             with col_download:
-                docx = create_docx(st.session_state.sim_analysis, "Разбор (РК)")
-                st.download_button(
-                    "Скачать Разбор (.docx)", docx,
-                    "Debrief.docx", use_container_width=True
+                docx_download_button(
+                    "Скачать Разбор (.docx)", sim_analysis,
+                    "Разбор (РК)", "Debrief.docx"
                 )
             with col_save:
                 if st.button("Сохранить в историю", use_container_width=True, key="save_sim"):
                     save_case(
                         title=f"Симуляция ({st.session_state.get('user_role', 'N/A')})",
                         module="Тренажер",
-                        content=st.session_state.sim_analysis
+                        content=sim_analysis
                     )
                     st.toast("Сохранено в историю!")
             with col_restart:
                 if st.button("Начать заново", use_container_width=True):
                     st.session_state.messages = []
-                    st.session_state.sim_analysis = None
+                    st.session_state.sim_memory.reset()
+                    set_session_text("sim_analysis", None)
+                    _close_hearing_cache()
                     st.session_state.turn_count = 0
                     st.rerun()
@@ -0,0 +1,317 @@
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from chunking import estimate_tokens, split_for_budget
+from extraction import Chunk
+
+# Фрагменты короче этого не сравниваются: ссылка на них стоит почти столько же, сколько текст
+MIN_UNIT_CHARS = 80
+# Длинные абзацы (страницы PDF без пустых строк) режутся по предложениям. Граница
+# ставится после предложения с «подходящим» хэшем, а не по длине: тогда вставка
+# в одной версии сдвигает границы только рядом с правкой, и остальные части совпадают
+MAX_UNIT_CHARS = 1200
+MIN_GROUP_CHARS = 200
+BOUNDARY_MODULUS = 4
+
+# MinHash по шинглам из SHINGLE_WORDS слов: LSH_BANDS полос по MINHASH_PERMUTATIONS / LSH_BANDS
+# строк находят кандидатов, а почти копией считается фрагмент с оценкой Жаккара не ниже порога
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+NEAR_DUP_THRESHOLD = 0.7
+# Правки вместо текста отправляются, только если они короче этой доли фрагмента
+MAX_DIFF_SHARE = 0.5
+
+PACKING_NOTE = (
+    "Повторяющиеся фрагменты документов приведены один раз и помечены [§N]; дальше вместо "
+    "копии стоит ссылка [→§N], а если копия отличается — ссылка и правки («было» → «стало»)."
+)
+SOURCES_HEADER = "Повторяющиеся фрагменты из других частей, на которые здесь есть ссылки:"
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPH_RE = re.compile(r"\n[ \t]*\n")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+")
+_REFERENCE_RE = re.compile(r"\[→§(\d+)(?:–§(\d+))?")
+_DEFINITION_RE = re.compile(r"\[§(\d+)\] ")
+
+
+@dataclass
+class PackStats:
+    """Итог упаковки одного запроса: сколько повторов найдено и сколько токенов сэкономлено."""
+    units: int = 0
+    exact: int = 0
+    near: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def saved_tokens(self):
+        return self.tokens_before - self.tokens_after
+
+    @property
+    def saved_share(self):
+        return self.saved_tokens / self.tokens_before if self.tokens_before else 0.0
+
+    def add(self, other):
+        self.units += other.units
+        self.exact += other.exact
+        self.near += other.near
+        self.tokens_before += other.tokens_before
+        self.tokens_after += other.tokens_after
+
+
+def _normalize(text):
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def _signature(words):
+    """MinHash-подпись множества шинглов; None, если слов меньше длины шингла."""
+    if len(words) < SHINGLE_WORDS:
+        return None
+    shingles = {
+        " ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+    # hash() строк случаен между процессами, но подписи живут только внутри одного
+    hashes = np.fromiter((hash(s) & 0xFFFFFFFF for s in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def render_diff(old, new):
+    """Правки, превращающие old в new, по словам: «было» → «стало», «+добавлено», «−удалено»."""
+    a, b = old.split(), new.split()
+    edits = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == "replace":
+            edits.append(f"«{' '.join(a[i1:i2])}» → «{' '.join(b[j1:j2])}»")
+        elif op == "delete":
+            edits.append(f"−«{' '.join(a[i1:i2])}»")
+        elif op == "insert":
+            edits.append(f"+«{' '.join(b[j1:j2])}»")
+    return "; ".join(edits)
+
+
+class Packer:
+    """Находит точные и почти точные повторы среди уже добавленных фрагментов текста.
+
+    Точные повторы ищутся по нормализованному тексту (регистр, пробелы и знаки
+    препинания не важны), почти точные — по MinHash-подписям с LSH-корзинами.
+    """
+
+    def __init__(self, threshold=NEAR_DUP_THRESHOLD):
+        self.threshold = threshold
+        self._texts = []
+        self._signatures = []
+        self._exact = {}
+        self._buckets = defaultdict(list)
+        # Подпись последнего проверенного фрагмента: add() обычно идёт сразу после match()
+        self._last = (None, None, None)
+
+    def _prepare(self, text):
+        if self._last[0] is not text:
+            normalized = _normalize(text)
+            self._last = (text, normalized, None)
+        return self._last[1]
+
+    def _signature_of(self, text):
+        normalized = self._prepare(text)
+        if self._last[2] is None:
+            self._last = (text, normalized, _signature(normalized.split()))
+        return self._last[2]
+
+    def _bands(self, signature):
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes())
+                for band in range(LSH_BANDS)]
+
+    def match(self, text):
+        """Возвращает ("exact" | "near" | "new", id похожего фрагмента или None)."""
+        found = self._exact.get(self._prepare(text))
+        if found is not None:
+            return "exact", found
+        signature = self._signature_of(text)
+        if signature is None:
+            return "new", None
+        candidates = {uid for key in self._bands(signature) for uid in self._buckets.get(key, ())}
+        best, best_score = None, self.threshold
+        for uid in candidates:
+            score = float(np.mean(self._signatures[uid] == signature))
+            if score >= best_score:
+                best, best_score = uid, score
+        return ("near", best) if best is not None else ("new", None)
+
+    def add(self, text):
+        """Запоминает фрагмент и возвращает его id."""
+        uid = len(self._texts)
+        normalized = self._prepare(text)
+        signature = self._signature_of(text)
+        self._texts.append(text)
+        self._signatures.append(signature)
+        self._exact.setdefault(normalized, uid)
+        if signature is not None:
+            for key in self._bands(signature):
+                self._buckets[key].append(uid)
+        return uid
+
+    def text(self, uid):
+        return self._texts[uid]
+
+
+def split_units(text):
+    """Делит текст на абзацы, а слишком длинные — на группы предложений."""
+    for paragraph in _PARAGRAPH_RE.split(text):
+        if len(paragraph) <= MAX_UNIT_CHARS:
+            yield paragraph
+            continue
+        start = sentence = 0
+        for m in _SENTENCE_END_RE.finditer(paragraph):
+            size = m.end() - start
+            key = zlib.crc32(_normalize(paragraph[sentence:m.start()]).encode("utf-8"))
+            sentence = m.end()
+            if size >= MAX_UNIT_CHARS or (size >= MIN_GROUP_CHARS and key % BOUNDARY_MODULUS == 0):
+                yield paragraph[start:m.end()]
+                start = m.end()
+        if start < len(paragraph):
+            yield paragraph[start:]
+
+
+def attach_sources(pieces, sources):
+    """Дополняет каждую часть текстом фрагментов §N, на которые она ссылается, но
+    которых в ней нет: при поблочном анализе модель видит только свою часть.
+
+    pieces — list[Piece] из split_for_budget, sources — Packed.sources. Часть может
+    выйти за бюджет на объём добавленных фрагментов, но не больше исходного текста.
+    """
+    out = []
+    for piece in pieces:
+        defined = {int(n) for n in _DEFINITION_RE.findall(piece.text)}
+        missing = set()
+        for first, last in _REFERENCE_RE.findall(piece.text):
+            missing.update(range(int(first), int(last or first) + 1))
+        missing = sorted(n for n in missing - defined if n in sources)
+        if not missing:
+            out.append(piece)
+            continue
+        appendix = "\n\n".join(f"[§{n}] {sources[n]}" for n in missing)
+        text = f"{piece.text}\n\n{SOURCES_HEADER}\n{appendix}"
+        out.append(replace(piece, text=text, tokens=estimate_tokens(text)))
+    return out
+
+
+@dataclass
+class Packed:
+    """Результат упаковки: документы с заменёнными повторами, статистика и
+    исходный текст фрагментов §N."""
+    documents: list
+    stats: PackStats
+    sources: dict = field(default_factory=dict)
+
+    def instruction(self, instr):
+        """Инструкция для модели с пояснением ссылок, если в документах есть замены."""
+        if self.stats.exact or self.stats.near:
+            return f"{instr}\n{PACKING_NOTE}"
+        return instr
+
+    def count_chunked(self, budget, original):
+        """Пересчитывает stats для поблочного анализа: исходные (original) и упакованные
+        документы режутся split_for_budget одинаково, а к упакованным частям добавляются
+        фрагменты §N из других частей, на которые они ссылаются."""
+        self.stats.tokens_before = sum(p.tokens for p in split_for_budget(original, budget))
+        pieces = attach_sources(split_for_budget(self.documents, budget), self.sources)
+        self.stats.tokens_after = sum(p.tokens for p in pieces)
+
+    @property
+    def shorter(self):
+        """Упаковка сократила промпт; иначе выгоднее отправить исходные документы."""
+        return self.stats.saved_tokens > 0
+
+
+def _render(items, labels):
+    """Собирает текст фрагмента; подряд идущие ссылки на §N, §N+1… сворачиваются в диапазон."""
+    parts, run = [], []
+
+    def flush():
+        if run:
+            parts.append(f"[→§{run[0]}] " if len(run) == 1 else f"[→§{run[0]}–§{run[-1]}] ")
+            run.clear()
+
+    for kind, text, uid in items:
+        if kind == "exact":
+            if run and labels[uid] != run[-1] + 1:
+                flush()
+            run.append(labels[uid])
+            continue
+        if run and not text.strip():
+            continue
+        flush()
+        if kind == "near":
+            parts.append(f"[→§{labels[uid]}, правки: {text}] ")
+        elif kind == "new" and uid in labels:
+            parts.append(f"[§{labels[uid]}] {text}")
+        else:
+            parts.append(text)
+    flush()
+    return "".join(parts)
+
+
+def pack_documents(documents, threshold=NEAR_DUP_THRESHOLD):
+    """Отправляет повторяющийся текст один раз: копии заменяются ссылками на первое
+    вхождение, почти копии — ссылкой и правками.
+
+    documents — пары (имя, list[Chunk]); возвращается Packed с документами той же
+    формы (страницы и номера блоков сохраняются), PackStats и текстом фрагментов §N.
+    """
+    packer = Packer(threshold)
+    stats = PackStats()
+    # Первый проход: решения по каждому фрагменту; номера §N получат только те,
+    # на которые действительно есть ссылки
+    plan = []
+    referenced = set()
+    for doc, (_, chunks) in enumerate(documents):
+        for chunk in chunks:
+            items = []
+            for n, paragraph in enumerate(_PARAGRAPH_RE.split(chunk.text)):
+                if n:
+                    items.append(("text", "\n\n", None))
+                for unit in split_units(paragraph):
+                    stats.units += 1
+                    if len(unit.strip()) < MIN_UNIT_CHARS:
+                        items.append(("text", unit, None))
+                        continue
+                    kind, ref = packer.match(unit)
+                    if kind == "exact":
+                        stats.exact += 1
+                        referenced.add(ref)
+                        items.append(("exact", unit, ref))
+                        continue
+                    if kind == "near":
+                        diff = render_diff(packer.text(ref), unit)
+                        if estimate_tokens(diff) <= estimate_tokens(unit) * MAX_DIFF_SHARE:
+                            stats.near += 1
+                            referenced.add(ref)
+                            items.append(("near", diff, ref))
+                            continue
+                    items.append(("new", unit, packer.add(unit)))
+            plan.append((doc, chunk, items))
+
+    labels = {uid: n for n, uid in enumerate(sorted(referenced), 1)}
+    packed = [[] for _ in documents]
+    offsets = [0] * len(documents)
+    for doc, chunk, items in plan:
+        text = _render(items, labels)
+        packed[doc].append(Chunk(chunk.source, chunk.kind, chunk.index, offsets[doc], text))
+        offsets[doc] += len(text) + 1
+        stats.tokens_before += estimate_tokens(chunk.text)
+        stats.tokens_after += estimate_tokens(text)
+    sources = {label: packer.text(uid) for uid, label in labels.items()}
+    return Packed([(name, packed[doc]) for doc, (name, _) in enumerate(documents)], stats, sources)
@@ -0,0 +1,372 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from chunking import estimate_tokens
+
+# Очередь к Gemini: меньшее число — раньше. Реплики тренажёра не должны ждать,
+# пока пройдут блоки длинного анализа документов
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+# Квоты на процесс (запросов и токенов в минуту) и число одновременных запросов
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "1000"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MAX_CONCURRENT = int(os.getenv("GEMINI_MAX_CONCURRENT", "8"))
+# Запас ведра — квота за столько секунд: полное ведро на минуту позволило бы
+# за первую минуту отправить вдвое больше квоты
+BURST_SECONDS = 5.0
+
+# Повторы с экспоненциальной паузой и случайным разбросом
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# После стольких неудач подряд запросы отклоняются сразу, пока не пройдёт пауза
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+# Ошибки google.api_core и сетевые, после которых запрос имеет смысл повторить.
+# Сравниваются имена классов, чтобы не импортировать google.api_core заранее
+RETRYABLE_ERRORS = frozenset({
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "ConnectionError", "TimeoutError",
+})
+QUOTA_ERRORS = frozenset({"ResourceExhausted", "TooManyRequests"})
+
+logger = logging.getLogger(__name__)
+
+_priority = contextvars.ContextVar("gemini_priority", default=PRIORITY_NORMAL)
+
+
+class CircuitOpenError(RuntimeError):
+    """Запрос отклонён без обращения к Gemini: перед этим было слишком много неудач подряд."""
+
+
+def _error_names(error):
+    return {cls.__name__ for cls in type(error).__mro__}
+
+
+def is_retryable(error):
+    return bool(_error_names(error) & RETRYABLE_ERRORS)
+
+
+def is_quota_error(error):
+    return bool(_error_names(error) & QUOTA_ERRORS)
+
+
+def describe_error(error):
+    """Понятное пользователю описание ошибки обращения к Gemini."""
+    if isinstance(error, CircuitOpenError):
+        return str(error)
+    if is_quota_error(error):
+        return "Превышена квота запросов к Gemini. Повторите попытку через минуту."
+    if is_retryable(error):
+        return f"Gemini временно недоступен ({type(error).__name__}). Повторите попытку позже."
+    return str(error)
+
+
+@contextmanager
+def priority_scope(priority):
+    """Обращения к Gemini внутри блока (без явного приоритета) идут с приоритетом priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_request_tokens(contents):
+    """Оценка входных токенов запроса до отправки; файлы учитываются после ответа."""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    return sum(estimate_tokens(p) if isinstance(p, str) else 1 for p in parts)
+
+
+def _usage_tokens(usage):
+    if usage is None:
+        return None
+    return (getattr(usage, "prompt_token_count", 0) or 0) + (
+        getattr(usage, "candidates_token_count", 0) or 0)
+
+
+class TokenBucket:
+    """Ведро на capacity единиц, пополняемое со скоростью per_minute в минуту.
+
+    По умолчанию ёмкость равна минутной норме. Уровень может уйти в минус,
+    если запрос оказался дороже оценки: тогда следующие запросы подождут,
+    пока долг не восполнится.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, capacity or per_minute)
+        self.level = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Сколько ждать, пока в ведре наберётся amount (не больше ёмкости)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def drain(self, now):
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+
+class CircuitBreaker:
+    """Размыкается после threshold неудач подряд; через reset_seconds пропускает один пробный запрос."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self._trial else "open"
+
+    def allow(self, now):
+        if self.opened_at is None:
+            return True
+        if not self._trial and now - self.opened_at >= self.reset_seconds:
+            self._trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def failure(self, now):
+        self.failures += 1
+        self._trial = False
+        if self.failures >= self.threshold:
+            self.opened_at = now
+
+
+class Limiter:
+    """Общий для процесса доступ к Gemini: квоты RPM/TPM, очередь по приоритетам,
+    повторы при временных ошибках и размыкатель при их серии.
+
+    Запрос ждёт, пока он первый в очереди, есть свободный слот и в обоих вёдрах
+    хватает запаса; при равном приоритете соблюдается порядок поступления.
+    """
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_concurrent=GEMINI_MAX_CONCURRENT,
+                 attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 breaker=None, burst_seconds=BURST_SECONDS):
+        self.requests = TokenBucket(rpm, rpm * burst_seconds / 60)
+        self.tokens = TokenBucket(tpm, tpm * burst_seconds / 60)
+        self.max_concurrent = max(1, max_concurrent)
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._active = 0
+        self.calls = 0
+        self.retries = 0
+        self.rejected = 0
+        self.queued_seconds = 0.0
+
+    def acquire(self, priority=None, tokens=1):
+        """Ждёт своей очереди и занимает слот; возвращает время ожидания в секундах."""
+        ticket = (_priority.get() if priority is None else priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            now = time.monotonic()
+            if not self.breaker.allow(now):
+                self.rejected += 1
+                raise CircuitOpenError(
+                    "Gemini временно недоступен: несколько запросов подряд завершились ошибкой. "
+                    f"Повторите попытку через {self.breaker.reset_seconds:.0f} с."
+                )
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] == ticket and self._active < self.max_concurrent:
+                        wait = max(self.requests.wait_time(1, now),
+                                   self.tokens.wait_time(tokens, now))
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+            self._active += 1
+            self.calls += 1
+            waited = now - started
+            self.queued_seconds += waited
+            # Следующий в очереди мог ждать только того, чтобы этот ушёл из её головы
+            self._cond.notify_all()
+        return waited
+
+    def release(self, extra_tokens=0):
+        """Освобождает слот; extra_tokens — насколько запрос оказался дороже оценки."""
+        with self._cond:
+            self._active -= 1
+            if extra_tokens > 0:
+                self.tokens.take(extra_tokens, time.monotonic())
+            self._cond.notify_all()
+
+    def succeeded(self):
+        with self._cond:
+            self.breaker.success()
+
+    def failed(self, error):
+        """Учитывает временную ошибку; при ошибке квоты опустошает ведро запросов."""
+        with self._cond:
+            now = time.monotonic()
+            self.breaker.failure(now)
+            if is_quota_error(error):
+                self.requests.drain(now)
+            self._cond.notify_all()
+
+    def backoff(self, attempt):
+        """Пауза перед повтором: случайная в пределах экспоненциально растущего окна."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, priority=None, tokens=1, hold=False, **kwargs):
+        """Вызывает fn(*args, **kwargs) через очередь с повторами при временных ошибках.
+
+        hold=True оставляет слот занятым после успешного вызова: его освобождает
+        вызывающий через release() (например, когда дочитает потоковый ответ).
+        """
+        for attempt in range(self.attempts):
+            self.acquire(priority, tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.release()
+                if not is_retryable(e):
+                    # Gemini ответил, просто запрос неверный: для размыкателя это не сбой
+                    self.succeeded()
+                    raise
+                self.failed(e)
+                if attempt == self.attempts - 1:
+                    raise
+                self.retries += 1
+                delay = self.backoff(attempt)
+                logger.warning("Gemini: %s, повтор через %.1f с", type(e).__name__, delay)
+                time.sleep(delay)
+                continue
+            self.succeeded()
+            if not hold:
+                self.release()
+            return result
+
+    def snapshot(self):
+        """Текущее состояние для страницы «Производительность»."""
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "active": self._active,
+                "calls": self.calls,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "queued_seconds": self.queued_seconds,
+                "breaker": self.breaker.state,
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Общий для процесса Limiter (квоты из GEMINI_RPM, GEMINI_TPM, GEMINI_MAX_CONCURRENT)."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = Limiter()
+        return _limiter
+
+
+def configure_limiter(**kwargs):
+    """Заменяет общий Limiter новым с заданными параметрами (для CLI и замеров)."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = Limiter(**kwargs)
+        return _limiter
+
+
+class LimitedModel:
+    """Обёртка над GenerativeModel: каждый generate_content проходит через Limiter."""
+
+    def __init__(self, model, priority=None, limiter=None):
+        self._model = model
+        self.priority = priority
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    @property
+    def limiter(self):
+        return self._limiter or get_limiter()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        estimate = estimate_request_tokens(contents)
+        if stream:
+            return self._stream(contents, estimate, **kwargs)
+        limiter = self.limiter
+        res = limiter.call(
+            self._model.generate_content, contents, priority=self.priority, tokens=estimate,
+            hold=True, **kwargs
+        )
+        actual = _usage_tokens(getattr(res, "usage_metadata", None))
+        limiter.release(0 if actual is None else actual - estimate)
+        return res
+
+    def _stream(self, contents, estimate, **kwargs):
+        limiter = self.limiter
+
+        # Повторяется только начало потока: после первого фрагмента ответ уже у пользователя
+        def start():
+            chunks = iter(self._model.generate_content(contents, stream=True, **kwargs))
+            return chunks, next(chunks, None)
+
+        chunks, first = limiter.call(start, priority=self.priority, tokens=estimate, hold=True)
+        usage = None
+        try:
+            if first is None:
+                return
+            usage = getattr(first, "usage_metadata", None)
+            yield first
+            for chunk in chunks:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        finally:
+            actual = _usage_tokens(usage)
+            limiter.release(0 if actual is None else actual - estimate)
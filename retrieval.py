@@ -0,0 +1,131 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+from chunking import estimate_tokens, split_for_budget
+from packing import MAX_DIFF_SHARE, Packer, render_diff
+
+# Размер фрагмента индекса в токенах
+PASSAGE_TOKENS = 400
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Грубый стемминг для русского и казахского: оставляем начало слова,
+# чтобы «договора», «договору», «договором» попадали в один терм
+STEM_LENGTH = 6
+STOP_WORDS = frozenset(
+    "и в во на не что как с со по к ко из за от до для о об а но или то же ли бы "
+    "это этот эта эти его ее её их он она они мы вы я ты был была было были быть "
+    "при под над без также так уже если только все всё вся весь".split()
+)
+
+
+def tokenize(text):
+    """Разбивает текст на нормализованные термы."""
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word in STOP_WORDS or (len(word) < 2 and not word.isdigit()):
+            continue
+        terms.append(word[:STEM_LENGTH])
+    return terms
+
+
+class BM25Index:
+    """Инвертированный индекс BM25 по фрагментам материалов дела (в памяти процесса)."""
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = list(passages)
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for doc_id, passage in enumerate(self.passages):
+            counts = Counter(tokenize(passage.text))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((doc_id, tf))
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    @classmethod
+    def from_documents(cls, documents, passage_tokens=PASSAGE_TOKENS):
+        """Строит индекс из пар (имя, list[Chunk]), сохраняя ссылки на страницы."""
+        return cls(split_for_budget(documents, passage_tokens))
+
+    def __len__(self):
+        return len(self.passages)
+
+    def _idf(self, term):
+        n = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self.passages) - n + 0.5) / (n + 0.5))
+
+    def search(self, query, k=5):
+        """Возвращает до k пар (оценка, Piece) по убыванию релевантности."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in postings:
+                norm = 1 - self.b + self.b * self._lengths[doc_id] / (self._avg_length or 1)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.passages[doc_id]) for doc_id, score in best]
+
+    def context(self, query, budget, k=8, lead=(), stats=None, seen=None):
+        """Собирает текст найденных фрагментов с указанием файла и страниц под бюджет токенов.
+
+        lead — фрагменты, которые ставятся первыми независимо от запроса. Копии уже
+        выбранных фрагментов (та же страница в другой версии файла) пропускаются, а
+        почти копии заменяются правками; освободившееся место занимают следующие
+        по релевантности. stats (PackStats) накапливает сэкономленные токены.
+        seen — множество (файл, метка) уже отправленных фрагментов: они пропускаются,
+        а выбранные сейчас добавляются в него.
+        """
+        candidates = list(lead) + [p for _, p in self.search(query, k * 2)]
+        limit = len(lead) + k
+        packer, headers = Packer(), []
+        parts, used = [], 0
+        seen = set() if seen is None else seen
+        for passage in candidates:
+            if len(parts) >= limit:
+                break
+            key = (passage.source, passage.label)
+            if key in seen:
+                continue
+            header = f"[{passage.source}, {passage.label}]"
+            tokens = estimate_tokens(passage.text)
+            kind, ref = packer.match(passage.text)
+            if kind == "exact":
+                seen.add(key)
+                if stats is not None:
+                    stats.exact += 1
+                    stats.tokens_before += tokens
+                continue
+            text = None
+            if kind == "near":
+                diff = render_diff(packer.text(ref), passage.text)
+                if estimate_tokens(diff) <= tokens * MAX_DIFF_SHARE:
+                    text = f"{header} как {headers[ref]}, правки: {diff}"
+            if text is None:
+                if used + tokens > budget:
+                    continue
+                packer.add(passage.text)
+                headers.append(header)
+                text = f"{header}\n{passage.text}"
+            elif stats is not None:
+                stats.near += 1
+            seen.add(key)
+            used += estimate_tokens(text)
+            parts.append(text)
+            if stats is not None:
+                stats.units += 1
+                stats.tokens_before += tokens
+                stats.tokens_after += estimate_tokens(text)
+        return "\n\n".join(parts)
+
+    def leading_passages(self):
+        """Первый фрагмент каждого документа — для вводной части заседания."""
+        first = {}
+        for passage in self.passages:
+            first.setdefault(passage.source, passage)
+        return list(first.values())
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from chunking import split_for_budget
+from packing import attach_sources
+
+# Поблочный анализ: бюджет токенов на один блок и число одновременных запросов
+CHUNK_TOKEN_BUDGET = 24000
+MAX_CHUNKS_IN_FLIGHT = 4
+
+REPORT_SECTIONS = (
+    "1. Сильные стороны документа\n"
+    "2. Риски и слабые места\n"
+    "3. Вывод и рекомендации"
+)
+
+
+def build_analysis_prompt(instr, documents):
+    """Промпт анализа всех документов одним запросом; documents — пары (имя, текст)."""
+    full_text = "".join(f"\n--- {name} ---\n{text}\n" for name, text in documents)
+    return (
+        f"Инструкция: {instr}\n"
+        f"Документы:\n{full_text}\n\n"
+        f"Сделай анализ по законам РК:\n"
+        f"{REPORT_SECTIONS}"
+    )
+
+
+def build_chunk_prompt(instr, piece):
+    """Промпт для одного блока документа."""
+    return (
+        f"Инструкция: {instr}\n"
+        f"Фрагмент документа «{piece.source}» ({piece.label}):\n{piece.text}\n\n"
+        f"Выпиши кратко по законам РК, только по этому фрагменту:\n"
+        f"{REPORT_SECTIONS}\n"
+        f"Указывай пункты и страницы. Если по разделу нечего сказать — пиши «нет»."
+    )
+
+
+def build_merge_prompt(instr, findings):
+    """Промпт сведения находок по блокам в итоговый отчёт; findings — пары (Piece, текст)."""
+    notes = "\n\n".join(
+        f"--- {piece.source} ({piece.label}) ---\n{text}" for piece, text in findings
+    )
+    return (
+        f"Инструкция: {instr}\n"
+        f"Ниже находки по отдельным фрагментам документов.\n{notes}\n\n"
+        f"Сведи их в единый анализ по законам РК без повторов:\n"
+        f"{REPORT_SECTIONS}"
+    )
+
+
+def analyze_chunked(model, instr, documents, budget=CHUNK_TOKEN_BUDGET,
+                    max_in_flight=MAX_CHUNKS_IN_FLIGHT, on_progress=None, merge_fn=None,
+                    sources=None):
+    """Анализирует документы по блокам параллельно и сводит находки в отчёт.
+
+    documents — пары (имя, list[Chunk]); on_progress(done, total) вызывается
+    после каждого готового блока; merge_fn(prompt) -> текст выполняет итоговое
+    сведение (например, с потоковым выводом), по умолчанию — обычный вызов модели.
+    Для упакованных документов sources — Packed.sources: блок, ссылающийся на §N
+    из другого блока, получает текст §N вместе со своим.
+    """
+    pieces = split_for_budget(documents, budget)
+    if sources:
+        pieces = attach_sources(pieces, sources)
+    findings = [None] * len(pieces)
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+        futures = [
+            pool.submit(model.generate_content, build_chunk_prompt(instr, piece))
+            for piece in pieces
+        ]
+        for i, future in enumerate(futures):
+            findings[i] = (pieces[i], future.result().text)
+            if on_progress:
+                on_progress(i + 1, len(pieces))
+    if len(findings) == 1:
+        return findings[0][1]
+    prompt = build_merge_prompt(instr, findings)
+    if merge_fn is not None:
+        return merge_fn(prompt)
+    return model.generate_content(prompt).text
@@ -0,0 +1,299 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+MB = 1024 * 1024
+
+# Временные файлы сессий (подготовленные записи) лежат в отдельном каталоге
+# на каждую сессию; после перезапуска сервера каталоги прошлых сессий подхватываются
+SPOOL_DIR = os.getenv("SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "legal_os_spool")
+# Потолки диска: на одну сессию и на все вместе
+SPOOL_SESSION_BYTES = int(os.getenv("SPOOL_SESSION_MB", "300")) * MB
+SPOOL_TOTAL_BYTES = int(os.getenv("SPOOL_TOTAL_MB", "2048")) * MB
+# Сколько памяти занимают тексты сессий (отчёты, расшифровки); сверх этого давно
+# не читавшиеся тексты сбрасываются на диск в каталог своей сессии
+SPOOL_MEMORY_BYTES = int(os.getenv("SPOOL_MEMORY_MB", "64")) * MB
+# Сессия без обращений дольше этого удаляется целиком. Под нехваткой места
+# вытесняются сессии, простаивающие хотя бы PRESSURE_IDLE_SECONDS, — самые давние первыми
+SESSION_IDLE_SECONDS = int(os.getenv("SPOOL_IDLE_MINUTES", "120")) * 60
+PRESSURE_IDLE_SECONDS = 300
+SWEEP_INTERVAL_SECONDS = 60
+
+_SAFE_RE = re.compile(r"[^\w-]")
+
+
+class SpoolQuotaError(RuntimeError):
+    """Файл не помещается в лимит временных файлов сессии или сервера."""
+
+
+class _Session:
+    __slots__ = ("dir", "files", "spilled", "last_used", "holds")
+
+    def __init__(self, path, last_used):
+        self.dir = path
+        self.files = {}
+        # Тексты, сброшенные на диск: ключ -> путь
+        self.spilled = {}
+        self.last_used = last_used
+        # Задачи, которым ещё нужны файлы сессии: пока они есть, сессия не вытесняется
+        self.holds = set()
+
+    @property
+    def disk_bytes(self):
+        return sum(self.files.values())
+
+
+def _name(session_id):
+    """Имя каталога сессии (ID сессии Streamlit — UUID, но мало ли)."""
+    return _SAFE_RE.sub("_", session_id)
+
+
+def _text_path(directory, key):
+    return os.path.join(directory, f"text_{_SAFE_RE.sub('_', key)}.txt")
+
+
+class SpoolManager:
+    """Временные файлы и тексты сессий с лимитами и вытеснением простаивающих сессий.
+
+    Файлы сессии лежат в её каталоге внутри root и учитываются по размеру. Тексты
+    хранятся в памяти, пока их общий объём не больше memory_bytes; дальше самые
+    давно читавшиеся сбрасываются на диск и читаются оттуда по требованию.
+    """
+
+    def __init__(self, root=SPOOL_DIR, session_bytes=SPOOL_SESSION_BYTES,
+                 total_bytes=SPOOL_TOTAL_BYTES, memory_bytes=SPOOL_MEMORY_BYTES,
+                 idle_seconds=SESSION_IDLE_SECONDS, pressure_idle_seconds=PRESSURE_IDLE_SECONDS):
+        self.root = root
+        self.session_bytes = session_bytes
+        self.total_bytes = total_bytes
+        self.memory_bytes = memory_bytes
+        self.idle_seconds = idle_seconds
+        self.pressure_idle_seconds = pressure_idle_seconds
+        self.evicted = 0
+        self.spills = 0
+        self._sessions = {}
+        # (сессия, ключ) -> (текст, размер в памяти), от давно читавшихся к недавним
+        self._texts = OrderedDict()
+        self._text_bytes = 0
+        self._last_sweep = 0.0
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self._adopt()
+
+    def _adopt(self):
+        """Подхватывает каталоги, оставшиеся от прошлого запуска: их удалит обычная очистка."""
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            session = _Session(entry.path, entry.stat().st_mtime)
+            for item in os.scandir(entry.path):
+                if item.is_file():
+                    session.files[item.path] = item.stat().st_size
+            self._sessions[entry.name] = session
+
+    def _session(self, name):
+        session = self._sessions.get(name)
+        if session is None:
+            session = self._sessions[name] = _Session(os.path.join(self.root, name), time.time())
+        return session
+
+    def _disk_used(self):
+        return sum(s.disk_bytes for s in self._sessions.values())
+
+    def touch(self, session_id):
+        """Отмечает сессию активной; раз в SWEEP_INTERVAL_SECONDS удаляет простаивающие."""
+        with self._lock:
+            self._session(_name(session_id)).last_used = time.time()
+            if time.monotonic() - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+                self.sweep()
+
+    def session_dir(self, session_id):
+        """Каталог временных файлов сессии (создаётся при первом обращении)."""
+        with self._lock:
+            session = self._session(_name(session_id))
+            session.last_used = time.time()
+            os.makedirs(session.dir, exist_ok=True)
+            return session.dir
+
+    def reserve(self, session_id, size):
+        """Проверяет, что size байт поместятся; при нехватке места вытесняет чужие
+        простаивающие сессии. Иначе — SpoolQuotaError."""
+        with self._lock:
+            session = self._session(_name(session_id))
+            if session.disk_bytes + size > self.session_bytes:
+                raise SpoolQuotaError(
+                    f"превышен лимит временных файлов сессии ({self.session_bytes // MB} МБ); "
+                    "сбросьте дело или удалите лишние записи"
+                )
+            self._evict_for(self.total_bytes - size, keep=session)
+            if self._disk_used() + size > self.total_bytes:
+                raise SpoolQuotaError("на сервере закончилось место для временных файлов, попробуйте позже")
+
+    def hold(self, session_id, token):
+        """Запрещает вытеснять сессию, пока задача token (в очереди или в работе) не
+        вызовет release. Повторный hold с тем же token ничего не меняет."""
+        with self._lock:
+            self._session(_name(session_id)).holds.add(token)
+
+    def release(self, session_id, token):
+        with self._lock:
+            session = self._sessions.get(_name(session_id))
+            if session is not None:
+                session.holds.discard(token)
+
+    def add_files(self, session_id, paths):
+        """Учитывает записанные в каталог сессии файлы."""
+        with self._lock:
+            session = self._session(_name(session_id))
+            for path in paths:
+                session.files[path] = os.path.getsize(path)
+
+    def remove_files(self, session_id, paths):
+        """Удаляет файлы сессии и снимает их с учёта."""
+        with self._lock:
+            session = self._session(_name(session_id))
+            for path in paths:
+                session.files.pop(path, None)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def has_file(self, session_id, path):
+        with self._lock:
+            session = self._sessions.get(_name(session_id))
+            return session is not None and path in session.files
+
+    def put_text(self, session_id, key, text):
+        """Запоминает текст сессии; None удаляет его."""
+        name = _name(session_id)
+        with self._lock:
+            self._drop_text(name, key)
+            if text is None:
+                return
+            size = sys.getsizeof(text)
+            self._texts[(name, key)] = (text, size)
+            self._text_bytes += size
+            self._spill()
+
+    def get_text(self, session_id, key, default=None):
+        """Текст сессии из памяти или с диска; default, если его нет (или сессия вытеснена)."""
+        name = _name(session_id)
+        with self._lock:
+            item = self._texts.get((name, key))
+            if item is not None:
+                self._texts.move_to_end((name, key))
+                return item[0]
+            session = self._sessions.get(name)
+            path = session.spilled.get(key) if session is not None else None
+            if path is None:
+                return default
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            self.put_text(session_id, key, text)
+            return text
+
+    def _drop_text(self, name, key):
+        item = self._texts.pop((name, key), None)
+        if item is not None:
+            self._text_bytes -= item[1]
+        session = self._sessions.get(name)
+        path = session.spilled.pop(key, None) if session is not None else None
+        if path is not None:
+            session.files.pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _spill(self):
+        """Сбрасывает давно читавшиеся тексты на диск, пока память не уложится в лимит."""
+        while self._text_bytes > self.memory_bytes and len(self._texts) > 1:
+            (name, key), (text, size) = self._texts.popitem(last=False)
+            self._text_bytes -= size
+            session = self._session(name)
+            os.makedirs(session.dir, exist_ok=True)
+            path = _text_path(session.dir, key)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            session.spilled[key] = path
+            session.files[path] = os.path.getsize(path)
+            self.spills += 1
+
+    def _evict(self, name):
+        session = self._sessions.pop(name)
+        for key in [k for k in self._texts if k[0] == name]:
+            self._text_bytes -= self._texts.pop(key)[1]
+        shutil.rmtree(session.dir, ignore_errors=True)
+
+    def _evict_for(self, limit, keep=None):
+        """Вытесняет простаивающие сессии, начиная с самых давних, пока диск не уложится в limit."""
+        if self._disk_used() <= limit:
+            return
+        idle_since = time.time() - self.pressure_idle_seconds
+        for name, session in sorted(self._sessions.items(), key=lambda item: item[1].last_used):
+            if session is keep or session.holds or session.last_used > idle_since:
+                continue
+            self._evict(name)
+            self.evicted += 1
+            if self._disk_used() <= limit:
+                return
+
+    def sweep(self):
+        """Удаляет сессии, простаивающие дольше idle_seconds (кроме тех, чьи задачи ещё идут)."""
+        with self._lock:
+            self._last_sweep = time.monotonic()
+            cutoff = time.time() - self.idle_seconds
+            idle = [n for n, s in self._sessions.items() if s.last_used < cutoff and not s.holds]
+            for name in idle:
+                self._evict(name)
+                self.evicted += 1
+
+    def drop(self, session_id):
+        """Удаляет все файлы и тексты сессии."""
+        with self._lock:
+            if _name(session_id) in self._sessions:
+                self._evict(_name(session_id))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "disk_bytes": self._disk_used(),
+                "memory_bytes": self._text_bytes,
+                "texts": len(self._texts) + sum(len(s.spilled) for s in self._sessions.values()),
+                "spills": self.spills,
+                "evicted": self.evicted,
+            }
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """Общий для процесса SpoolManager (каталог и лимиты из переменных SPOOL_*)."""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = SpoolManager()
+        return _spool
+
+
+def current_session_id():
+    """ID сессии Streamlit, в которой выполняется скрипт; вне Streamlit — "local"."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else "local"
+
+
+def session_text(key, default=None):
+    """Текст текущей сессии Streamlit (отчёт, расшифровки) из общего SpoolManager."""
+    return get_spool().get_text(current_session_id(), key, default)
+
+
+def set_session_text(key, text):
+    """Сохраняет текст текущей сессии; None удаляет его."""
+    get_spool().put_text(current_session_id(), key, text)
@@ -0,0 +1,193 @@
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+import db
+
+DEFAULT_MODULE = "Общее"
+# Модули приложения под теми же названиями, что и в истории дел
+MODULE_TITLES = {
+    "analyzer": "Анализатор",
+    "documents": "Документы",
+    "simulator": "Тренажер",
+    "debrief": "Тренажер",
+}
+
+logger = logging.getLogger(__name__)
+
+# Текущий модуль и текущий замер: вложенные вызовы (загрузки внутри транскрибации)
+# не пишутся отдельно, а добавляются к внешнему замеру
+_module = contextvars.ContextVar("telemetry_module", default=DEFAULT_MODULE)
+_current = contextvars.ContextVar("telemetry_call", default=None)
+_lock = threading.Lock()
+
+
+@dataclass
+class Call:
+    """Замер одного обращения к Gemini."""
+    operation: str
+    module: str
+    model: str = ""
+    upload_seconds: float = 0.0
+    wait_seconds: float = 0.0
+    generate_seconds: float = 0.0
+    first_token_seconds: float = None
+    total_seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    bytes_uploaded: int = 0
+    error: str = ""
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+    def add_usage(self, usage):
+        """Берёт число токенов из usage_metadata ответа (если модель его вернула)."""
+        if usage is None:
+            return
+        self.input_tokens += getattr(usage, "prompt_token_count", 0) or 0
+        self.output_tokens += getattr(usage, "candidates_token_count", 0) or 0
+        # Часть входа, взятая из кэша контекста (уже входит в input_tokens)
+        self.cached_tokens += getattr(usage, "cached_content_token_count", 0) or 0
+
+    def absorb(self, child):
+        """Добавляет вложенный замер. Загрузки идут параллельно — берём самую долгую."""
+        with _lock:
+            self.upload_seconds = max(self.upload_seconds, child.upload_seconds)
+            self.wait_seconds = max(self.wait_seconds, child.wait_seconds)
+            self.generate_seconds += child.generate_seconds
+            if self.first_token_seconds is None and child.first_token_seconds is not None:
+                self.first_token_seconds = child.started - self.started + child.first_token_seconds
+            self.input_tokens += child.input_tokens
+            self.output_tokens += child.output_tokens
+            self.cached_tokens += child.cached_tokens
+            self.bytes_uploaded += child.bytes_uploaded
+            if child.error and not self.error:
+                self.error = f"{child.operation}: {child.error}"
+
+
+def _begin(operation, module=None, model=""):
+    parent = _current.get()
+    if module is None:
+        module = parent.module if parent is not None else _module.get()
+    return Call(operation, module, model), parent
+
+
+def _finish(call, parent):
+    call.total_seconds = time.monotonic() - call.started
+    if parent is not None:
+        parent.absorb(call)
+        return
+    record = asdict(call)
+    del record["started"]
+    try:
+        db.save_telemetry(record)
+    except sqlite3.Error:
+        # Телеметрия не должна ломать основной сценарий
+        logger.exception("Не удалось сохранить замер")
+
+
+@contextmanager
+def module_scope(module):
+    """Вызовы внутри блока (в том числе в рабочих потоках с копией контекста) относятся к module."""
+    token = _module.set(module)
+    try:
+        yield
+    finally:
+        _module.reset(token)
+
+
+@contextmanager
+def track(operation, module=None, model=""):
+    """Замеряет блок и сохраняет его как одну строку telemetry.
+
+    Внутри другого track замер не сохраняется отдельно, а добавляется к внешнему.
+    """
+    call, parent = _begin(operation, module, model)
+    token = _current.set(call)
+    try:
+        yield call
+    except Exception as e:
+        call.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _finish(call, parent)
+
+
+class InstrumentedModel:
+    """Обёртка над GenerativeModel: каждый generate_content попадает в телеметрию."""
+
+    def __init__(self, model, module=None, model_name=None):
+        self._model = model
+        self.module = module
+        self.model_name = model_name or getattr(model, "model_name", "")
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if stream:
+            return self._stream(contents, **kwargs)
+        with track("generate", self.module, self.model_name) as call:
+            started = time.monotonic()
+            res = self._model.generate_content(contents, **kwargs)
+            call.generate_seconds = time.monotonic() - started
+            call.add_usage(getattr(res, "usage_metadata", None))
+        return res
+
+    def _stream(self, contents, **kwargs):
+        # Генератор не ставит себя текущим замером: между фрагментами управление
+        # у вызывающего кода, и его вызовы не должны попадать в этот замер
+        call, parent = _begin("generate", self.module, self.model_name)
+        usage = None
+        try:
+            for chunk in self._model.generate_content(contents, stream=True, **kwargs):
+                if call.first_token_seconds is None:
+                    call.first_token_seconds = time.monotonic() - call.started
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        except GeneratorExit:
+            call.error = "прервано"
+            raise
+        except Exception as e:
+            call.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            call.generate_seconds = time.monotonic() - call.started
+            call.add_usage(usage)
+            _finish(call, parent)
+
+
+def percentile(values, q):
+    """Перцентиль q (0..1) по ближайшему рангу; для пустого списка — None."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def latency_summary(records):
+    """p50/p95 полной задержки и её частей по типам операций."""
+    groups = {}
+    for r in records:
+        groups.setdefault(r["operation"], []).append(r)
+    summary = []
+    for operation, rows in sorted(groups.items()):
+        total = [r["total_seconds"] for r in rows]
+        first = [r["first_token_seconds"] for r in rows if r["first_token_seconds"] is not None]
+        summary.append({
+            "operation": operation,
+            "calls": len(rows),
+            "errors": sum(1 for r in rows if r["error"]),
+            "p50": percentile(total, 0.5),
+            "p95": percentile(total, 0.95),
+            "first_token_p50": percentile(first, 0.5),
+            "upload_p50": percentile([r["upload_seconds"] for r in rows], 0.5),
+            "wait_p50": percentile([r["wait_seconds"] for r in rows], 0.5),
+            "generate_p50": percentile([r["generate_seconds"] for r in rows], 0.5),
+        })
+    return summary
@@ -0,0 +1,36 @@
+import io
+import os
+import wave
+
+import numpy as np
+
+from audio import prepared_size, preprocess_audio
+
+
+def _wav(rate, sampwidth, seconds):
+    t = np.arange(rate * seconds)
+    if sampwidth == 1:
+        samples = (128 + 100 * np.sin(t / 7)).astype(np.uint8)
+    else:
+        samples = (10000 * np.sin(t / 7)).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(sampwidth)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+def test_prepared_size_bounds_output_larger_than_input(tmp_path):
+    # 8 кГц, 8 бит: после подготовки (16 бит) файл вдвое больше исходного
+    data = _wav(8000, 1, 3)
+    result = preprocess_audio(data, "a.wav", tmp_dir=str(tmp_path))
+    assert result.output_bytes > len(data)
+    assert prepared_size(data, "a.wav") >= result.output_bytes
+    for path in result.paths:
+        os.remove(path)
+
+
+def test_prepared_size_of_other_formats_is_input_size():
+    assert prepared_size(b"ID3" + b"\0" * 100, "a.mp3") == 103
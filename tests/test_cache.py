@@ -0,0 +1,37 @@
+import sqlite3
+import threading
+
+from cache import SQLiteCache
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = SQLiteCache("texts", path=str(tmp_path / "cache.db"), max_bytes=250)
+    cache.set("a", "a" * 100)
+    cache.set("b", "b" * 100)
+    assert cache.get("a")
+    cache.set("c", "c" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+
+
+def test_disk_cache_reuses_connection_per_thread(tmp_path):
+    cache = SQLiteCache("texts", path=str(tmp_path / "cache.db"))
+    assert cache._connect() is cache._connect()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache._connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not cache._connect()
+
+
+def test_disk_cache_upgrades_old_table(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE texts (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)")
+    conn.execute("INSERT INTO texts VALUES ('old', 'текст', 1.0)")
+    conn.commit()
+    conn.close()
+    cache = SQLiteCache("texts", path=path, max_bytes=100)
+    assert cache.get("old") == "текст"
+    cache.set("new", "x" * 95)
+    assert cache.get("old") is None
@@ -0,0 +1,21 @@
+from chunking import estimate_tokens, split_for_budget
+from extraction import Chunk
+
+
+def _document(text):
+    return [("table.docx", [Chunk("table.docx", "paragraph", 1, 0, text)])]
+
+
+def test_many_tiny_parts_fit_budget():
+    # Оценки по ячейкам укладываются в бюджет, а склеенный с разделителями текст — нет
+    text = " ".join("Нет.;" for _ in range(20000))
+    pieces = split_for_budget(_document(text), 200)
+    assert all(p.tokens <= 200 for p in pieces)
+    assert "".join(p.text for p in pieces).count("Нет.") == 20000
+
+
+def test_small_document_is_one_piece():
+    text = "Статья 1. Предмет договора.\nСтатья 2. Цена."
+    pieces = split_for_budget(_document(text), 1000)
+    assert [p.text for p in pieces] == [text]
+    assert pieces[0].tokens == estimate_tokens(text)
@@ -0,0 +1,25 @@
+import db
+
+
+def test_claim_job_reuses_only_unfinished(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "jobs.db"))
+    first, created = db.claim_job("documents", "key")
+    assert created
+    assert db.claim_job("documents", "key") == (first, False)
+    db.update_job(first, status="done", result="отчёт")
+    second, created = db.claim_job("documents", "key")
+    assert created and second != first
+    db.close_connection()
+
+
+def test_prune_jobs_keeps_active(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "jobs.db"))
+    done, _ = db.claim_job("documents", "a")
+    active, _ = db.claim_job("documents", "b")
+    db.update_job(done, status="done", result="отчёт")
+    with db.transaction() as conn:
+        conn.execute("UPDATE jobs SET updated_at = '2000-01-01 00:00'")
+    db.prune_jobs(1)
+    assert db.get_job(done) is None
+    assert db.get_job(active) is not None
+    db.close_connection()
@@ -0,0 +1,54 @@
+from llm_cache import CachedModel, ResponseCache
+
+
+class _Chunk:
+    def __init__(self, text=None):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("ответ заблокирован")
+        return self._text
+
+
+class _Model:
+    model_name = "fake"
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        return iter(self.chunks)
+
+
+def _consume(model):
+    return "".join(c.text for c in model.generate_content("вопрос", stream=True))
+
+
+def test_empty_stream_is_not_cached(tmp_path):
+    inner = _Model([_Chunk("")])
+    model = CachedModel(inner, ResponseCache(str(tmp_path / "cache.db")), "test")
+    assert _consume(model) == ""
+    assert _consume(model) == ""
+    assert inner.calls == 2
+
+
+def test_blocked_stream_is_not_cached(tmp_path):
+    inner = _Model([_Chunk("начало"), _Chunk()])
+    model = CachedModel(inner, ResponseCache(str(tmp_path / "cache.db")), "test")
+    for chunk in model.generate_content("вопрос", stream=True):
+        pass
+    for chunk in model.generate_content("вопрос", stream=True):
+        pass
+    assert inner.calls == 2
+
+
+def test_completed_stream_is_cached(tmp_path):
+    inner = _Model([_Chunk("от"), _Chunk("вет")])
+    model = CachedModel(inner, ResponseCache(str(tmp_path / "cache.db")), "test")
+    assert _consume(model) == "ответ"
+    assert _consume(model) == "ответ"
+    assert inner.calls == 1
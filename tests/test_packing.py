@@ -0,0 +1,24 @@
+from extraction import Chunk
+from packing import pack_documents
+
+
+def _docs(*pages):
+    return [("a.pdf", [Chunk("a.pdf", "page", i, 0, text) for i, text in enumerate(pages, 1)])]
+
+
+def test_chunked_count_without_repeats_saves_nothing():
+    words = [f"слово{n}" for n in range(3000)]
+    docs = _docs(*(" ".join(words[i::6]) for i in range(6)))
+    packed = pack_documents(docs)
+    packed.count_chunked(300, docs)
+    assert packed.stats.saved_tokens == 0
+    assert not packed.shorter
+
+
+def test_chunked_count_with_repeats_saves_tokens():
+    clause = "Арендатор обязуется вносить арендную плату ежемесячно до пятого числа. " * 6
+    docs = _docs(*(f"Раздел {i}.\n\n{clause}" for i in range(6)))
+    packed = pack_documents(docs)
+    packed.count_chunked(300, docs)
+    assert packed.stats.saved_tokens > 0
+    assert packed.shorter
@@ -0,0 +1,11 @@
+import db
+
+
+def test_search_folds_yo(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "search.db"))
+    db.save_case("Договор займа", "Документы", "Заёмщик обязан вернуть сумму займа.")
+    for query in ("заемщик", "Заёмщика", "ЗАЕМЩИК"):
+        results = db.search_cases(query)
+        assert [r["title"] for r in results] == ["Договор займа"]
+        assert "**Заёмщик**" in results[0]["snippet"]
+    db.close_connection()
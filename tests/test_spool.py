@@ -0,0 +1,42 @@
+import os
+import time
+
+import pytest
+
+from spool import SpoolManager, SpoolQuotaError
+
+
+def _spool(tmp_path, **limits):
+    return SpoolManager(root=str(tmp_path / "spool"), memory_bytes=1 << 20, **limits)
+
+
+def _add_file(spool, session_id, size):
+    path = os.path.join(spool.session_dir(session_id), f"f{size}.bin")
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    spool.add_files(session_id, [path])
+    return path
+
+
+def test_held_session_survives_pressure_and_sweep(tmp_path):
+    spool = _spool(tmp_path, total_bytes=1500, idle_seconds=60, pressure_idle_seconds=0)
+    busy = _add_file(spool, "busy", 1000)
+    spool.hold("busy", "job")
+    spool._sessions["busy"].last_used = time.time() - 3600
+
+    with pytest.raises(SpoolQuotaError):
+        spool.reserve("other", 1000)
+    spool.sweep()
+    assert os.path.exists(busy)
+
+    spool.release("busy", "job")
+    spool.sweep()
+    assert not os.path.exists(busy)
+
+
+def test_idle_session_is_evicted_under_pressure(tmp_path):
+    spool = _spool(tmp_path, total_bytes=1500, pressure_idle_seconds=0)
+    idle = _add_file(spool, "idle", 1000)
+    spool._sessions["idle"].last_used = time.time() - 3600
+    spool.reserve("other", 1000)
+    assert not os.path.exists(idle)
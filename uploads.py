@@ -0,0 +1,134 @@
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+# Gemini хранит загруженные файлы 48 часов
+DEFAULT_TTL = 48 * 3600
+# Запас, чтобы не отдать модели файл, который истечёт во время запроса
+EXPIRY_MARGIN = 10 * 60
+
+
+def file_sha256(file_path):
+    """Возвращает SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _expiration_of(handle):
+    """Достаёт время истечения из объекта файла Gemini (unix-время или None)."""
+    exp = getattr(handle, "expiration_time", None)
+    if exp is None:
+        return None
+    if isinstance(exp, datetime):
+        return exp.timestamp()
+    if isinstance(exp, (int, float)):
+        return float(exp)
+    return None
+
+
+class UploadRegistry:
+    """Реестр загруженных в Gemini файлов, адресуемый по SHA-256 содержимого.
+
+    upload_fn(path) должен загрузить файл и вернуть готовый объект файла —
+    в приложении это utils.upload_audio_to_gemini, в проверках — фейковый genai.
+    batch_upload_fn(paths) загружает несколько файлов сразу и возвращает
+    (handles, failed), как utils.upload_files_to_gemini.
+    """
+
+    def __init__(self, upload_fn, batch_upload_fn=None, ttl=DEFAULT_TTL, clock=time.time):
+        self._upload_fn = upload_fn
+        self._batch_upload_fn = batch_upload_fn
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, digest):
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        handle, expires_at = entry
+        if expires_at - EXPIRY_MARGIN <= self._clock():
+            del self._entries[digest]
+            return None
+        return handle
+
+    def get(self, file_path):
+        """Возвращает объект файла Gemini, загружая файл только при промахе."""
+        digest = file_sha256(file_path)
+        with self._lock:
+            handle = self._lookup(digest)
+            if handle is not None:
+                self.hits += 1
+                return handle
+
+        handle = self._upload_fn(file_path)
+        with self._lock:
+            self._store(digest, handle)
+            self.misses += 1
+        return handle
+
+    def _store(self, digest, handle):
+        expires_at = _expiration_of(handle) or self._clock() + self._ttl
+        self._entries[digest] = (handle, expires_at)
+
+    def get_many(self, file_paths):
+        """Возвращает (handles, failed) в том же порядке, что и пути.
+
+        Промахи загружаются одной пачкой; одинаковые по содержимому файлы
+        загружаются один раз. failed — словарь {путь: ошибка}.
+        """
+        digests = [file_sha256(p) for p in file_paths]
+        handles = [None] * len(file_paths)
+        to_upload = {}
+        with self._lock:
+            for i, digest in enumerate(digests):
+                handle = self._lookup(digest)
+                if handle is not None:
+                    handles[i] = handle
+                    self.hits += 1
+                elif digest not in to_upload:
+                    to_upload[digest] = file_paths[i]
+
+        failed = {}
+        if to_upload:
+            paths = list(to_upload.values())
+            if self._batch_upload_fn is not None:
+                uploaded, failed = self._batch_upload_fn(paths)
+            else:
+                uploaded = []
+                for path in paths:
+                    try:
+                        uploaded.append(self._upload_fn(path))
+                    except Exception as e:
+                        uploaded.append(None)
+                        failed[path] = e
+            fresh = dict(zip(to_upload, uploaded))
+            with self._lock:
+                for digest, handle in fresh.items():
+                    if handle is not None:
+                        self._store(digest, handle)
+                        self.misses += 1
+            for i, digest in enumerate(digests):
+                if handles[i] is None:
+                    handles[i] = fresh.get(digest)
+                    if handles[i] is None and file_paths[i] not in failed:
+                        failed[file_paths[i]] = failed.get(to_upload[digest])
+        return handles, failed
+
+    def forget(self, file_path):
+        """Убирает запись о файле (например, если Gemini его отверг)."""
+        digest = file_sha256(file_path)
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def stats(self):
+        """Счётчики попаданий и промахов."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
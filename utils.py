@@ -1,14 +1,65 @@
 import os
 import time
 import io
+import json
+import contextvars
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
-import google.generativeai as genai
-from docx import Document
-import PyPDF2
 from dotenv import load_dotenv
 
+from db import get_job, get_transcript, iter_cases, save_transcript
+
+from audio import prepared_size, preprocess_audio
+from cache import LRUCache, SQLiteCache, TieredCache, content_hash
+from context_cache import PrefixCache
+from llm_cache import CachedModel, ResponseCache
+from export import DOCX_MIME, EXPORT_VERSION, markdown_to_docx, write_cases_zip
+from extraction import Chunk, ExtractionError, chunks_to_text, extract_many, iter_chunks
+from jobs import JobRunner
+from ratelimit import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, LimitedModel, describe_error, get_limiter
+)
+from spool import current_session_id, get_spool
+from telemetry import MODULE_TITLES, InstrumentedModel, track
+from uploads import UploadRegistry
+
 load_dotenv()
 
+MODEL_NAME = 'models/gemini-2.5-flash'
+
+# Кэш ответов модели: модули, которые им пользуются, и общий выключатель
+LLM_CACHE_MODULES = frozenset(
+    m.strip() for m in os.getenv("LLM_CACHE_MODULES", "analyzer,documents,debrief").split(",") if m.strip()
+)
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "") == "1"
+
+# Место в общей очереди к Gemini: реплики тренажёра раньше анализа документов,
+# остальные модули — с обычным приоритетом
+MODULE_PRIORITIES = {"simulator": PRIORITY_INTERACTIVE, "documents": PRIORITY_BACKGROUND}
+
+# Расшифровки хранятся по хэшу исходной записи и версии промпта: при изменении
+# TRANSCRIBE_PROMPT нужно увеличить версию
+TRANSCRIBE_PROMPT = "Транскрибируй текст аудио."
+TRANSCRIBE_PROMPT_VERSION = 1
+
+# Параллельные загрузки в Gemini и ожидание обработки файлов
+UPLOAD_WORKERS = 4
+UPLOAD_TIMEOUT = 300
+POLL_INITIAL_DELAY = 0.5
+POLL_MAX_DELAY = 8.0
+
+# Версия извлекателя текста входит в ключ кэша: при изменении логики извлечения
+# её нужно увеличить, чтобы старые записи перестали использоваться
+EXTRACTOR_VERSION = 3
+EXTRACTION_MEMORY_BYTES = 64 * 1024 * 1024
+
+# Готовые DOCX-файлы отчётов в памяти процесса
+EXPORT_MEMORY_BYTES = 32 * 1024 * 1024
+
+# Как часто страница опрашивает состояние фоновой задачи
+JOB_POLL_SECONDS = 1.0
+
 
 def get_api_key():
     """Получает API-ключ из .env или st.secrets."""
@@ -21,88 +72,339 @@ def get_api_key():
     return key
 
 
+def _genai():
+    """google.generativeai импортируется при первом обращении: сам импорт занимает около секунды."""
+    import google.generativeai as genai
+    return genai
+
+
+@st.cache_resource
+def _configure_client(key):
+    _genai().configure(api_key=key)
+
+
 def configure_genai():
-    """Настраивает Gemini API."""
+    """Настраивает Gemini API (один раз на процесс для каждого ключа)."""
     key = get_api_key()
     if not key:
         st.error("API-ключ не найден. Создайте файл .env с GOOGLE_API_KEY=ваш_ключ")
         st.stop()
-    genai.configure(api_key=key)
+    _configure_client(key)
+
+
+@st.cache_resource
+def _generative_model(model_name):
+    """Общий для процесса объект модели: обёртки ниже дешёвые, а он — нет."""
+    return _genai().GenerativeModel(model_name)
+
+
+@st.cache_resource
+def get_response_cache():
+    """Возвращает общий для процесса кэш ответов модели."""
+    return ResponseCache()
 
 
-def get_model():
-    """Возвращает модель Gemini."""
+def get_model(module=None, use_cache=True, prefix_cache=None):
+    """Возвращает модель Gemini.
+
+    Для модулей из LLM_CACHE_MODULES модель обёрнута кэшем ответов;
+    use_cache=False или LLM_CACHE_BYPASS=1 отключают кэш. Запросы, дошедшие
+    до Gemini, проходят общую очередь с квотами и повторами (ratelimit) и
+    записываются в телеметрию. С prefix_cache (open_prefix_cache) модель
+    работает поверх кэша контекста: промпты строятся через prefix_cache.contents.
+    """
     configure_genai()
-    return genai.GenerativeModel('models/gemini-2.5-flash')
+    raw, cache_name = _generative_model(MODEL_NAME), MODEL_NAME
+    if prefix_cache is not None and prefix_cache.active:
+        raw, cache_name = prefix_cache.model, f"{MODEL_NAME}@{prefix_cache.key}"
+    model = InstrumentedModel(
+        LimitedModel(raw, MODULE_PRIORITIES.get(module)), MODULE_TITLES.get(module), MODEL_NAME
+    )
+    if use_cache and not LLM_CACHE_BYPASS and module in LLM_CACHE_MODULES:
+        return CachedModel(model, get_response_cache(), module, cache_name)
+    return model
+
+
+def open_prefix_cache(prefix, module=None):
+    """Регистрирует неизменное начало промптов в кэше контекста Gemini (см. PrefixCache)."""
+    configure_genai()
+    cache = PrefixCache(
+        _genai(), MODEL_NAME, prefix, MODULE_TITLES.get(module), MODULE_PRIORITIES.get(module)
+    )
+    cache.open()
+    return cache
+
+
+def stream_response(model, contents, **kwargs):
+    """Отдаёт текст ответа модели по частям по мере генерации.
+
+    Кнопка «Остановить ответ» прерывает его перезапуском скрипта Streamlit:
+    вместе со скриптом останавливается и генератор.
+    """
+    response = model.generate_content(contents, stream=True, **kwargs)
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Фрагмент без текста (например, только метаданные)
+            continue
+        if text:
+            yield text
+
+
+def render_stream(model, contents, container=None, **kwargs):
+    """Показывает ответ модели по мере генерации и возвращает итоговый текст."""
+    target = container if container is not None else st
+    result = target.write_stream(stream_response(model, contents, **kwargs))
+    return result if isinstance(result, str) else "".join(str(part) for part in result)
+
+
+def _file_bytes(uploaded_file):
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    uploaded_file.seek(0)
+    return uploaded_file.read()
 
 
 def extract_text_from_file(uploaded_file):
-    """Извлекает текст из PDF, DOCX или TXT файла."""
+    """Извлекает текст из PDF, DOCX (включая таблицы) или TXT файла.
+
+    При пустом, повреждённом или слишком большом файле бросает ExtractionError.
+    """
     if uploaded_file is None:
         return ""
+    return chunks_to_text(iter_chunks(uploaded_file.name, _file_bytes(uploaded_file)))
 
-    text = ""
-    try:
-        name = uploaded_file.name.lower()
-        if name.endswith('.pdf'):
-            reader = PyPDF2.PdfReader(uploaded_file)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        elif name.endswith('.docx'):
-            doc = Document(uploaded_file)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-        elif name.endswith('.txt'):
-            text = uploaded_file.read().decode("utf-8")
-
-        if not text.strip():
-            return "Файл пуст или не удалось извлечь текст."
-    except Exception as e:
-        return f"Ошибка при чтении файла: {e}"
-    return text
+
+@st.cache_resource
+def get_extraction_cache():
+    """Возвращает общий для процесса кэш извлечённого текста."""
+    return TieredCache(LRUCache(EXTRACTION_MEMORY_BYTES), SQLiteCache("extracted_text"))
+
+
+def _extraction_key(name, data):
+    ext = os.path.splitext(name.lower())[1]
+    return f"v{EXTRACTOR_VERSION}:{ext}:{content_hash(data)}"
+
+
+def extract_chunks_cached(uploaded_files):
+    """Извлекает фрагменты из загруженных файлов, разбирая только новое содержимое.
+
+    Возвращает список той же длины: list[Chunk] или ExtractionError для каждого файла.
+    """
+    cache = get_extraction_cache()
+    results = [None] * len(uploaded_files)
+    misses = []
+    for i, f in enumerate(uploaded_files):
+        data = _file_bytes(f)
+        key = _extraction_key(f.name, data)
+        cached = cache.get(key)
+        if cached is not None:
+            results[i] = [Chunk(f.name, *item) for item in json.loads(cached)]
+        else:
+            misses.append((i, key, f.name, data))
+
+    extracted = extract_many([(name, data) for _, _, name, data in misses])
+    for (i, key, _, _), result in zip(misses, extracted):
+        if not isinstance(result, ExtractionError):
+            cache.set(key, json.dumps(
+                [[c.kind, c.index, c.offset, c.text] for c in result], ensure_ascii=False
+            ))
+        results[i] = result
+    return results
+
+
+def extract_text_cached(uploaded_file):
+    """Как extract_text_from_file, но повторно не разбирает уже виденное содержимое."""
+    if uploaded_file is None:
+        return ""
+    result = extract_chunks_cached([uploaded_file])[0]
+    if isinstance(result, ExtractionError):
+        raise result
+    return chunks_to_text(result)
+
+
+@st.cache_resource
+def get_export_cache():
+    """Возвращает общий для процесса кэш готовых DOCX-файлов."""
+    return LRUCache(EXPORT_MEMORY_BYTES)
+
+
+def docx_bytes(content, title="Документ", cache=None):
+    """Собирает DOCX из markdown; один и тот же текст повторно не собирается."""
+    cache = cache if cache is not None else get_export_cache()
+    key = f"docx:v{EXPORT_VERSION}:{content_hash(title)}:{content_hash(content)}"
+    data = cache.get(key)
+    if data is None:
+        data = markdown_to_docx(content, title)
+        cache.set(key, data)
+    return data
 
 
 def create_docx(content, title="Документ"):
     """Создаёт DOCX-файл в памяти и возвращает буфер."""
-    doc = Document()
-    doc.add_heading(title, 0)
-    doc.add_paragraph(content)
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    return io.BytesIO(docx_bytes(content, title))
+
+
+def docx_download_button(label, content, title, file_name, key=None):
+    """Кнопка скачивания DOCX: файл собирается только по нажатию, а не при каждом перезапуске."""
+    cache = get_export_cache()
+    return st.download_button(
+        label, lambda: docx_bytes(content, title, cache), file_name,
+        mime=DOCX_MIME, key=key, on_click="ignore", use_container_width=True
+    )
+
+
+def export_cases_zip(case_ids):
+    """Пишет выбранные дела в zip во временный файл и возвращает его, открытый на чтение."""
+    out = tempfile.TemporaryFile()
+    write_cases_zip(iter_cases(case_ids), out)
+    out.seek(0)
+    return out
+
+
+def transcribe_audio(audio_bytes, module="Общее"):
+    """Транскрибирует аудио через Gemini (после локальной подготовки записи).
 
+    Готовые расшифровки берутся из базы по хэшу записи, поэтому одна и та же
+    запись не распознаётся повторно ни после перезапуска, ни в другом модуле.
+    """
+    data = bytes(audio_bytes.getbuffer())
+    audio_hash = content_hash(data)
+    cached = get_transcript(audio_hash, TRANSCRIBE_PROMPT_VERSION)
+    if cached is not None:
+        return cached
 
-def transcribe_audio(audio_bytes):
-    """Транскрибирует аудио через Gemini."""
     model = get_model()
-    temp_name = f"voice_{int(time.time())}.wav"
+    spool, session_id = get_spool(), current_session_id()
+    name = getattr(audio_bytes, "name", "voice.wav")
+    prepared = None
+    # Файлы нужны до конца загрузки: на это время сессия не вытесняется
+    hold = f"transcribe:{audio_hash}"
+    spool.hold(session_id, hold)
     try:
-        with open(temp_name, "wb") as f:
-            f.write(audio_bytes.getbuffer())
-        upl = genai.upload_file(temp_name)
-        while upl.state.name == "PROCESSING":
-            time.sleep(0.5)
-        res = model.generate_content(["Транскрибируй текст аудио.", upl])
-        return res.text
+        with track("transcribe", module=module, model=MODEL_NAME):
+            spool.reserve(session_id, prepared_size(data, name))
+            prepared = preprocess_audio(
+                data, name, tmp_dir=spool.session_dir(session_id), prefix="voice_"
+            )
+            spool.add_files(session_id, prepared.paths)
+            if not prepared.paths:
+                return ""
+            handles, failed = upload_files_to_gemini(prepared.paths)
+            if failed:
+                raise next(iter(failed.values()))
+            res = model.generate_content([TRANSCRIBE_PROMPT, *handles])
+            text = res.text
+        if text.strip():
+            save_transcript(audio_hash, TRANSCRIBE_PROMPT_VERSION, module, text)
+        return text
     except Exception as e:
-        st.error(f"Ошибка при транскрибации: {e}")
+        st.error(f"Ошибка при транскрибации: {describe_error(e)}")
         return ""
     finally:
-        if os.path.exists(temp_name):
-            os.remove(temp_name)
+        spool.release(session_id, hold)
+        if prepared is not None:
+            spool.remove_files(session_id, prepared.paths)
 
 
-def upload_audio_to_gemini(file_path):
-    """Загружает аудиофайл в Gemini и возвращает объект файла."""
-    upl = genai.upload_file(file_path)
+def wait_for_file(upl, timeout=UPLOAD_TIMEOUT):
+    """Ждёт, пока Gemini обработает файл, опрашивая его состояние с растущей паузой."""
+    deadline = time.monotonic() + timeout
+    delay = POLL_INITIAL_DELAY
     while upl.state.name == "PROCESSING":
-        time.sleep(0.5)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Файл {upl.name} не обработан за {timeout} с")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX_DELAY)
+        upl = _genai().get_file(upl.name)
+    if upl.state.name == "FAILED":
+        raise RuntimeError(f"Gemini не смог обработать файл {upl.name}")
+    return upl
+
+
+def upload_audio_to_gemini(file_path, timeout=UPLOAD_TIMEOUT):
+    """Загружает аудиофайл в Gemini и возвращает объект файла."""
+    with track("upload") as call:
+        call.bytes_uploaded = os.path.getsize(file_path)
+        started = time.monotonic()
+        upl = get_limiter().call(_genai().upload_file, file_path)
+        call.upload_seconds = time.monotonic() - started
+        upl = wait_for_file(upl, timeout=timeout)
+        call.wait_seconds = time.monotonic() - started - call.upload_seconds
     return upl
 
 
+def upload_files_to_gemini(file_paths, max_workers=UPLOAD_WORKERS, timeout=UPLOAD_TIMEOUT):
+    """Загружает несколько файлов параллельно.
+
+    Возвращает (handles, failed): handles — объекты файлов в порядке путей
+    (None для неудачных), failed — словарь {путь: ошибка}.
+    """
+    handles = [None] * len(file_paths)
+    failed = {}
+    if not file_paths:
+        return handles, failed
+
+    workers = max(1, min(max_workers, len(file_paths)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Копия контекста на каждую загрузку: так телеметрия знает модуль и внешний замер
+        futures = {
+            pool.submit(contextvars.copy_context().run, upload_audio_to_gemini, path, timeout): i
+            for i, path in enumerate(file_paths)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                handles[i] = future.result()
+            except Exception as e:
+                failed[file_paths[i]] = e
+    return handles, failed
+
+
+@st.cache_resource
+def get_upload_registry():
+    """Возвращает общий для процесса реестр загрузок в Gemini."""
+    return UploadRegistry(upload_audio_to_gemini, batch_upload_fn=upload_files_to_gemini)
+
+
+@st.cache_resource
+def get_job_runner():
+    """Возвращает общий для процесса пул фоновых задач."""
+    return JobRunner()
+
+
+def follow_job(state_key):
+    """Следит за фоновой задачей, ID которой лежит в st.session_state[state_key].
+
+    Возвращает результат готовой задачи (и забывает её ID); пока задача идёт —
+    показывает ход работы и частичный текст и возвращает None.
+    """
+    job_id = st.session_state.get(state_key)
+    if job_id is None:
+        return None
+    job = get_job(job_id)
+    if job is None or job["status"] in ("done", "failed"):
+        del st.session_state[state_key]
+        if job is not None and job["status"] == "failed":
+            st.error(f"Ошибка при выполнении задачи: {job['error']}")
+        return job["result"] if job is not None and job["status"] == "done" else None
+    _render_job_progress(job_id)
+    return None
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _render_job_progress(job_id):
+    """Перерисовывается сама по таймеру; по завершении задачи перезапускает страницу."""
+    job = get_job(job_id)
+    if job is None or job["status"] in ("done", "failed"):
+        st.rerun()
+    st.progress(min(1.0, job["progress"]), text=job["message"] or "Задача выполняется...")
+    if job["partial"]:
+        st.markdown(job["partial"])
+
+
 def cleanup_temp_files(file_paths):
     """Удаляет временные файлы."""
     for f in file_paths: